@@ -8,8 +8,14 @@
 - 保持接口兼容（plan_trip方法不变）
 """
 
+import asyncio
 import json
-from typing import Dict, Any, List, Optional
+import time
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
+
+import numpy as np
 
 # LangChain框架
 from langchain.agents import AgentExecutor, create_openai_tools_agent
@@ -19,9 +25,17 @@ from langchain_core.messages import HumanMessage
 # 项目模块
 from ..services.llm_service import get_llm
 from ..services.mcp_tools import get_amap_tools
+from ..services.budget_service import compute_budget
+from ..services.itinerary_optimizer import group_into_days, nearest_index, order_day_attractions
+from ..services.cache_service import get_plan_cache, get_stage_cache, get_stage_cache_ttl, make_cache_key
 from ..models.schemas import TripRequest, TripPlan, DayPlan, Attraction, Meal, WeatherInfo, Location, Hotel
 from ..config import get_settings
 from ..utils.city_translator import translate_city_name
+from ..utils.json_stream import DayPlanStreamParser
+from ..utils.amap_parser import payload_error
+from ..utils.prompt_compaction import (
+    compact_stage_output, estimate_tokens, find_forecasts, load_json, merge_poi_results, parse_poi_table
+)
 
 # ============ Agent提示词 (英文版本) ============
 
@@ -32,6 +46,7 @@ You MUST use tools to search for attractions! Do not make up attraction informat
 
 **Tool Usage:**
 Use the amap_maps_text_search tool to search for POIs (points of interest) like attractions, restaurants, hotels, etc.
+When the user has more than one preference, use the amap_maps_multi_search tool ONCE with all keywords in a list instead of searching each keyword separately.
 
 **CRITICAL - City Name Translation:**
 - If the user provides an English city name (e.g., "Beijing", "Shanghai"), you MUST translate it to Chinese (e.g., "北京", "上海") when calling the tool
@@ -45,6 +60,9 @@ You should: Use the amap_maps_text_search tool with keywords="historical culture
 User: "Search for parks in Shanghai (use Chinese city name '上海' when calling the tool)"
 You should: Use the amap_maps_text_search tool with keywords="park" and city="上海"
 
+User: "Search for historical culture, food, natural scenery in Beijing (use Chinese city name '北京' when calling the tool)"
+You should: Use the amap_maps_multi_search tool with keywords=["历史文化", "美食", "自然风光"] and city="北京"
+
 **Notes:**
 1. You MUST use tools, do not answer directly
 2. Always use the tool to get real data
@@ -196,14 +214,7 @@ Please strictly follow the following JSON format to return the travel plan:
       "wind_power": "1-3 level"
     }}
   ],
-  "overall_suggestions": "Overall suggestions",
-  "budget": {{
-    "total_attractions": 180,
-    "total_hotels": 1200,
-    "total_meals": 480,
-    "total_transportation": 200,
-    "total": 2060
-  }}
+  "overall_suggestions": "Overall suggestions"
 }}
 ```
 
@@ -215,11 +226,10 @@ Please strictly follow the following JSON format to return the travel plan:
 5. Consider the distance between attractions and visiting time
 6. Each day must include breakfast, lunch, and dinner
 7. Provide practical travel suggestions (in English)
-8. **Must include budget information**:
+8. **Must include cost information** (totals are calculated automatically, do not output a budget summary):
    - Attraction ticket prices (ticket_price)
    - Meal estimated costs (estimated_cost)
    - Hotel estimated costs (estimated_cost)
-   - Budget summary (budget) including total costs for each category
 9. **Translation Guidelines**:
    - Use well-known English names for famous attractions (e.g., "Forbidden City" for "故宫")
    - Translate hotel names accurately (keep brand names, translate location names)
@@ -228,6 +238,147 @@ Please strictly follow the following JSON format to return the travel plan:
    - Wind directions: "北"->"North", "南"->"South", "东"->"East", "西"->"West"
 """
 
+ALLOCATION_AGENT_PROMPT = """You are a trip planning coordinator. Your task is to split the available attractions and hotels across the days of a trip.
+
+Return ONLY a JSON object in the following format, with no other text:
+```json
+{{
+  "days": [
+    {{
+      "day_index": 0,
+      "theme": "Short theme of the day",
+      "attractions": ["Attraction name as given in the input", "Attraction name as given in the input"],
+      "hotel": "Hotel name as given in the input"
+    }}
+  ],
+  "overall_suggestions": "Overall suggestions for the whole trip (in English)"
+}}
+```
+
+**Rules:**
+1. Create exactly one entry per travel day, with day_index starting at 0
+2. Assign 2-3 attractions per day and do not repeat an attraction
+3. Group attractions that are close to each other on the same day
+4. Copy attraction and hotel names exactly as they appear in the input
+5. Keep the output short - only names, no descriptions
+"""
+
+DAY_PLANNER_AGENT_PROMPT = """You are a trip planning expert. Your task is to write the detailed plan for ONE day of a trip. The attractions and hotel for the day have already been chosen.
+
+**CRITICAL - Language Requirement:**
+- ALL output must be in ENGLISH ONLY - translate all Chinese names, addresses and weather descriptions
+- Use well-known English names for famous attractions (e.g., "故宫" -> "Forbidden City")
+
+Return ONLY a JSON object in the following format:
+```json
+{{
+  "day": {{
+    "date": "YYYY-MM-DD",
+    "day_index": 0,
+    "description": "Itinerary overview of the day",
+    "transportation": "Transportation method",
+    "accommodation": "Accommodation type",
+    "hotel": {{
+      "name": "Hotel Name",
+      "address": "Hotel Address",
+      "location": {{"longitude": 116.397128, "latitude": 39.916527}},
+      "price_range": "300-500 CNY",
+      "rating": "4.5",
+      "distance": "2 km from attractions",
+      "type": "Budget Hotel",
+      "estimated_cost": 400
+    }},
+    "attractions": [
+      {{
+        "name": "Attraction Name",
+        "address": "Detailed Address",
+        "location": {{"longitude": 116.397128, "latitude": 39.916527}},
+        "visit_duration": 120,
+        "description": "Detailed attraction description",
+        "category": "Attraction Category",
+        "ticket_price": 60
+      }}
+    ],
+    "meals": [
+      {{"type": "breakfast", "name": "Breakfast Recommendation", "description": "Breakfast description", "estimated_cost": 30}},
+      {{"type": "lunch", "name": "Lunch Recommendation", "description": "Lunch description", "estimated_cost": 50}},
+      {{"type": "dinner", "name": "Dinner Recommendation", "description": "Dinner description", "estimated_cost": 80}}
+    ]
+  }},
+  "weather": {{
+    "date": "YYYY-MM-DD",
+    "day_weather": "Sunny",
+    "night_weather": "Cloudy",
+    "day_temp": 25,
+    "night_temp": 15,
+    "wind_direction": "South",
+    "wind_power": "1-3 level"
+  }}
+}}
+```
+
+**Important Notes:**
+1. Use exactly the assigned attractions and hotel, in the given order
+2. Attraction coordinates must be accurate and real
+3. The day must include breakfast, lunch, and dinner
+4. Temperature must be a pure number; set "weather" to null if no forecast is available for the date
+"""
+
+# 检索阶段（景点/天气/酒店互不依赖，可以并发执行）
+RETRIEVAL_STAGES = ("attractions", "weather", "hotels")
+
+STAGE_LABELS = {
+    "attractions": "📍 Searching for attractions",
+    "weather": "🌤️  Querying weather",
+    "hotels": "🏨 Searching for hotels",
+}
+
+# 计划缓存键版本号：修改提示词或输出格式时递增，使旧缓存失效
+PLAN_CACHE_VERSION = 1
+
+
+class StageUnavailableNote(str):
+    """
+    检索阶段失败（超时、异常、错误结果）时代替阶段输出的说明文本
+
+    本身就是提示词中的一段文字；类型用来标记该阶段降级，
+    这样的计划中景点/酒店可能由LLM自行推荐，不写入计划缓存
+    """
+
+    def __new__(cls, text: str, stage: str, reason: str):
+        note = super().__new__(cls, text)
+        note.stage = stage
+        note.reason = reason
+        return note
+
+
+def degraded_stages(stage_results: Dict[str, str]) -> List[str]:
+    """使用了StageUnavailableNote的检索阶段"""
+    return [stage for stage, output in stage_results.items() if isinstance(output, StageUnavailableNote)]
+
+
+def canonicalize_trip_request(request: TripRequest) -> Dict[str, Any]:
+    """
+    生成旅行请求的规范形式，作为计划缓存键
+
+    语义相同的请求得到相同的结果：城市名统一翻译为中文，偏好去重排序，
+    文本字段去除首尾空白并压缩连续空白
+    """
+    def normalize(text: Optional[str]) -> str:
+        return " ".join((text or "").split())
+
+    return {
+        "version": PLAN_CACHE_VERSION,
+        "city": translate_city_name(normalize(request.city)),
+        "start_date": request.start_date.strip(),
+        "end_date": request.end_date.strip(),
+        "travel_days": request.travel_days,
+        "transportation": normalize(request.transportation),
+        "accommodation": normalize(request.accommodation),
+        "preferences": sorted({normalize(p) for p in request.preferences if normalize(p)}),
+        "free_text_input": normalize(request.free_text_input),
+    }
+
 
 class MultiAgentTripPlanner:
     """多智能体旅行规划系统"""
@@ -278,11 +429,23 @@ class MultiAgentTripPlanner:
                 agent_name="Trip Planning Expert"
             )
 
+            # Sharded planning: a cheap allocation step plus one call per day
+            print("  - Creating allocation and day planning Agents (sharded planner mode)...")
+            self.allocation_agent = self._create_llm_chain_agent(
+                system_prompt=ALLOCATION_AGENT_PROMPT,
+                agent_name="Itinerary Allocation Expert"
+            )
+            self.day_planner_agent = self._create_llm_chain_agent(
+                system_prompt=DAY_PLANNER_AGENT_PROMPT,
+                agent_name="Day Planning Expert"
+            )
+
             print(f"✅ Multi-agent system initialized successfully (all using LangChain version)")
             print(f"   Attraction search Agent: LangChain version ({len(self.amap_tools)} tools)")
             print(f"   Weather query Agent: LangChain version ({len(self.amap_tools)} tools)")
             print(f"   Hotel recommendation Agent: LangChain version ({len(self.amap_tools)} tools)")
             print(f"   Trip planning Agent: LangChain version (0 tools)")
+            print(f"   Pipeline mode: {settings.agent_pipeline_mode}, execution mode: {settings.agent_execution_mode}, planner mode: {settings.planner_mode}")
 
         except Exception as e:
             print(f"❌ Multi-agent system initialization failed: {str(e)}")
@@ -332,7 +495,8 @@ class MultiAgentTripPlanner:
             verbose=True,
             handle_parsing_errors=True,
             max_iterations=3,  # 限制最多3次迭代，避免过多LLM调用
-            max_execution_time=30  # 限制最多30秒执行时间
+            max_execution_time=30,  # 限制最多30秒执行时间
+            return_intermediate_steps=True  # 保留工具调用结果，供检索阶段使用
         )
         
         # 包装AgentExecutor，添加run方法以保持接口兼容
@@ -350,15 +514,49 @@ class MultiAgentTripPlanner:
                 """
                 try:
                     result = self.executor.invoke({"input": query})
-                    # 提取输出内容
-                    if isinstance(result, dict) and "output" in result:
-                        return result["output"]
-                    elif isinstance(result, str):
-                        return result
-                    else:
-                        return str(result)
+                    return self._extract_output(result)
+                except Exception as e:
+                    return f"Error: {str(e)}"
+
+            async def arun(self, query: str) -> str:
+                """异步运行Agent（基于ainvoke，不阻塞事件循环）"""
+                try:
+                    result = await self.executor.ainvoke({"input": query})
+                    return self._extract_output(result)
                 except Exception as e:
                     return f"Error: {str(e)}"
+
+            def run_with_observations(self, query: str) -> Tuple[str, List[str]]:
+                """运行Agent，同时返回各次工具调用的原始结果（intermediate_steps中的observation）"""
+                try:
+                    result = self.executor.invoke({"input": query})
+                    return self._extract_output(result), self._extract_observations(result)
+                except Exception as e:
+                    return f"Error: {str(e)}", []
+
+            async def arun_with_observations(self, query: str) -> Tuple[str, List[str]]:
+                """run_with_observations的异步版本"""
+                try:
+                    result = await self.executor.ainvoke({"input": query})
+                    return self._extract_output(result), self._extract_observations(result)
+                except Exception as e:
+                    return f"Error: {str(e)}", []
+
+            @staticmethod
+            def _extract_observations(result) -> List[str]:
+                """提取工具调用结果"""
+                steps = result.get("intermediate_steps") if isinstance(result, dict) else None
+                return [str(observation) for _, observation in steps or []]
+
+            @staticmethod
+            def _extract_output(result) -> str:
+                """提取输出内容"""
+                if isinstance(result, dict) and "output" in result:
+                    return result["output"]
+                elif isinstance(result, str):
+                    return result
+                else:
+                    return str(result)
             
             def list_tools(self) -> List:
                 """列出可用工具（兼容方法）"""
@@ -406,17 +604,36 @@ class MultiAgentTripPlanner:
                 try:
                     # 使用invoke方法调用chain
                     result = self.chain.invoke({"input": query})
-                    # 结果可能是AIMessage对象，需要提取content
-                    if hasattr(result, 'content'):
-                        return result.content
-                    elif isinstance(result, dict) and "text" in result:
-                        return result["text"]
-                    elif isinstance(result, str):
-                        return result
-                    else:
-                        return str(result)
+                    return self._extract_content(result)
+                except Exception as e:
+                    return f"Error: {str(e)}"
+
+            async def arun(self, query: str) -> str:
+                """异步运行LLM Chain（基于ainvoke，不阻塞事件循环）"""
+                try:
+                    result = await self.chain.ainvoke({"input": query})
+                    return self._extract_content(result)
                 except Exception as e:
                     return f"Error: {str(e)}"
+
+            async def astream(self, query: str) -> AsyncIterator[str]:
+                """流式运行LLM Chain，逐块返回文本"""
+                async for chunk in self.chain.astream({"input": query}):
+                    text = self._extract_content(chunk)
+                    if text:
+                        yield text
+
+            @staticmethod
+            def _extract_content(result) -> str:
+                """结果可能是AIMessage对象，需要提取content"""
+                if hasattr(result, 'content'):
+                    return result.content
+                elif isinstance(result, dict) and "text" in result:
+                    return result["text"]
+                elif isinstance(result, str):
+                    return result
+                else:
+                    return str(result)
         
         return LLMChainWrapper(chain, agent_name)
     
@@ -430,66 +647,80 @@ class MultiAgentTripPlanner:
         Returns:
             旅行计划
         """
+        cached_plan = self._get_cached_plan(request)
+        if cached_plan is not None:
+            return cached_plan
+
         try:
-            print(f"\n{'='*60}")
-            print(f"🚀 Starting multi-agent collaborative trip planning...")
-            print(f"Destination: {request.city}")
-            print(f"Dates: {request.start_date} to {request.end_date}")
-            print(f"Days: {request.travel_days} days")
-            print(f"Preferences: {', '.join(request.preferences) if request.preferences else 'None'}")
-            print(f"{'='*60}\n")
-
-            # Step 1: Attraction search Agent searches for attractions
-            print("📍 Step 1: Searching for attractions...")
-            # Translate city name to Chinese for MCP tool compatibility
-            chinese_city = translate_city_name(request.city)
-            print(f"   🔄 City name translation: {request.city} -> {chinese_city}")
-            attraction_query = self._build_attraction_query(request)
-            # Update query to explicitly use Chinese city name for tool calls
-            attraction_query = attraction_query.replace(
-                f"in {request.city}",
-                f"in {request.city} (use Chinese city name '{chinese_city}' when calling the tool)"
-            )
-            attraction_response = self.attraction_agent.run(attraction_query)
-            print(f"Attraction search result: {attraction_response[:200]}...\n")
-
-            # Step 2: Weather query Agent queries weather
-            print("🌤️  Step 2: Querying weather...")
-            # Translate city name to Chinese for weather API (requires Chinese city names)
-            chinese_city = translate_city_name(request.city)
-            weather_query = f"Get weather information for {chinese_city} (city name: {chinese_city}). Please use the amap_maps_weather tool with city='{chinese_city}'."
-            weather_response = self.weather_agent.run(weather_query)
-            print(f"Weather query result: {weather_response[:200]}...\n")
-
-            # Step 3: Hotel recommendation Agent searches for hotels
-            print("🏨 Step 3: Searching for hotels...")
-            # Translate city name to Chinese for MCP tool compatibility
-            chinese_city = translate_city_name(request.city)
-            hotel_query = f"Search for {request.accommodation} hotels in {chinese_city} (city name: {chinese_city}). Please use the amap_maps_text_search tool with keywords='hotel' and city='{chinese_city}'."
-            hotel_response = self.hotel_agent.run(hotel_query)
-            print(f"Hotel search result: {hotel_response[:200]}...\n")
+            self._print_trip_header(request)
+
+            # Steps 1-3: Retrieval Agents search attractions, weather and hotels
+            stage_results = self._run_retrieval_stages(request)
+            attraction_response = stage_results["attractions"]
+            weather_response = stage_results["weather"]
+            hotel_response = stage_results["hotels"]
 
             # Step 4: Trip planning Agent integrates information to generate plan
             print("📋 Step 4: Generating trip plan...")
-            planner_query = self._build_planner_query(request, attraction_response, weather_response, hotel_response)
-            planner_response = self.planner_agent.run(planner_query)
-            print(f"Trip planning result: {planner_response[:300]}...\n")
+            result = None
+            if self._use_sharded_planner(request):
+                result = self._plan_sharded(request, stage_results)
+            if result is None:
+                planner_query = self._build_planner_query(request, attraction_response, weather_response, hotel_response)
+                planner_response = self.planner_agent.run(planner_query)
+                print(f"Trip planning result: {planner_response[:300]}...\n")
+                result = self._finish_plan(planner_response, request, self._needs_reorder(request, stage_results))
+
+            trip_plan, parsed = result
+            if parsed:
+                self._cache_plan(request, trip_plan, stage_results)
+            return trip_plan
 
-            # Parse final plan
-            print(f"🔍 Starting to parse response, response length: {len(planner_response)} characters")
-            trip_plan = self._parse_response(planner_response, request)
-            
-            # Debug: Print parsing results
-            print(f"🔍 Parsing results:")
-            print(f"   city: {trip_plan.city}")
-            print(f"   days count: {len(trip_plan.days)}")
-            print(f"   weather_info count: {len(trip_plan.weather_info)}")
-            print(f"   overall_suggestions: {trip_plan.overall_suggestions[:100] if trip_plan.overall_suggestions else 'None'}...")
+        except Exception as e:
+            print(f"❌ Trip plan generation failed: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return self._create_fallback_plan(request)
+    
+    async def aplan_trip(self, request: TripRequest) -> TripPlan:
+        """
+        plan_trip的异步版本
 
-            print(f"{'='*60}")
-            print(f"✅ Trip plan generation completed!")
-            print(f"{'='*60}\n")
+        所有LLM调用通过ainvoke执行，工具调用走异步_arun，
+        不会阻塞FastAPI事件循环，单个worker可以同时处理多个规划请求
+
+        Args:
+            request: 旅行请求
 
+        Returns:
+            旅行计划
+        """
+        cached_plan = self._get_cached_plan(request)
+        if cached_plan is not None:
+            return cached_plan
+
+        try:
+            self._print_trip_header(request)
+
+            # Steps 1-3: Retrieval Agents search attractions, weather and hotels
+            stage_results = await self._arun_retrieval_stages(request)
+
+            # Step 4: Trip planning Agent integrates information to generate plan
+            print("📋 Step 4: Generating trip plan...")
+            result = None
+            if self._use_sharded_planner(request):
+                result = await self._aplan_sharded(request, stage_results)
+            if result is None:
+                planner_query = self._build_planner_query(
+                    request, stage_results["attractions"], stage_results["weather"], stage_results["hotels"]
+                )
+                planner_response = await self.planner_agent.arun(planner_query)
+                print(f"Trip planning result: {planner_response[:300]}...\n")
+                result = self._finish_plan(planner_response, request, self._needs_reorder(request, stage_results))
+
+            trip_plan, parsed = result
+            if parsed:
+                self._cache_plan(request, trip_plan, stage_results)
             return trip_plan
 
         except Exception as e:
@@ -497,7 +728,818 @@ class MultiAgentTripPlanner:
             import traceback
             traceback.print_exc()
             return self._create_fallback_plan(request)
-    
+
+    async def astream_trip(self, request: TripRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式生成旅行计划
+
+        按完成顺序产出事件，客户端无需等待整个流水线结束：
+        - ("stage", {"stage": ..., "status": "completed"|"started"}) 检索阶段完成/规划阶段开始
+        - ("day", DayPlan字典) 规划Agent的输出中每解析出一天就立即产出
+        - ("plan", TripPlan字典) 最终完整计划
+        - ("error", {"message": ...}) 出现错误（随后仍会产出备用计划）
+
+        Args:
+            request: 旅行请求
+        """
+        cached_plan = self._get_cached_plan(request)
+        if cached_plan is not None:
+            for day in cached_plan.days:
+                yield "day", day.model_dump()
+            yield "plan", cached_plan.model_dump()
+            return
+
+        try:
+            self._print_trip_header(request)
+
+            # Steps 1-3: emit each retrieval stage as soon as it finishes
+            stage_results = {}
+            if get_settings().agent_execution_mode == "concurrent":
+                tasks = {
+                    asyncio.ensure_future(self._arun_stage_checked(stage, request)): stage
+                    for stage in RETRIEVAL_STAGES
+                }
+                pending = set(tasks)
+                try:
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            stage_results[tasks[task]] = task.result()
+                            yield "stage", {"stage": tasks[task], "status": "completed"}
+                finally:
+                    # 客户端断开时取消尚未完成的阶段
+                    for task in pending:
+                        task.cancel()
+            else:
+                for stage in RETRIEVAL_STAGES:
+                    stage_results[stage] = await self._arun_stage_checked(stage, request)
+                    yield "stage", {"stage": stage, "status": "completed"}
+
+            # Step 4: stream the planner output and emit days as they are parsed
+            print("📋 Step 4: Generating trip plan (streaming)...")
+            yield "stage", {"stage": "planner", "status": "started"}
+
+            allocation = None
+            if self._use_sharded_planner(request):
+                allocation = await self._aallocate_days(request, stage_results)
+            if allocation is not None:
+                # Sharded mode: emit each day as soon as its own LLM call finishes
+                day_results = {}
+                tasks = self._aplan_day_tasks(request, stage_results, allocation)
+                try:
+                    for next_done in asyncio.as_completed(tasks):
+                        day_index, day_result = await next_done
+                        day_results[day_index] = day_result
+                        if day_result is not None:
+                            yield "day", day_result[0].model_dump()
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                trip_plan, parsed = self._merge_sharded_plan(request, allocation, day_results)
+                # 生成失败的天由备用计划补齐，同样作为day事件发出，逐日视图不会缺天
+                for day_index in range(request.travel_days):
+                    if day_results.get(day_index) is None:
+                        yield "day", trip_plan.days[day_index].model_dump()
+                if parsed:
+                    self._cache_plan(request, trip_plan, stage_results)
+                yield "plan", trip_plan.model_dump()
+                return
+
+            planner_query = self._build_planner_query(
+                request, stage_results["attractions"], stage_results["weather"], stage_results["hotels"]
+            )
+            # 流式产出的每一天与最终计划使用相同的景点顺序
+            reorder = self._needs_reorder(request, stage_results)
+            parser = DayPlanStreamParser()
+            chunks = []
+            async for chunk in self.planner_agent.astream(planner_query):
+                chunks.append(chunk)
+                for day_data in parser.feed(chunk):
+                    try:
+                        day = DayPlan(**day_data)
+                    except Exception as e:
+                        print(f"⚠️  Skipping unparsable streamed day: {str(e)}")
+                        continue
+                    if reorder:
+                        order_day_attractions(day)
+                    yield "day", day.model_dump()
+
+            trip_plan, parsed = self._finish_plan("".join(chunks), request, reorder)
+            if parsed:
+                self._cache_plan(request, trip_plan, stage_results)
+            yield "plan", trip_plan.model_dump()
+
+        except Exception as e:
+            print(f"❌ Trip plan streaming failed: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield "error", {"message": str(e)}
+            yield "plan", self._create_fallback_plan(request).model_dump()
+
+    def _use_sharded_planner(self, request: TripRequest) -> bool:
+        """是否使用分片规划（settings.planner_mode: single/sharded/auto）"""
+        settings = get_settings()
+        if settings.planner_mode == "sharded":
+            return True
+        if settings.planner_mode == "auto":
+            return request.travel_days >= settings.planner_shard_min_days
+        return False
+
+    def _plan_sharded(self, request: TripRequest, stage_results: Dict[str, str]) -> Optional[Tuple[TripPlan, bool]]:
+        """
+        分片规划：先把景点和酒店分配到每天，再并发生成每天的行程
+
+        单次LLM调用生成完整多日JSON时，输出token随天数线性增长；
+        分片后每次调用只输出一天，延迟与旅行天数基本无关
+
+        Returns:
+            (旅行计划, 是否所有天都生成成功)；分配步骤失败时返回None，由调用方改用单次规划
+        """
+        allocation = self._allocate_days(request, stage_results)
+        if allocation is None:
+            return None
+
+        print(f"⚡ Generating {request.travel_days} day plans concurrently...")
+        workers = max(1, min(request.travel_days, get_settings().planner_shard_concurrency))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="trip-day") as executor:
+            outputs = executor.map(
+                lambda day_index: self._plan_day(request, stage_results, allocation, day_index),
+                range(request.travel_days)
+            )
+            day_results = dict(outputs)
+        return self._merge_sharded_plan(request, allocation, day_results)
+
+    async def _aplan_sharded(self, request: TripRequest, stage_results: Dict[str, str]) -> Optional[Tuple[TripPlan, bool]]:
+        """_plan_sharded的异步版本"""
+        allocation = await self._aallocate_days(request, stage_results)
+        if allocation is None:
+            return None
+
+        print(f"⚡ Generating {request.travel_days} day plans concurrently...")
+        tasks = self._aplan_day_tasks(request, stage_results, allocation)
+        try:
+            outputs = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self._merge_sharded_plan(request, allocation, dict(outputs))
+
+    def _aplan_day_tasks(
+        self,
+        request: TripRequest,
+        stage_results: Dict[str, str],
+        allocation: Dict[str, Any]
+    ) -> List[asyncio.Task]:
+        """
+        每天一个单日规划任务
+
+        同时进行的LLM调用数不超过settings.planner_shard_concurrency（与同步版本的线程池大小相同），
+        长行程不会一次发出几十个请求
+        """
+        semaphore = asyncio.Semaphore(max(1, get_settings().planner_shard_concurrency))
+
+        async def plan_day(day_index: int):
+            async with semaphore:
+                return await self._aplan_day(request, stage_results, allocation, day_index)
+
+        return [asyncio.ensure_future(plan_day(day_index)) for day_index in range(request.travel_days)]
+
+    def _allocate_days(self, request: TripRequest, stage_results: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """分配步骤：优先用本地地理优化器，候选景点坐标不足时用一次输出很短的LLM调用"""
+        print("🗂️  Allocating attractions and hotels to days...")
+        allocation = self._local_allocation(request, stage_results)
+        if allocation is not None:
+            return allocation
+        response = self.allocation_agent.run(self._build_allocation_query(request, stage_results))
+        return self._parse_allocation(response, request)
+
+    async def _aallocate_days(self, request: TripRequest, stage_results: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """_allocate_days的异步版本"""
+        print("🗂️  Allocating attractions and hotels to days...")
+        allocation = self._local_allocation(request, stage_results)
+        if allocation is not None:
+            return allocation
+        response = await self.allocation_agent.arun(self._build_allocation_query(request, stage_results))
+        return self._parse_allocation(response, request)
+
+    def _local_allocation(self, request: TripRequest, stage_results: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        用坐标在本地分配景点：均衡聚类成travel_days组，每组按最短路线排序
+
+        整个行程使用离所有选中景点中心最近的一家酒店。
+        检索结果不是POI表（如agent模式的文字回答）或有坐标的景点少于天数时返回None
+
+        Returns:
+            与_parse_allocation相同结构的分配结果，另有"ordered": True表示每天的游览顺序已确定
+        """
+        settings = get_settings()
+        if not settings.itinerary_optimizer_enabled:
+            return None
+        pois = parse_poi_table(stage_results.get("attractions", ""))
+        pois = pois[:request.travel_days * settings.itinerary_attractions_per_day]
+        if len(pois) < request.travel_days:
+            return None
+
+        coords = np.array([[poi["longitude"], poi["latitude"]] for poi in pois])
+        groups = group_into_days(coords, request.travel_days)
+
+        hotel_name = ""
+        hotels = parse_poi_table(stage_results.get("hotels", ""))
+        if hotels:
+            hotel_coords = np.array([[hotel["longitude"], hotel["latitude"]] for hotel in hotels])
+            hotel_name = hotels[nearest_index(coords.mean(axis=0), hotel_coords)]["name"]
+
+        days = {
+            day_index: {
+                "day_index": day_index,
+                "theme": "",
+                "attractions": [pois[i]["name"] for i in group],
+                "hotel": hotel_name,
+            }
+            for day_index, group in enumerate(groups)
+        }
+        print(f"   📍 Local optimizer grouped {len(pois)} attractions into {request.travel_days} days")
+        return {"days": days, "overall_suggestions": "", "ordered": True}
+
+    def _format_allocation(self, allocation: Dict[str, Any]) -> str:
+        """把分配结果写成提示词中的每日路线"""
+        lines = []
+        for day_index in sorted(allocation["days"]):
+            day = allocation["days"][day_index]
+            line = f"- Day {day_index + 1}: " + " -> ".join(day["attractions"])
+            if day.get("hotel"):
+                line += f" (hotel: {day['hotel']})"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def _build_allocation_query(self, request: TripRequest, stage_results: Dict[str, str]) -> str:
+        """构建分配步骤的查询"""
+        preferences_str = ', '.join(request.preferences) if request.preferences else 'none'
+        return f"""Split the following attractions and hotels across a {request.travel_days}-day trip to {request.city}.
+
+**Basic Information:**
+- Days: {request.travel_days}
+- Transportation: {request.transportation}
+- Accommodation: {request.accommodation}
+- Preferences: {preferences_str}
+
+**Attraction Information:**
+{stage_results["attractions"]}
+
+**Hotel Information:**
+{stage_results["hotels"]}
+"""
+
+    def _parse_allocation(self, response: str, request: TripRequest) -> Optional[Dict[str, Any]]:
+        """
+        解析分配结果，返回 {"days": {day_index: 分配}, "overall_suggestions": str}
+
+        结果无法解析或缺少某一天时返回None
+        """
+        data = self._extract_json(response)
+        if not isinstance(data, dict) or not isinstance(data.get("days"), list):
+            print("⚠️  Allocation step failed, falling back to single-call planning")
+            return None
+
+        days = {}
+        for entry in data["days"]:
+            if isinstance(entry, dict) and isinstance(entry.get("day_index"), int):
+                days[entry["day_index"]] = entry
+        if any(day_index not in days for day_index in range(request.travel_days)):
+            print("⚠️  Allocation does not cover every day, falling back to single-call planning")
+            return None
+
+        return {"days": days, "overall_suggestions": str(data.get("overall_suggestions") or "")}
+
+    def _plan_day(
+        self,
+        request: TripRequest,
+        stage_results: Dict[str, str],
+        allocation: Dict[str, Any],
+        day_index: int
+    ) -> Tuple[int, Optional[Tuple[DayPlan, Optional[WeatherInfo]]]]:
+        """生成单日行程，返回(day_index, 解析结果或None)"""
+        response = self.day_planner_agent.run(self._build_day_query(request, stage_results, allocation, day_index))
+        return day_index, self._parse_day_response(response, day_index, self._allocation_needs_reorder(allocation))
+
+    async def _aplan_day(
+        self,
+        request: TripRequest,
+        stage_results: Dict[str, str],
+        allocation: Dict[str, Any],
+        day_index: int
+    ) -> Tuple[int, Optional[Tuple[DayPlan, Optional[WeatherInfo]]]]:
+        """_plan_day的异步版本"""
+        response = await self.day_planner_agent.arun(self._build_day_query(request, stage_results, allocation, day_index))
+        return day_index, self._parse_day_response(response, day_index, self._allocation_needs_reorder(allocation))
+
+    def _build_day_query(
+        self,
+        request: TripRequest,
+        stage_results: Dict[str, str],
+        allocation: Dict[str, Any],
+        day_index: int
+    ) -> str:
+        """构建单日行程的查询"""
+        from datetime import datetime, timedelta
+
+        assigned = allocation["days"][day_index]
+        day_date = (datetime.strptime(request.start_date, "%Y-%m-%d") + timedelta(days=day_index)).strftime("%Y-%m-%d")
+        attractions = ", ".join(str(name) for name in assigned.get("attractions") or []) or "choose 2-3 suitable attractions"
+
+        query = f"""Please write the plan for day {day_index + 1} (day_index {day_index}, date {day_date}) of a {request.travel_days}-day trip to {request.city}.
+
+**Assigned for this day:**
+- Theme: {assigned.get("theme") or "free"}
+- Attractions (in visiting order): {attractions}
+- Hotel: {assigned.get("hotel") or "choose one from the hotel information"}
+- Transportation: {request.transportation}
+- Accommodation: {request.accommodation}
+
+**Attraction Information:**
+{stage_results["attractions"]}
+
+**Weather Information:**
+{stage_results["weather"]}
+
+**Hotel Information:**
+{stage_results["hotels"]}
+"""
+        if request.free_text_input:
+            query += f"\n**Additional Requirements:** {request.free_text_input}"
+        return query
+
+    def _parse_day_response(
+        self,
+        response: str,
+        day_index: int,
+        reorder: bool = False
+    ) -> Optional[Tuple[DayPlan, Optional[WeatherInfo]]]:
+        """解析单日行程输出：(DayPlan, WeatherInfo或None)，reorder为True时按最短路线重排景点"""
+        data = self._extract_json(response)
+        if not isinstance(data, dict) or not isinstance(data.get("day"), dict):
+            print(f"⚠️  Day {day_index + 1} plan could not be parsed")
+            return None
+        try:
+            day = DayPlan(**{**data["day"], "day_index": day_index})
+            if reorder:
+                order_day_attractions(day)
+            weather = WeatherInfo(**data["weather"]) if isinstance(data.get("weather"), dict) else None
+        except Exception as e:
+            print(f"⚠️  Day {day_index + 1} plan is invalid: {str(e)}")
+            return None
+        return day, weather
+
+    def _merge_sharded_plan(
+        self,
+        request: TripRequest,
+        allocation: Dict[str, Any],
+        day_results: Dict[int, Optional[Tuple[DayPlan, Optional[WeatherInfo]]]]
+    ) -> Tuple[TripPlan, bool]:
+        """
+        合并每天的行程，预算由budget_service在本地计算
+
+        生成失败的天使用备用计划中的对应天，此时返回的完整标志为False（不写缓存）
+        """
+        fallback_days = None
+        days, weather_info = [], []
+        for day_index in range(request.travel_days):
+            day_result = day_results.get(day_index)
+            if day_result is None:
+                if fallback_days is None:
+                    fallback_days = self._create_fallback_plan(request).days
+                days.append(fallback_days[day_index])
+                continue
+            day, weather = day_result
+            days.append(day)
+            if weather is not None:
+                weather_info.append(weather)
+
+        trip_plan = TripPlan(
+            city=request.city,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            days=days,
+            weather_info=weather_info,
+            overall_suggestions=allocation["overall_suggestions"] or f"Enjoy your {request.travel_days}-day trip to {request.city}!",
+            budget=compute_budget(days, request.transportation)
+        )
+        complete = fallback_days is None
+        print(f"✅ Sharded plan merged: {len(days)} days ({'complete' if complete else 'with fallback days'})")
+        return trip_plan, complete
+
+    @staticmethod
+    def _allocation_needs_reorder(allocation: Optional[Dict[str, Any]]) -> bool:
+        """
+        LLM输出的景点顺序是否需要按最短路线重排
+
+        本地优化器已经确定了每天的游览顺序时，提示词要求LLM照此顺序撰写，不再重排；
+        LLM分配或没有分配结果时，LLM给出的顺序可能来回折返，需要重排
+        """
+        return get_settings().itinerary_optimizer_enabled and not (allocation or {}).get("ordered")
+
+    def _needs_reorder(self, request: TripRequest, stage_results: Dict[str, str]) -> bool:
+        """单次规划时是否重排：与_build_planner_query使用同一个本地分配结果判断"""
+        return self._allocation_needs_reorder(self._local_allocation(request, stage_results))
+
+    def _print_trip_header(self, request: TripRequest):
+        """打印规划请求概要"""
+        print(f"\n{'='*60}")
+        print(f"🚀 Starting multi-agent collaborative trip planning...")
+        print(f"Destination: {request.city}")
+        print(f"Dates: {request.start_date} to {request.end_date}")
+        print(f"Days: {request.travel_days} days")
+        print(f"Preferences: {', '.join(request.preferences) if request.preferences else 'None'}")
+        print(f"{'='*60}\n")
+
+    def _finish_plan(self, planner_response: str, request: TripRequest, reorder: bool = False) -> Tuple[TripPlan, bool]:
+        """
+        解析规划Agent的输出并生成最终计划
+
+        Args:
+            planner_response: 规划Agent的输出
+            request: 旅行请求
+            reorder: 是否按最短路线重排每天的景点（见_needs_reorder）
+
+        Returns:
+            (旅行计划, 是否解析成功)，解析失败时返回备用计划和False
+        """
+        print(f"🔍 Starting to parse response, response length: {len(planner_response)} characters")
+        trip_plan = self._try_parse_response(planner_response)
+        parsed = trip_plan is not None
+        if not parsed:
+            print(f"   Will use fallback plan generation")
+            trip_plan = self._create_fallback_plan(request)
+        else:
+            if reorder:
+                # LLM给出的景点顺序经常来回折返，按最短路线重新排列
+                for day in trip_plan.days:
+                    order_day_attractions(day)
+            # 预算不再由LLM生成，根据每日明细在本地计算
+            trip_plan.budget = compute_budget(trip_plan.days, request.transportation)
+
+        # Debug: Print parsing results
+        print(f"🔍 Parsing results:")
+        print(f"   city: {trip_plan.city}")
+        print(f"   days count: {len(trip_plan.days)}")
+        print(f"   weather_info count: {len(trip_plan.weather_info)}")
+        print(f"   overall_suggestions: {trip_plan.overall_suggestions[:100] if trip_plan.overall_suggestions else 'None'}...")
+
+        print(f"{'='*60}")
+        print(f"✅ Trip plan generation completed!")
+        print(f"{'='*60}\n")
+
+        return trip_plan, parsed
+
+    def _get_cached_plan(self, request: TripRequest) -> Optional[TripPlan]:
+        """查询计划缓存，未启用或未命中时返回None"""
+        cache = get_plan_cache()
+        if cache is None:
+            return None
+        cached = cache.get(make_cache_key("plan", canonicalize_trip_request(request)))
+        if cached is None:
+            return None
+        try:
+            trip_plan = TripPlan.model_validate_json(cached)
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable cached plan: {str(e)}")
+            return None
+        print(f"⚡ Plan cache hit: {request.city}, {request.travel_days} days")
+        return trip_plan
+
+    def _cache_plan(self, request: TripRequest, trip_plan: TripPlan, stage_results: Dict[str, str]):
+        """
+        写入计划缓存（只缓存成功解析的计划，不缓存备用计划）
+
+        有检索阶段不可用时也不缓存：规划Agent被要求自行推荐景点/酒店，
+        一次短暂的高德故障不应让这样的计划在整个缓存TTL内被重复返回
+        """
+        degraded = degraded_stages(stage_results)
+        if degraded:
+            print(f"   ⚠️  Plan not cached, stages unavailable: {', '.join(degraded)}")
+            return
+        cache = get_plan_cache()
+        if cache is not None:
+            cache.set(make_cache_key("plan", canonicalize_trip_request(request)), trip_plan.model_dump_json())
+
+    def _run_retrieval_stages(self, request: TripRequest) -> Dict[str, str]:
+        """
+        Run the attraction, weather and hotel retrieval stages
+
+        The stages do not depend on each other, so in "concurrent" mode
+        (settings.agent_execution_mode) they run in parallel and are joined
+        before the planner stage; "sequential" keeps the original order.
+        A stage that fails or exceeds settings.agent_stage_timeout is replaced
+        by a short StageUnavailableNote, so the planner still works with partial
+        results (and degraded_stages() can tell which stages were replaced).
+
+        Returns:
+            Dict mapping stage name to the stage output text
+        """
+        settings = get_settings()
+        chinese_city = translate_city_name(request.city)
+        print(f"   🔄 City name translation: {request.city} -> {chinese_city}")
+
+        if settings.agent_execution_mode == "concurrent":
+            results = self._run_stages_concurrent(request, settings.agent_stage_timeout)
+        else:
+            results = self._run_stages_sequential(request)
+
+        for stage in RETRIEVAL_STAGES:
+            print(f"{stage.capitalize()} result: {results[stage][:200]}...\n")
+
+        return results
+
+    def _run_stages_sequential(self, request: TripRequest) -> Dict[str, str]:
+        """依次执行检索阶段"""
+        results = {}
+        for step, stage in enumerate(RETRIEVAL_STAGES, start=1):
+            print(f"{STAGE_LABELS[stage]} (Step {step})...")
+            try:
+                results[stage] = self._check_stage_output(stage, request, self._run_stage(stage, request))
+            except Exception as e:
+                results[stage] = self._stage_unavailable_note(stage, request, str(e))
+        return results
+
+    def _run_stages_concurrent(self, request: TripRequest, timeout: float) -> Dict[str, str]:
+        """
+        并发执行检索阶段
+
+        每个阶段有独立的截止时间(从并发启动时刻起算)，超时的阶段不会阻塞
+        其他阶段的结果，也不会阻塞规划阶段（线程池不等待超时线程结束）
+        """
+        print(f"⚡ Steps 1-3: Running {len(RETRIEVAL_STAGES)} retrieval stages concurrently (timeout {timeout:.0f}s each)...")
+        results = {}
+        executor = ThreadPoolExecutor(max_workers=len(RETRIEVAL_STAGES), thread_name_prefix="trip-stage")
+        try:
+            started = time.monotonic()
+            futures = {
+                stage: executor.submit(self._run_stage, stage, request)
+                for stage in RETRIEVAL_STAGES
+            }
+            for stage, future in futures.items():
+                remaining = max(0.0, timeout - (time.monotonic() - started))
+                try:
+                    output = future.result(timeout=remaining)
+                    results[stage] = self._check_stage_output(stage, request, output)
+                    print(f"   ✅ {stage} stage finished in {time.monotonic() - started:.1f}s")
+                except FutureTimeoutError:
+                    future.cancel()
+                    results[stage] = self._stage_unavailable_note(stage, request, f"timed out after {timeout:.0f}s")
+                except Exception as e:
+                    results[stage] = self._stage_unavailable_note(stage, request, str(e))
+        finally:
+            # 不等待超时的阶段线程，避免拖慢整体响应
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    async def _arun_retrieval_stages(self, request: TripRequest) -> Dict[str, str]:
+        """_run_retrieval_stages的异步版本（并发模式使用asyncio.gather）"""
+        settings = get_settings()
+        timeout = settings.agent_stage_timeout
+        chinese_city = translate_city_name(request.city)
+        print(f"   🔄 City name translation: {request.city} -> {chinese_city}")
+
+        if settings.agent_execution_mode == "concurrent":
+            print(f"⚡ Steps 1-3: Running {len(RETRIEVAL_STAGES)} retrieval stages concurrently (timeout {timeout:.0f}s each)...")
+            outputs = await asyncio.gather(*(self._arun_stage_checked(stage, request) for stage in RETRIEVAL_STAGES))
+            results = dict(zip(RETRIEVAL_STAGES, outputs))
+        else:
+            results = {}
+            for step, stage in enumerate(RETRIEVAL_STAGES, start=1):
+                print(f"{STAGE_LABELS[stage]} (Step {step})...")
+                results[stage] = await self._arun_stage_checked(stage, request)
+
+        for stage in RETRIEVAL_STAGES:
+            print(f"{stage.capitalize()} result: {results[stage][:200]}...\n")
+
+        return results
+
+    def _run_stage(self, stage: str, request: TripRequest) -> str:
+        """执行单个检索阶段（优先使用阶段缓存）"""
+        cache_key = self._stage_cache_key(stage, request)
+        cached = self._get_cached_stage(stage, cache_key)
+        if cached is not None:
+            return cached
+        output = self._run_stage_uncached(stage, request)
+        self._cache_stage(stage, cache_key, output)
+        return output
+
+    async def _arun_stage(self, stage: str, request: TripRequest) -> str:
+        """异步执行单个检索阶段（优先使用阶段缓存）"""
+        cache_key = self._stage_cache_key(stage, request)
+        cached = self._get_cached_stage(stage, cache_key)
+        if cached is not None:
+            return cached
+        output = await self._arun_stage_uncached(stage, request)
+        self._cache_stage(stage, cache_key, output)
+        return output
+
+    def _stage_cache_key(self, stage: str, request: TripRequest) -> str:
+        """
+        检索阶段缓存键：只包含该阶段真正依赖的请求字段
+
+        - 景点：城市 + 所有偏好关键词（排序后，偏好顺序不同的请求共用缓存）
+        - 酒店：城市 + 住宿类型
+        - 天气：城市 + 当天日期（预报随日期变化）
+        不同流水线模式的输出格式不同，模式也是键的一部分
+        """
+        city = translate_city_name(" ".join(request.city.split()))
+        if stage == "attractions":
+            fields = {"preferences": sorted(self._attraction_keywords(request))}
+        elif stage == "hotels":
+            fields = {"accommodation": " ".join(request.accommodation.split())}
+        elif stage == "weather":
+            fields = {"day": date.today().isoformat()}
+        else:
+            raise ValueError(f"Unknown retrieval stage: {stage}")
+        return make_cache_key(f"stage:{stage}", {
+            "mode": get_settings().agent_pipeline_mode,
+            "city": city,
+            **fields
+        })
+
+    def _get_cached_stage(self, stage: str, cache_key: str) -> Optional[str]:
+        """查询阶段缓存"""
+        cache = get_stage_cache()
+        if cache is None:
+            return None
+        cached = cache.get(cache_key)
+        if cached is not None:
+            print(f"   ⚡ {stage} stage cache hit")
+        return cached
+
+    def _cache_stage(self, stage: str, cache_key: str, output: str):
+        """写入阶段缓存（失败或空结果不缓存，判断见_stage_output_error）"""
+        if self._stage_output_error(output) is not None:
+            return
+        cache = get_stage_cache()
+        if cache is None:
+            return
+        cache.set(cache_key, output, ttl=get_stage_cache_ttl(stage))
+
+    def _run_stage_uncached(self, stage: str, request: TripRequest) -> str:
+        """执行单个检索阶段，返回Agent（或direct模式下工具）的输出文本"""
+        if get_settings().agent_pipeline_mode == "direct":
+            tool_name, arguments = self._build_direct_tool_call(stage, request)
+            return self._get_tool(tool_name).invoke(arguments)
+        agent = self._stage_agent(stage)
+        query = self._build_stage_query(stage, request)
+        # LangChain Agent包装器才有run_with_observations（测试中的替身Agent只有run）
+        if hasattr(agent, "run_with_observations"):
+            return self._agent_stage_output(stage, *agent.run_with_observations(query))
+        return agent.run(query)
+
+    async def _arun_stage_checked(self, stage: str, request: TripRequest) -> str:
+        """异步执行单个检索阶段，带超时和失败处理（失败时返回说明文本）"""
+        timeout = get_settings().agent_stage_timeout
+        try:
+            output = await asyncio.wait_for(self._arun_stage(stage, request), timeout=timeout)
+            return self._check_stage_output(stage, request, output)
+        except asyncio.TimeoutError:
+            return self._stage_unavailable_note(stage, request, f"timed out after {timeout:.0f}s")
+        except Exception as e:
+            return self._stage_unavailable_note(stage, request, str(e))
+
+    async def _arun_stage_uncached(self, stage: str, request: TripRequest) -> str:
+        """异步执行单个检索阶段"""
+        if get_settings().agent_pipeline_mode == "direct":
+            tool_name, arguments = self._build_direct_tool_call(stage, request)
+            return await self._get_tool(tool_name).ainvoke(arguments)
+        agent = self._stage_agent(stage)
+        query = self._build_stage_query(stage, request)
+        if hasattr(agent, "arun_with_observations"):
+            return self._agent_stage_output(stage, *(await agent.arun_with_observations(query)))
+        return await agent.arun(query)
+
+    def _agent_stage_output(self, stage: str, answer: str, observations: List[str]) -> str:
+        """
+        agent模式的阶段输出：优先使用Agent调用工具得到的原始结果
+
+        Agent的文字回答里没有可解析的坐标，压缩成POI表后本地行程优化器才能分配景点；
+        这里把各次工具调用返回的POI合并成与direct模式相同的JSON（天气取最后一次有效预报），
+        工具没有返回可用数据时（出错、没有调用工具）仍使用Agent的文字回答
+        """
+        payloads = [
+            observation for observation in observations
+            if self._stage_output_error(observation) is None
+        ]
+        if stage == "weather":
+            for observation in reversed(payloads):
+                if find_forecasts(load_json(observation)):
+                    return observation
+        else:
+            pois = merge_poi_results([("", observation) for observation in payloads])
+            if pois:
+                return json.dumps({"count": len(pois), "pois": pois}, ensure_ascii=False)
+        return answer
+
+    def _build_direct_tool_call(self, stage: str, request: TripRequest) -> tuple:
+        """
+        direct模式：根据请求字段直接确定工具调用，跳过LLM的工具选择
+
+        检索Agent的提示词已经规定了工具和参数，这里直接复用同样的参数，
+        因此每次规划只有规划阶段需要调用LLM
+
+        Returns:
+            (工具名称, 工具参数)
+        """
+        chinese_city = translate_city_name(request.city)
+        if stage == "attractions":
+            # 高德搜索使用中文关键词效果更好，偏好标签本身就是中文；多个偏好一次多关键词搜索
+            keywords = self._attraction_keywords(request) or ["景点"]
+            if len(keywords) > 1:
+                return "amap_maps_multi_search", {"keywords": keywords, "city": chinese_city}
+            return "amap_maps_text_search", {"keywords": keywords[0], "city": chinese_city}
+        if stage == "weather":
+            return "amap_maps_weather", {"city": chinese_city}
+        if stage == "hotels":
+            return "amap_maps_text_search", {"keywords": request.accommodation or "酒店", "city": chinese_city}
+        raise ValueError(f"Unknown retrieval stage: {stage}")
+
+    @staticmethod
+    def _attraction_keywords(request: TripRequest) -> List[str]:
+        """景点搜索关键词：去掉空白和重复后的全部偏好（保持顺序）"""
+        return list(dict.fromkeys(p.strip() for p in request.preferences if p and p.strip()))
+
+    def _get_tool(self, tool_name: str):
+        """按名称查找共享的高德工具"""
+        for tool in self.amap_tools:
+            if tool.name == tool_name:
+                return tool
+        raise ValueError(f"Tool not found: {tool_name}")
+
+    def _stage_agent(self, stage: str):
+        """检索阶段对应的Agent"""
+        agents = {
+            "attractions": self.attraction_agent,
+            "weather": self.weather_agent,
+            "hotels": self.hotel_agent,
+        }
+        return agents[stage]
+
+    def _build_stage_query(self, stage: str, request: TripRequest) -> str:
+        """构建检索阶段的查询（工具调用统一使用中文城市名）"""
+        chinese_city = translate_city_name(request.city)
+        if stage == "attractions":
+            attraction_query = self._build_attraction_query(request)
+            # Update query to explicitly use Chinese city name for tool calls
+            return attraction_query.replace(
+                f"in {request.city}",
+                f"in {request.city} (use Chinese city name '{chinese_city}' when calling the tool)"
+            )
+        if stage == "weather":
+            return f"Get weather information for {chinese_city} (city name: {chinese_city}). Please use the amap_maps_weather tool with city='{chinese_city}'."
+        if stage == "hotels":
+            return f"Search for {request.accommodation} hotels in {chinese_city} (city name: {chinese_city}). Please use the amap_maps_text_search tool with keywords='hotel' and city='{chinese_city}'."
+        raise ValueError(f"Unknown retrieval stage: {stage}")
+
+    @staticmethod
+    def _stage_output_error(output: str) -> Optional[str]:
+        """
+        阶段输出的失败原因，正常输出返回None
+
+        Agent包装器和工具会把异常转换为"Error..."字符串；工具还会原样返回错误JSON
+        （uvx不存在、amap-mcp-server的{"error": ...}、高德接口status != "1"），
+        与工具缓存(amap_transport._is_cacheable)使用同样的判断
+        """
+        if not output:
+            return "empty result"
+        if output.startswith("Error"):
+            return output
+        return payload_error(load_json(output))
+
+    def _check_stage_output(self, stage: str, request: TripRequest, output: str) -> str:
+        """
+        失败的阶段输出（见_stage_output_error）统一视为阶段失败
+
+        成功的输出会被压缩成紧凑表格（见prompt_compaction），减少规划提示词的token数
+        """
+        error = self._stage_output_error(output)
+        if error is not None:
+            return self._stage_unavailable_note(stage, request, error)
+        settings = get_settings()
+        if settings.prompt_compaction_enabled:
+            compacted = compact_stage_output(
+                stage, output,
+                top_k=settings.prompt_poi_top_k,
+                token_budget=settings.prompt_section_token_budget
+            )
+            print(f"   🗜️  {stage} output compacted: ~{estimate_tokens(output)} -> ~{estimate_tokens(compacted)} tokens")
+            return compacted
+        return output
+
+    def _stage_unavailable_note(self, stage: str, request: TripRequest, reason: str) -> StageUnavailableNote:
+        """阶段失败时提供给规划Agent的说明（部分结果），结果中据此识别降级的阶段"""
+        print(f"   ⚠️  {stage} stage unavailable: {reason}")
+        hints = {
+            "attractions": f"Recommend well-known, real attractions in {request.city}.",
+            "weather": "Leave weather_info empty and give general seasonal advice instead.",
+            "hotels": f"Recommend well-known, real {request.accommodation} hotels in {request.city}.",
+        }
+        text = f"{stage.capitalize()} information is unavailable ({reason}). {hints.get(stage, '')}".strip()
+        return StageUnavailableNote(text, stage, reason)
+
     def _build_attraction_query(self, request: TripRequest) -> str:
         """
         Build attraction search query
@@ -509,7 +1551,16 @@ class MultiAgentTripPlanner:
         - Translates city name to Chinese for MCP tool compatibility
         """
         keywords = "attractions"
-        if request.preferences:
+        preferences = self._attraction_keywords(request)
+        if len(preferences) > 1:
+            # Several preferences: one multi-keyword search covers all of them in a single tool call
+            keyword_list = ", ".join(f'"{pref}"' for pref in preferences)
+            return (
+                f"Search for {', '.join(preferences)} in {request.city}. "
+                f"Please use the amap_maps_multi_search tool once with keywords=[{keyword_list}] "
+                f"to find attractions for all preferences. Note: When calling the tool, use the Chinese city name if the city name is in English."
+            )
+        if preferences:
             # Convert preferences to English keywords
             preference_map = {
                 "历史文化": "historical culture",
@@ -519,7 +1570,7 @@ class MultiAgentTripPlanner:
                 "娱乐": "entertainment"
             }
             # Try to map, if not found use original value
-            pref = request.preferences[0]
+            pref = preferences[0]
             keywords = preference_map.get(pref, pref)
         else:
             keywords = "attractions"
@@ -539,6 +1590,15 @@ class MultiAgentTripPlanner:
         - 保持接口兼容
         """
         preferences_str = ', '.join(request.preferences) if request.preferences else 'none'
+
+        # 本地优化器已经按距离分好每天的景点和顺序时，LLM只需按路线撰写内容
+        allocation = self._local_allocation(request, {"attractions": attractions, "hotels": hotels})
+        if allocation is not None:
+            route_section = f"\n**Daily Routes (already optimized by distance):**\n{self._format_allocation(allocation)}\n"
+            route_requirement = "Follow the daily routes exactly: same attractions, same days, same visiting order"
+        else:
+            route_section = ""
+            route_requirement = "Consider the distance between attractions and transportation methods"
         
         query = f"""Please generate a {request.travel_days}-day travel plan for {request.city} based on the following information:
 
@@ -558,12 +1618,12 @@ class MultiAgentTripPlanner:
 
 **Hotel Information:**
 {hotels}
-
+{route_section}
 **Requirements:**
 1. Arrange 2-3 attractions per day
 2. Each day must include breakfast, lunch, and dinner
 3. Recommend a specific hotel for each day (select from hotel information)
-4. Consider the distance between attractions and transportation methods
+4. {route_requirement}
 5. Return complete JSON format data
 6. Attraction coordinates (longitude, latitude) must be accurate and real
 7. **CRITICAL: ALL output must be in ENGLISH** - Translate all Chinese text to English:
@@ -587,26 +1647,23 @@ class MultiAgentTripPlanner:
             request: 原始请求
             
         Returns:
-            旅行计划
+            旅行计划（解析失败时返回备用计划）
+        """
+        trip_plan = self._try_parse_response(response)
+        if trip_plan is None:
+            print(f"   Will use fallback plan generation")
+            return self._create_fallback_plan(request)
+        return trip_plan
+
+    def _try_parse_response(self, response: str) -> Optional[TripPlan]:
+        """
+        解析Agent响应，解析失败时返回None
+
+        与_parse_response的区别：调用方可以区分真实计划和备用计划
+        （备用计划不能写入计划缓存）
         """
         try:
-            # 尝试从响应中提取JSON
-            # 查找JSON代码块
-            if "```json" in response:
-                json_start = response.find("```json") + 7
-                json_end = response.find("```", json_start)
-                json_str = response[json_start:json_end].strip()
-            elif "```" in response:
-                json_start = response.find("```") + 3
-                json_end = response.find("```", json_start)
-                json_str = response[json_start:json_end].strip()
-            elif "{" in response and "}" in response:
-                # 直接查找JSON对象
-                json_start = response.find("{")
-                json_end = response.rfind("}") + 1
-                json_str = response[json_start:json_end]
-            else:
-                raise ValueError("响应中未找到JSON数据")
+            json_str = self._extract_json_str(response)
             
             # Parse JSON
             print(f"🔍 Extracted JSON length: {len(json_str)} characters")
@@ -624,16 +1681,41 @@ class MultiAgentTripPlanner:
         except json.JSONDecodeError as e:
             print(f"⚠️  JSON parsing failed: {str(e)}")
             print(f"   JSON string position: {e.pos}")
-            print(f"   Will use fallback plan generation")
-            return self._create_fallback_plan(request)
+            return None
         except Exception as e:
             print(f"⚠️  Failed to parse response: {str(e)}")
             print(f"   Error type: {type(e).__name__}")
             import traceback
             print(f"   Detailed error:")
             traceback.print_exc()
-            print(f"   Will use fallback plan generation")
-            return self._create_fallback_plan(request)
+            return None
+
+    def _extract_json_str(self, response: str) -> str:
+        """从Agent响应中提取JSON字符串（代码块或第一个{到最后一个}）"""
+        # 尝试从响应中提取JSON
+        # 查找JSON代码块
+        if "```json" in response:
+            json_start = response.find("```json") + 7
+            json_end = response.find("```", json_start)
+            return response[json_start:json_end].strip()
+        elif "```" in response:
+            json_start = response.find("```") + 3
+            json_end = response.find("```", json_start)
+            return response[json_start:json_end].strip()
+        elif "{" in response and "}" in response:
+            # 直接查找JSON对象
+            json_start = response.find("{")
+            json_end = response.rfind("}") + 1
+            return response[json_start:json_end]
+        else:
+            raise ValueError("响应中未找到JSON数据")
+
+    def _extract_json(self, response: str) -> Optional[Any]:
+        """提取并解析响应中的JSON，失败时返回None"""
+        try:
+            return json.loads(self._extract_json_str(response))
+        except (ValueError, json.JSONDecodeError):
+            return None
     
     def _create_fallback_plan(self, request: TripRequest) -> TripPlan:
         """创建备用计划(当Agent失败时)"""
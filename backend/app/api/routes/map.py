@@ -3,13 +3,22 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
 from ...models.schemas import (
+    GeocodeBatchItem,
+    GeocodeBatchRequest,
+    GeocodeBatchResponse,
+    POIBatchItem,
+    POIBatchRequest,
+    POIBatchResponse,
     POISearchRequest,
     POISearchResponse,
+    RouteMatrixInfo,
+    RouteMatrixRequest,
+    RouteMatrixResponse,
     RouteRequest,
     RouteResponse,
     WeatherResponse
 )
-from ...services.amap_service import get_amap_service
+from ...services.amap_service import check_batch_size, check_matrix_size, get_amap_service
 
 router = APIRouter(prefix="/map", tags=["Map Service"])
 
@@ -41,7 +50,7 @@ async def search_poi(
         service = get_amap_service()
         
         # Search POI
-        pois = service.search_poi(keywords, city, citylimit)
+        pois = await service.asearch_poi(keywords, city, citylimit)
         
         return POISearchResponse(
             success=True,
@@ -57,6 +66,104 @@ async def search_poi(
         )
 
 
+@router.post(
+    "/poi/batch",
+    response_model=POIBatchResponse,
+    summary="Batch Search POI",
+    description="Search POIs for several keyword/city queries concurrently; results are returned in request order"
+)
+async def search_poi_batch(request: POIBatchRequest):
+    """
+    Batch search POI
+
+    Args:
+        request: Search queries (duplicates are searched once)
+
+    Returns:
+        One result per query, with per-query errors
+    """
+    try:
+        check_batch_size(len(request.queries))
+        service = get_amap_service()
+
+        results = await service.search_poi_batch([query.model_dump() for query in request.queries])
+
+        items = [
+            POIBatchItem(
+                keywords=query.keywords,
+                city=query.city,
+                success=error is None,
+                message=error or "",
+                data=pois or []
+            )
+            for query, (pois, error) in zip(request.queries, results)
+        ]
+        succeeded = sum(1 for item in items if item.success)
+        return POIBatchResponse(
+            success=True,
+            message=f"POI batch search: {succeeded}/{len(items)} succeeded",
+            data=items
+        )
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ POI batch search failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"POI batch search failed: {str(e)}"
+        )
+
+
+@router.post(
+    "/geocode/batch",
+    response_model=GeocodeBatchResponse,
+    summary="Batch Geocode",
+    description="Convert several addresses to coordinates concurrently; results are returned in request order"
+)
+async def geocode_batch(request: GeocodeBatchRequest):
+    """
+    Batch geocode
+
+    Args:
+        request: Addresses (duplicates are geocoded once)
+
+    Returns:
+        One location per address, with per-address errors
+    """
+    try:
+        check_batch_size(len(request.addresses))
+        service = get_amap_service()
+
+        results = await service.geocode_batch([item.model_dump() for item in request.addresses])
+
+        items = [
+            GeocodeBatchItem(
+                address=item.address,
+                city=item.city,
+                success=error is None,
+                message=error or "",
+                data=location
+            )
+            for item, (location, error) in zip(request.addresses, results)
+        ]
+        succeeded = sum(1 for item in items if item.success)
+        return GeocodeBatchResponse(
+            success=True,
+            message=f"Geocode batch: {succeeded}/{len(items)} succeeded",
+            data=items
+        )
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Geocode batch failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Geocode batch failed: {str(e)}"
+        )
+
+
 @router.get(
     "/weather",
     response_model=WeatherResponse,
@@ -80,7 +187,7 @@ async def get_weather(
         service = get_amap_service()
         
         # Query weather
-        weather_info = service.get_weather(city)
+        weather_info = await service.aget_weather(city)
         
         return WeatherResponse(
             success=True,
@@ -117,7 +224,7 @@ async def plan_route(request: RouteRequest):
         service = get_amap_service()
         
         # Plan route
-        route_info = service.plan_route(
+        route_info = await service.aplan_route(
             origin_address=request.origin_address,
             destination_address=request.destination_address,
             origin_city=request.origin_city,
@@ -126,8 +233,8 @@ async def plan_route(request: RouteRequest):
         )
         
         return RouteResponse(
-            success=True,
-            message="Route planning successful",
+            success=route_info is not None,
+            message="Route planning successful" if route_info else "No route found",
             data=route_info
         )
         
@@ -139,6 +246,71 @@ async def plan_route(request: RouteRequest):
         )
 
 
+@router.post(
+    "/matrix",
+    response_model=RouteMatrixResponse,
+    summary="Travel-Time Matrix",
+    description="Travel time and distance between every pair of points; far pairs that cannot be nearest neighbours are estimated"
+)
+async def route_matrix(request: RouteMatrixRequest):
+    """
+    Travel-time matrix
+
+    Args:
+        request: Points (coordinates or addresses), route type and city
+
+    Returns:
+        Symmetric duration/distance matrices in request order
+    """
+    try:
+        service = get_amap_service()
+        # 先检查点数，超出上限时不再为地址点发起地理编码
+        check_matrix_size(len(request.points))
+
+        # Points given only by address are geocoded in one batch
+        missing = [index for index, point in enumerate(request.points) if point.location is None]
+        if any(not request.points[index].address for index in missing):
+            raise ValueError("Every point needs a location or an address")
+        locations = [point.location for point in request.points]
+        if missing:
+            check_batch_size(len(missing))
+            results = await service.geocode_batch([
+                {"address": request.points[index].address, "city": request.points[index].city or request.city}
+                for index in missing
+            ])
+            failed = [request.points[index].address for index, (_, error) in zip(missing, results) if error]
+            if failed:
+                raise ValueError(f"Could not geocode: {', '.join(failed)}")
+            for index, (location, _) in zip(missing, results):
+                locations[index] = location
+
+        matrix = await service.route_matrix(
+            locations,
+            route_type=request.route_type,
+            city=request.city,
+            neighbors=request.neighbors
+        )
+
+        return RouteMatrixResponse(
+            success=True,
+            message="Route matrix computed",
+            data=RouteMatrixInfo(
+                names=[point.name or point.address or "" for point in request.points],
+                points=locations,
+                **matrix
+            )
+        )
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Route matrix failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Route matrix failed: {str(e)}"
+        )
+
+
 @router.get(
     "/health",
     summary="Health Check",
@@ -150,10 +322,13 @@ async def health_check():
         # Check if service is available
         service = get_amap_service()
         
+        available_tools = service.transport.available_tools
+
         return {
-            "status": "healthy",
+            "status": "healthy" if service.transport.initialized else "degraded",
             "service": "map-service",
-            "mcp_tools_count": len(service.mcp_tool._available_tools)
+            "mcp_tools_count": len(available_tools),
+            "mcp_tools": available_tools
         }
     except Exception as e:
         raise HTTPException(
@@ -161,3 +336,21 @@ async def health_check():
             detail=f"Service unavailable: {str(e)}"
         )
 
+
+@router.get(
+    "/diagnostics",
+    summary="MCP Diagnostics",
+    description="Show MCP server processes, request gauges and recent server logs (stderr)"
+)
+async def diagnostics(
+    lines: int = Query(50, ge=0, le=1000, description="Number of recent stderr lines per process")
+):
+    """MCP diagnostics"""
+    try:
+        service = get_amap_service()
+        return service.transport.diagnostics(stderr_lines=lines)
+    except Exception as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service unavailable: {str(e)}"
+        )
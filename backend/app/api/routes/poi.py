@@ -3,7 +3,7 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from ...services.amap_service import get_amap_service
+from ...services.amap_service import check_batch_size, get_amap_service
 from ...services.unsplash_service import get_unsplash_service
 
 router = APIRouter(prefix="/poi", tags=["POI"])
@@ -16,6 +16,26 @@ class POIDetailResponse(BaseModel):
     data: Optional[dict] = None
 
 
+class POIDetailBatchRequest(BaseModel):
+    """批量POI详情请求"""
+    ids: List[str] = Field(..., min_length=1, description="POI ID列表（重复的ID只查询一次）")
+
+
+class POIDetailBatchItem(BaseModel):
+    """批量POI详情中的一项（顺序与请求相同）"""
+    id: str
+    success: bool
+    message: str = ""
+    data: Optional[dict] = None
+
+
+class POIDetailBatchResponse(BaseModel):
+    """批量POI详情响应"""
+    success: bool
+    message: str
+    data: List[POIDetailBatchItem] = []
+
+
 @router.get(
     "/detail/{poi_id}",
     response_model=POIDetailResponse,
@@ -36,7 +56,7 @@ async def get_poi_detail(poi_id: str):
         amap_service = get_amap_service()
         
         # Call Amap POI details API
-        result = amap_service.get_poi_detail(poi_id)
+        result = await amap_service.aget_poi_detail(poi_id)
         
         return POIDetailResponse(
             success=True,
@@ -52,6 +72,49 @@ async def get_poi_detail(poi_id: str):
         )
 
 
+@router.post(
+    "/detail/batch",
+    response_model=POIDetailBatchResponse,
+    summary="Batch Get POI Details",
+    description="Get details for several POIs concurrently; results are returned in request order"
+)
+async def get_poi_detail_batch(request: POIDetailBatchRequest):
+    """
+    Batch get POI details
+
+    Args:
+        request: POI IDs (duplicates are fetched once)
+
+    Returns:
+        One detail per POI ID, with per-ID errors
+    """
+    try:
+        check_batch_size(len(request.ids))
+        amap_service = get_amap_service()
+
+        results = await amap_service.get_poi_detail_batch(request.ids)
+
+        items = [
+            POIDetailBatchItem(id=poi_id, success=error is None, message=error or "", data=detail)
+            for poi_id, (detail, error) in zip(request.ids, results)
+        ]
+        succeeded = sum(1 for item in items if item.success)
+        return POIDetailBatchResponse(
+            success=True,
+            message=f"POI detail batch: {succeeded}/{len(items)} succeeded",
+            data=items
+        )
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"❌ Failed to get POI details in batch: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to get POI details in batch: {str(e)}"
+        )
+
+
 @router.get(
     "/search",
     summary="Search POI",
@@ -70,7 +133,7 @@ async def search_poi(keywords: str, city: str = "Beijing"):
     """
     try:
         amap_service = get_amap_service()
-        result = amap_service.search_poi(keywords, city)
+        result = await amap_service.asearch_poi(keywords, city)
 
         return {
             "success": True,
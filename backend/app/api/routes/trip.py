@@ -1,6 +1,8 @@
 """Trip Planning API Routes"""
 
+import json
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from ...models.schemas import (
     TripRequest,
     TripPlanResponse,
@@ -39,9 +41,9 @@ async def plan_trip(request: TripRequest):
         print("🔄 Getting multi-agent system instance...")
         agent = get_trip_planner_agent()
 
-        # Generate trip plan
+        # Generate trip plan (async path, does not block the event loop)
         print("🚀 Starting trip plan generation...")
-        trip_plan = agent.plan_trip(request)
+        trip_plan = await agent.aplan_trip(request)
 
         print("✅ Trip plan generated successfully, preparing response")
         
@@ -90,6 +92,50 @@ async def plan_trip(request: TripRequest):
         )
 
 
+@router.post(
+    "/plan/stream",
+    summary="Generate Trip Plan (Streaming)",
+    description=(
+        "Generate a trip plan as Server-Sent Events: `stage` events while attractions, "
+        "weather and hotels are fetched, a `day` event for every DayPlan as soon as the "
+        "planner has produced it, and a final `plan` event with the complete TripPlan"
+    )
+)
+async def plan_trip_stream(request: TripRequest):
+    """
+    Generate trip plan as a Server-Sent Events stream
+
+    Args:
+        request: Trip request parameters
+
+    Returns:
+        text/event-stream response
+    """
+    print(f"\n📥 Received streaming trip planning request: {request.city}, {request.travel_days} days")
+
+    try:
+        agent = get_trip_planner_agent()
+    except Exception as e:
+        print(f"❌ Trip plan streaming failed: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate trip plan: {str(e)}"
+        )
+
+    async def event_stream():
+        async for event, data in agent.astream_trip(request):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering (nginx)
+        }
+    )
+
+
 @router.get(
     "/health",
     summary="Health Check",
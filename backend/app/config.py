@@ -33,6 +33,27 @@ class Settings(BaseSettings):
 
     # 高德地图API配置
     amap_api_key: str = ""
+    # 高德调用的传输方式
+    # mcp: 经由 uvx amap-mcp-server 子进程(JSON-RPC over stdio)
+    # http: 进程内httpx连接池直接请求高德REST API（不需要uvx）
+    amap_transport: str = "mcp"
+    amap_rest_base_url: str = "https://restapi.amap.com"
+    amap_http_timeout: float = 10.0
+    amap_http_max_connections: int = 20
+    # 高德调用限流(令牌桶，超出时排队而不是失败)和每日配额
+    amap_rate_limit_enabled: bool = True
+    amap_key_qps: float = 10.0  # 整个Key的QPS上限，0表示不限
+    amap_tool_qps: float = 3.0  # 每个工具的QPS上限，0表示不限
+    amap_tool_qps_overrides: str = ""  # 个别工具的QPS，如 "maps_weather=5,maps_geo=10"
+    amap_daily_quota: int = 5000  # 每个工具的每日调用配额，0表示不限
+    amap_rate_limit_max_wait: float = 15.0  # 排队等待令牌的最长时间(秒)
+    # 批量接口(/api/map/poi/batch 等)：单次请求的条目上限和并发上限
+    amap_batch_max_items: int = 50
+    amap_batch_concurrency: int = 8
+    # 出行时间矩阵(/api/map/matrix)：点数上限、每个点精确规划的近邻数(0表示全部精确规划)、坐标量化的小数位数
+    amap_matrix_max_points: int = 20
+    amap_matrix_neighbors: int = 3
+    amap_matrix_coord_precision: int = 4
 
     # Unsplash API配置
     unsplash_access_key: str = ""
@@ -43,6 +64,71 @@ class Settings(BaseSettings):
     openai_base_url: str = "https://api.openai.com/v1"
     openai_model: str = "gpt-4"
 
+    # 多智能体执行配置
+    # sequential: 依次执行景点/天气/酒店检索; concurrent: 三个检索阶段并发执行
+    agent_execution_mode: str = "concurrent"
+    # 单个检索阶段的超时时间(秒)，超时后使用部分结果继续规划
+    agent_stage_timeout: float = 45.0
+    # 检索流水线模式
+    # agent: 景点/天气/酒店阶段由LLM Agent决定如何调用工具（阶段结果取Agent调用工具返回的原始数据，本地行程优化同样可用）
+    # direct: 直接根据请求字段调用MCP工具，只有规划阶段调用LLM
+    agent_pipeline_mode: str = "agent"
+    # 规划阶段模式
+    # single: 一次LLM调用输出完整多日JSON
+    # sharded: 先分配景点/酒店到每天，再并发生成每天的行程，预算在本地汇总
+    # auto: 旅行天数 >= planner_shard_min_days 时使用sharded
+    planner_mode: str = "auto"
+    planner_shard_min_days: int = 4
+    # 分片模式下同时进行的单日规划LLM调用数
+    planner_shard_concurrency: int = 8
+
+    # 规划提示词压缩：把检索结果解析成紧凑表格（去重、取前K条、每段token上限）
+    prompt_compaction_enabled: bool = True
+    prompt_poi_top_k: int = 15
+    prompt_section_token_budget: int = 800
+
+    # 本地行程地理优化：按坐标把景点聚类到每天并排序游览路线（不再由LLM推理距离）
+    itinerary_optimizer_enabled: bool = True
+    # 每天最多安排的候选景点数
+    itinerary_attractions_per_day: int = 3
+
+    # 缓存配置
+    # 缓存文件目录（SQLite磁盘缓存）
+    cache_dir: str = ".cache"
+    # 完整计划缓存：相同的规划请求直接返回已生成的计划
+    plan_cache_enabled: bool = True
+    plan_cache_ttl: int = 86400  # 24小时
+    plan_cache_memory_size: int = 128
+    plan_cache_max_entries: int = 2000
+    # 检索阶段缓存：景点/酒店/天气的检索结果按阶段缓存，各自使用不同的TTL
+    stage_cache_enabled: bool = True
+    stage_cache_ttl_attractions: int = 604800  # 7天，POI变化很慢
+    stage_cache_ttl_hotels: int = 86400  # 24小时
+    stage_cache_ttl_weather: int = 1800  # 30分钟，天气预报更新频繁
+    stage_cache_max_entries: int = 5000
+    # 高德工具调用结果缓存(按工具名+参数，内存LRU + 压缩SQLite)，各类工具分别设置TTL
+    tool_cache_enabled: bool = True
+    tool_cache_memory_size: int = 1024
+    tool_cache_max_entries: int = 20000
+    tool_cache_ttl_poi: int = 604800  # 7天，POI搜索和详情
+    tool_cache_ttl_geo: int = 2592000  # 30天，地理编码几乎不变
+    tool_cache_ttl_route: int = 86400  # 24小时，路线规划
+    tool_cache_ttl_weather: int = 1800  # 30分钟
+
+    # 每个MCP服务器命令启动的进程数（调用分配给在途请求最少的进程）
+    mcp_pool_size: int = 2
+    # MCP服务器启动截止时间(秒)，包括initialize握手和tools/list
+    mcp_startup_timeout: float = 60.0
+    # MCP服务器进程意外退出后自动重启（退避时间从0.5秒起翻倍，上限为mcp_restart_backoff_max秒）
+    mcp_auto_restart: bool = True
+    mcp_restart_backoff_max: float = 30.0
+    # 每个MCP服务器进程同时等待响应的请求上限（超过后排队，排队时间计入请求超时）
+    mcp_max_pending: int = 256
+    # 每个MCP服务器进程保留的stderr日志大小(KB)，通过 /api/map/diagnostics 查看
+    mcp_stderr_buffer_kb: int = 64
+    # 把排队的MCP请求合并为JSON-RPC批量数组发送（仅在MCP服务器支持批量请求时开启）
+    mcp_batch_requests: bool = False
+
     # 日志配置
     log_level: str = "INFO"
 
@@ -1,6 +1,6 @@
 """数据模型定义"""
 
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 from pydantic import BaseModel, Field, field_validator
 from datetime import date
 
@@ -49,6 +49,22 @@ class RouteRequest(BaseModel):
     route_type: str = Field(default="walking", description="路线类型: walking/driving/transit")
 
 
+class GeocodeRequest(BaseModel):
+    """地理编码请求"""
+    address: str = Field(..., description="地址", example="北京市朝阳区阜通东大街6号")
+    city: Optional[str] = Field(default=None, description="城市", example="北京")
+
+
+class POIBatchRequest(BaseModel):
+    """批量POI搜索请求"""
+    queries: List[POISearchRequest] = Field(..., min_length=1, description="搜索条件列表（相同条件只搜索一次）")
+
+
+class GeocodeBatchRequest(BaseModel):
+    """批量地理编码请求"""
+    addresses: List[GeocodeRequest] = Field(..., min_length=1, description="地址列表（相同地址只编码一次）")
+
+
 # ============ 响应模型 ============
 
 class Location(BaseModel):
@@ -174,6 +190,22 @@ class POISearchResponse(BaseModel):
     data: List[POIInfo] = Field(default=[], description="POI列表")
 
 
+class POIBatchItem(BaseModel):
+    """批量POI搜索中的一项（顺序与请求相同）"""
+    keywords: str = Field(..., description="搜索关键词")
+    city: str = Field(..., description="城市")
+    success: bool = Field(..., description="是否成功")
+    message: str = Field(default="", description="错误信息")
+    data: List[POIInfo] = Field(default=[], description="POI列表")
+
+
+class POIBatchResponse(BaseModel):
+    """批量POI搜索响应"""
+    success: bool = Field(..., description="是否成功")
+    message: str = Field(default="", description="消息")
+    data: List[POIBatchItem] = Field(default=[], description="每个搜索条件的结果")
+
+
 class RouteInfo(BaseModel):
     """路线信息"""
     distance: float = Field(..., description="距离(米)")
@@ -189,6 +221,56 @@ class RouteResponse(BaseModel):
     data: Optional[RouteInfo] = Field(default=None, description="路线信息")
 
 
+class GeocodeBatchItem(BaseModel):
+    """批量地理编码中的一项（顺序与请求相同）"""
+    address: str = Field(..., description="地址")
+    city: Optional[str] = Field(default=None, description="城市")
+    success: bool = Field(..., description="是否成功")
+    message: str = Field(default="", description="错误信息")
+    data: Optional[Location] = Field(default=None, description="经纬度坐标")
+
+
+class GeocodeBatchResponse(BaseModel):
+    """批量地理编码响应"""
+    success: bool = Field(..., description="是否成功")
+    message: str = Field(default="", description="消息")
+    data: List[GeocodeBatchItem] = Field(default=[], description="每个地址的结果")
+
+
+class MatrixPoint(BaseModel):
+    """出行时间矩阵中的一个点（提供坐标或地址，只有地址时先做地理编码）"""
+    name: Optional[str] = Field(default=None, description="名称", example="故宫博物院")
+    location: Optional[Location] = Field(default=None, description="经纬度坐标")
+    address: Optional[str] = Field(default=None, description="地址", example="北京市东城区景山前街4号")
+    city: Optional[str] = Field(default=None, description="城市（地理编码用，默认使用请求的city）")
+
+
+class RouteMatrixRequest(BaseModel):
+    """出行时间矩阵请求"""
+    points: List[MatrixPoint] = Field(..., min_length=2, description="点列表（如一天的景点和酒店）")
+    route_type: str = Field(default="walking", description="路线类型: walking/bicycling/driving/transit")
+    city: Optional[str] = Field(default=None, description="城市（公交必填）")
+    neighbors: Optional[int] = Field(default=None, ge=0, description="每个点精确规划的近邻数，0表示全部点对")
+
+
+class RouteMatrixInfo(BaseModel):
+    """出行时间矩阵（对称，行列顺序与请求的点相同）"""
+    route_type: str = Field(..., description="路线类型")
+    names: List[str] = Field(default=[], description="点名称")
+    points: List[Location] = Field(default=[], description="点坐标")
+    durations: List[List[int]] = Field(default=[], description="时间(秒)")
+    distances: List[List[float]] = Field(default=[], description="距离(米)")
+    estimated: List[List[bool]] = Field(default=[], description="是否为球面距离估算值（被剪枝或规划失败的点对）")
+    stats: Dict[str, int] = Field(default={}, description="点对数、缓存命中数、规划数、失败数、估算数")
+
+
+class RouteMatrixResponse(BaseModel):
+    """出行时间矩阵响应"""
+    success: bool = Field(..., description="是否成功")
+    message: str = Field(default="", description="消息")
+    data: Optional[RouteMatrixInfo] = Field(default=None, description="矩阵")
+
+
 class WeatherResponse(BaseModel):
     """天气查询响应"""
     success: bool = Field(..., description="是否成功")
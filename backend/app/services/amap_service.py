@@ -1,54 +1,31 @@
 """Amap MCP Service Wrapper - LangChain Version"""
 
-from typing import List, Dict, Any, Optional
-import json
-import shutil
+import asyncio
+from typing import List, Dict, Any, Callable, Optional, Tuple
+import numpy as np
 from ..config import get_settings
-from ..models.schemas import Location, POIInfo, WeatherInfo
-from .mcp_client import get_mcp_client
+from ..models.schemas import Location, POIInfo, RouteInfo, WeatherInfo
+from ..utils.amap_parser import (
+    parse_geocode, parse_poi_detail, parse_pois, parse_route, parse_weather, tool_result_payload
+)
+from .amap_transport import get_amap_transport
+from .cache_service import make_cache_key
+from .itinerary_optimizer import distance_matrix
+from .route_matrix import (
+    MATRIX_ROUTE_TOOLS, build_matrix, load_cached_pairs, lower_bound_seconds, nearest_pairs,
+    pair_cache_key, quantize, store_cached_pairs, undominated_pairs
+)
 
-# Global MCP client instance
-_mcp_client = None
-
-
-def get_mcp_client_instance():
-    """
-    Get Amap MCP client instance (singleton pattern)
-    
-    Returns:
-        MCPClient instance
-    """
-    global _mcp_client
-    
-    if _mcp_client is None:
-        settings = get_settings()
-        
-        if not settings.amap_api_key:
-            raise ValueError("Amap API Key not configured. Please set AMAP_MAPS_API_KEY in .env file")
-        
-        # Check if uvx command exists
-        uvx_path = shutil.which("uvx")
-        if not uvx_path:
-            raise RuntimeError(
-                "uvx command not found. Please install uv: "
-                "curl -LsSf https://astral.sh/uv/install.sh | sh"
-            )
-        
-        # Create MCP client
-        env_dict = {"AMAP_MAPS_API_KEY": settings.amap_api_key}
-        _mcp_client = get_mcp_client([uvx_path, "amap-mcp-server"], env_dict)
-        
-        print(f"✅ Amap MCP client initialized successfully")
-    
-    return _mcp_client
+# 批量调用中每一项的结果：(解析后的数据, 错误信息)，成功时错误信息为None
+BatchResult = Tuple[Any, Optional[str]]
 
 
 class AmapService:
     """Amap Service Wrapper Class - LangChain Version"""
     
     def __init__(self):
-        """Initialize service"""
-        self.mcp_client = get_mcp_client_instance()
+        """Initialize service (transport: MCP subprocess or direct HTTP, see settings.amap_transport)"""
+        self.transport = get_amap_transport()
     
     def search_poi(self, keywords: str, city: str, citylimit: bool = True) -> List[POIInfo]:
         """
@@ -63,35 +40,15 @@ class AmapService:
             List of POI information
         """
         try:
-            # Call MCP tool
-            result = self.mcp_client.call_tool(
+            # Call Amap tool
+            result = self.transport.call_tool(
                 tool_name="maps_text_search",
-                arguments={
-                    "keywords": keywords,
-                    "city": city,
-                    "citylimit": str(citylimit).lower()
-                }
+                arguments=self._poi_search_arguments(keywords, city, citylimit)
             )
-            
-            # Parse result
-            result_str = ""
-            if "content" in result:
-                content = result["content"]
-                if isinstance(content, list) and len(content) > 0:
-                    result_str = content[0].get("text", json.dumps(content, ensure_ascii=False))
-                elif isinstance(content, str):
-                    result_str = content
-                else:
-                    result_str = json.dumps(content, ensure_ascii=False)
-            elif "text" in result:
-                result_str = result["text"]
-            else:
-                result_str = json.dumps(result, ensure_ascii=False)
-            
-            print(f"POI search result: {result_str[:200]}...")
-            
-            # TODO: Parse actual POI data
-            return []
+
+            pois = parse_pois(tool_result_payload(result))
+            print(f"POI search result: {len(pois)} POIs for {keywords}")
+            return pois
             
         except Exception as e:
             print(f"❌ POI search failed: {str(e)}")
@@ -108,33 +65,15 @@ class AmapService:
             List of weather information
         """
         try:
-            # Call MCP tool
-            result = self.mcp_client.call_tool(
+            # Call Amap tool
+            result = self.transport.call_tool(
                 tool_name="maps_weather",
-                arguments={
-                    "city": city
-                }
+                arguments={"city": city}
             )
-            
-            # Parse result
-            result_str = ""
-            if "content" in result:
-                content = result["content"]
-                if isinstance(content, list) and len(content) > 0:
-                    result_str = content[0].get("text", json.dumps(content, ensure_ascii=False))
-                elif isinstance(content, str):
-                    result_str = content
-                else:
-                    result_str = json.dumps(content, ensure_ascii=False)
-            elif "text" in result:
-                result_str = result["text"]
-            else:
-                result_str = json.dumps(result, ensure_ascii=False)
-            
-            print(f"Weather query result: {result_str[:200]}...")
-            
-            # TODO: Parse actual weather data
-            return []
+
+            forecasts = parse_weather(tool_result_payload(result))
+            print(f"Weather query result: {len(forecasts)} days for {city}")
+            return forecasts
             
         except Exception as e:
             print(f"❌ Weather query failed: {str(e)}")
@@ -147,7 +86,7 @@ class AmapService:
         origin_city: Optional[str] = None,
         destination_city: Optional[str] = None,
         route_type: str = "walking"
-    ) -> Dict[str, Any]:
+    ) -> Optional[RouteInfo]:
         """
         Plan route
         
@@ -159,66 +98,26 @@ class AmapService:
             route_type: Route type (walking/driving/transit)
             
         Returns:
-            Route information
+            Route information (None if no route was found)
         """
         try:
-            # Select tool based on route type
-            tool_map = {
-                "walking": "maps_direction_walking_by_address",
-                "driving": "maps_direction_driving_by_address",
-                "transit": "maps_direction_transit_integrated_by_address"
-            }
-            
-            tool_name = tool_map.get(route_type, "maps_direction_walking_by_address")
-            
-            # Build arguments
-            arguments = {
-                "origin_address": origin_address,
-                "destination_address": destination_address
-            }
-            
-            # Public transit needs city parameters
-            if route_type == "transit":
-                if origin_city:
-                    arguments["origin_city"] = origin_city
-                if destination_city:
-                    arguments["destination_city"] = destination_city
-            else:
-                # Other route types can also provide city parameters for better accuracy
-                if origin_city:
-                    arguments["origin_city"] = origin_city
-                if destination_city:
-                    arguments["destination_city"] = destination_city
-            
-            # Call MCP tool
-            result = self.mcp_client.call_tool(
+            tool_name, arguments = self._route_tool_call(
+                origin_address, destination_address, origin_city, destination_city, route_type
+            )
+
+            # Call Amap tool
+            result = self.transport.call_tool(
                 tool_name=tool_name,
                 arguments=arguments
             )
-            
-            # Parse result
-            result_str = ""
-            if "content" in result:
-                content = result["content"]
-                if isinstance(content, list) and len(content) > 0:
-                    result_str = content[0].get("text", json.dumps(content, ensure_ascii=False))
-                elif isinstance(content, str):
-                    result_str = content
-                else:
-                    result_str = json.dumps(content, ensure_ascii=False)
-            elif "text" in result:
-                result_str = result["text"]
-            else:
-                result_str = json.dumps(result, ensure_ascii=False)
-            
-            print(f"Route planning result: {result_str[:200]}...")
-            
-            # TODO: Parse actual route data
-            return {}
+
+            route = parse_route(tool_result_payload(result), route_type)
+            print(f"Route planning result: {route.description if route else 'no route'}")
+            return route
             
         except Exception as e:
             print(f"❌ Route planning failed: {str(e)}")
-            return {}
+            return None
     
     def geocode(self, address: str, city: Optional[str] = None) -> Optional[Location]:
         """
@@ -232,34 +131,14 @@ class AmapService:
             Longitude and latitude coordinates
         """
         try:
-            arguments = {"address": address}
-            if city:
-                arguments["city"] = city
-
-            result = self.mcp_client.call_tool(
+            result = self.transport.call_tool(
                 tool_name="maps_geo",
-                arguments=arguments
+                arguments=self._geocode_arguments(address, city)
             )
 
-            # Parse result
-            result_str = ""
-            if "content" in result:
-                content = result["content"]
-                if isinstance(content, list) and len(content) > 0:
-                    result_str = content[0].get("text", json.dumps(content, ensure_ascii=False))
-                elif isinstance(content, str):
-                    result_str = content
-                else:
-                    result_str = json.dumps(content, ensure_ascii=False)
-            elif "text" in result:
-                result_str = result["text"]
-            else:
-                result_str = json.dumps(result, ensure_ascii=False)
-
-            print(f"Geocode result: {result_str[:200]}...")
-
-            # TODO: Parse actual coordinate data
-            return None
+            location = parse_geocode(tool_result_payload(result))
+            print(f"Geocode result: {address} -> {location}")
+            return location
 
         except Exception as e:
             print(f"❌ Geocode failed: {str(e)}")
@@ -276,45 +155,308 @@ class AmapService:
             POI detail information
         """
         try:
-            result = self.mcp_client.call_tool(
+            result = self.transport.call_tool(
                 tool_name="maps_search_detail",
-                arguments={
-                    "id": poi_id
-                }
+                arguments={"id": poi_id}
             )
 
-            # Parse result
-            result_str = ""
-            if "content" in result:
-                content = result["content"]
-                if isinstance(content, list) and len(content) > 0:
-                    result_str = content[0].get("text", json.dumps(content, ensure_ascii=False))
-                elif isinstance(content, str):
-                    result_str = content
-                else:
-                    result_str = json.dumps(content, ensure_ascii=False)
-            elif "text" in result:
-                result_str = result["text"]
-            else:
-                result_str = json.dumps(result, ensure_ascii=False)
+            detail = parse_poi_detail(tool_result_payload(result))
+            print(f"POI detail result: {poi_id} -> {detail.get('name', '')}")
+            return detail
 
-            print(f"POI detail result: {result_str[:200]}...")
+        except Exception as e:
+            print(f"❌ Failed to get POI details: {str(e)}")
+            return {}
 
-            # Parse result and extract images
-            import re
+    # ---- 异步版本：供async路由使用，限流等待时不阻塞事件循环（acall_tool / aacquire） ----
 
-            # Try to extract JSON from result
-            json_match = re.search(r'\{.*\}', result_str, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                return data
+    async def asearch_poi(self, keywords: str, city: str, citylimit: bool = True) -> List[POIInfo]:
+        """search_poi的异步版本"""
+        try:
+            result = await self.transport.acall_tool(
+                tool_name="maps_text_search",
+                arguments=self._poi_search_arguments(keywords, city, citylimit)
+            )
+            pois = parse_pois(tool_result_payload(result))
+            print(f"POI search result: {len(pois)} POIs for {keywords}")
+            return pois
+        except Exception as e:
+            print(f"❌ POI search failed: {str(e)}")
+            return []
 
-            return {"raw": result_str}
+    async def aget_weather(self, city: str) -> List[WeatherInfo]:
+        """get_weather的异步版本"""
+        try:
+            result = await self.transport.acall_tool(tool_name="maps_weather", arguments={"city": city})
+            forecasts = parse_weather(tool_result_payload(result))
+            print(f"Weather query result: {len(forecasts)} days for {city}")
+            return forecasts
+        except Exception as e:
+            print(f"❌ Weather query failed: {str(e)}")
+            return []
 
+    async def aplan_route(
+        self,
+        origin_address: str,
+        destination_address: str,
+        origin_city: Optional[str] = None,
+        destination_city: Optional[str] = None,
+        route_type: str = "walking"
+    ) -> Optional[RouteInfo]:
+        """plan_route的异步版本"""
+        try:
+            tool_name, arguments = self._route_tool_call(
+                origin_address, destination_address, origin_city, destination_city, route_type
+            )
+            result = await self.transport.acall_tool(tool_name=tool_name, arguments=arguments)
+            route = parse_route(tool_result_payload(result), route_type)
+            print(f"Route planning result: {route.description if route else 'no route'}")
+            return route
+        except Exception as e:
+            print(f"❌ Route planning failed: {str(e)}")
+            return None
+
+    async def ageocode(self, address: str, city: Optional[str] = None) -> Optional[Location]:
+        """geocode的异步版本"""
+        try:
+            result = await self.transport.acall_tool(
+                tool_name="maps_geo",
+                arguments=self._geocode_arguments(address, city)
+            )
+            location = parse_geocode(tool_result_payload(result))
+            print(f"Geocode result: {address} -> {location}")
+            return location
+        except Exception as e:
+            print(f"❌ Geocode failed: {str(e)}")
+            return None
+
+    async def aget_poi_detail(self, poi_id: str) -> Dict[str, Any]:
+        """get_poi_detail的异步版本"""
+        try:
+            result = await self.transport.acall_tool(tool_name="maps_search_detail", arguments={"id": poi_id})
+            detail = parse_poi_detail(tool_result_payload(result))
+            print(f"POI detail result: {poi_id} -> {detail.get('name', '')}")
+            return detail
         except Exception as e:
             print(f"❌ Failed to get POI details: {str(e)}")
             return {}
 
+    async def search_poi_batch(self, queries: List[Dict[str, Any]]) -> List[BatchResult]:
+        """
+        Search POI for several queries
+
+        Args:
+            queries: [{"keywords", "city", "citylimit"}, ...]
+
+        Returns:
+            (List[POIInfo], error) per query, in input order
+        """
+        arguments_list = [
+            self._poi_search_arguments(query["keywords"], query["city"], query.get("citylimit", True))
+            for query in queries
+        ]
+        return await self._call_batch("maps_text_search", arguments_list, parse_pois)
+
+    async def geocode_batch(self, addresses: List[Dict[str, Any]]) -> List[BatchResult]:
+        """
+        Geocode several addresses
+
+        Args:
+            addresses: [{"address", "city"}, ...]
+
+        Returns:
+            (Location, error) per address, in input order
+        """
+        def parse(data: Any) -> Location:
+            location = parse_geocode(data)
+            if location is None:
+                raise ValueError("No location found")
+            return location
+
+        arguments_list = [self._geocode_arguments(item["address"], item.get("city")) for item in addresses]
+        return await self._call_batch("maps_geo", arguments_list, parse)
+
+    async def get_poi_detail_batch(self, poi_ids: List[str]) -> List[BatchResult]:
+        """
+        Get details for several POIs
+
+        Returns:
+            (detail dict, error) per POI ID, in input order
+        """
+        return await self._call_batch("maps_search_detail", [{"id": poi_id} for poi_id in poi_ids], parse_poi_detail)
+
+    async def route_matrix(
+        self,
+        locations: List[Location],
+        route_type: str = "walking",
+        city: Optional[str] = None,
+        neighbors: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Travel-time matrix between all points (see route_matrix.py)
+
+        Args:
+            locations: Points (e.g. a day's attractions and hotel)
+            route_type: walking/bicycling/driving/transit
+            city: City (required for transit)
+            neighbors: Nearest points routed exactly per point, default settings.amap_matrix_neighbors (0 = all pairs)
+
+        Returns:
+            {"route_type", "durations", "distances", "estimated", "stats"}; the matrices are symmetric n×n lists
+        """
+        settings = get_settings()
+        if route_type not in MATRIX_ROUTE_TOOLS:
+            raise ValueError(f"Unsupported route type for matrix: {route_type}")
+        if route_type == "transit" and not city:
+            raise ValueError("city is required for transit matrices")
+        check_matrix_size(len(locations))
+        neighbors = settings.amap_matrix_neighbors if neighbors is None else neighbors
+
+        coords = np.array([[location.longitude, location.latitude] for location in locations], dtype=float)
+        points = [quantize(coord, settings.amap_matrix_coord_precision) for coord in coords]
+        distances = distance_matrix(coords)
+        n = len(points)
+        all_pairs = {(i, j) for i in range(n) for j in range(i + 1, n)}
+        cache_city = city if route_type == "transit" else None
+        keys = {(i, j): pair_cache_key(route_type, points[i], points[j], cache_city) for i, j in all_pairs}
+
+        routes = load_cached_pairs(keys)
+        cached = len(routes)
+        # 量化后重合的点不需要规划
+        routes.update({(i, j): (0.0, 0) for i, j in all_pairs if points[i] == points[j]})
+
+        routed: Dict[Tuple[int, int], Tuple[float, int]] = {}
+        failed = set()
+        lower_bounds = lower_bound_seconds(distances, route_type)
+        pending = nearest_pairs(distances, neighbors) - routes.keys()
+        while pending:
+            pairs = sorted(pending)
+            results = await self._route_pairs(pairs, points, route_type, city)
+            for pair, (route, error) in zip(pairs, results):
+                if error is None:
+                    routed[pair] = routes[pair] = (route.distance, route.duration)
+                else:
+                    failed.add(pair)
+            if neighbors <= 0:
+                break
+            pending = undominated_pairs(all_pairs - routes.keys() - failed, routes, lower_bounds, neighbors)
+
+        store_cached_pairs(keys, routed, route_type)
+        stats = {
+            "points": n,
+            "pairs": len(all_pairs),
+            "cached": cached,
+            "routed": len(routed),
+            "failed": len(failed),
+            "estimated": len(all_pairs) - len(routes),
+        }
+        print(f"Route matrix ({route_type}): {stats}")
+        return {"route_type": route_type, **build_matrix(distances, routes, route_type), "stats": stats}
+
+    async def _route_pairs(
+        self,
+        pairs: List[Tuple[int, int]],
+        points: List[str],
+        route_type: str,
+        city: Optional[str]
+    ) -> List[BatchResult]:
+        """并发规划点对（起终点按坐标排序，A->B和B->A是同一次调用）"""
+        def parse(data: Any) -> RouteInfo:
+            route = parse_route(data, route_type)
+            if route is None:
+                raise ValueError("No route found")
+            return route
+
+        arguments_list = []
+        for i, j in pairs:
+            origin, destination = sorted([points[i], points[j]])
+            arguments = {"origin": origin, "destination": destination}
+            if route_type == "transit":
+                arguments["city"] = city
+                arguments["cityd"] = city
+            arguments_list.append(arguments)
+        return await self._call_batch(MATRIX_ROUTE_TOOLS[route_type], arguments_list, parse)
+
+    async def _call_batch(
+        self,
+        tool_name: str,
+        arguments_list: List[Dict[str, Any]],
+        parse: Callable[[Any], Any]
+    ) -> List[BatchResult]:
+        """
+        批量调用同一个工具
+
+        相同参数的条目只调用一次；不同参数并发调用（最多settings.amap_batch_concurrency个同时进行，
+        限流和结果缓存由传输层负责）；某一项失败只记录在该项的错误信息中，不影响其它项
+        """
+        semaphore = asyncio.Semaphore(max(1, get_settings().amap_batch_concurrency))
+
+        async def call(arguments: Dict[str, Any]) -> BatchResult:
+            async with semaphore:
+                try:
+                    result = await self.transport.acall_tool(tool_name=tool_name, arguments=arguments)
+                    return parse(tool_result_payload(result)), None
+                except Exception as e:
+                    return None, str(e) or type(e).__name__
+
+        keys = [make_cache_key(tool_name, arguments) for arguments in arguments_list]
+        unique = dict(zip(keys, arguments_list))
+        results = dict(zip(unique, await asyncio.gather(*(call(arguments) for arguments in unique.values()))))
+        failures = sum(1 for _, error in results.values() if error)
+        print(f"Batch {tool_name}: {len(arguments_list)} items, {len(unique)} calls, {failures} failed")
+        return [results[key] for key in keys]
+
+    @staticmethod
+    def _route_tool_call(
+        origin_address: str,
+        destination_address: str,
+        origin_city: Optional[str],
+        destination_city: Optional[str],
+        route_type: str
+    ) -> Tuple[str, Dict[str, Any]]:
+        """按路线类型选择按地址规划的工具并组装参数（城市参数可提高地址解析的准确度，公交必需）"""
+        tool_map = {
+            "walking": "maps_direction_walking_by_address",
+            "driving": "maps_direction_driving_by_address",
+            "transit": "maps_direction_transit_integrated_by_address"
+        }
+        tool_name = tool_map.get(route_type, "maps_direction_walking_by_address")
+
+        arguments = {
+            "origin_address": origin_address,
+            "destination_address": destination_address
+        }
+        if origin_city:
+            arguments["origin_city"] = origin_city
+        if destination_city:
+            arguments["destination_city"] = destination_city
+        return tool_name, arguments
+
+    @staticmethod
+    def _poi_search_arguments(keywords: str, city: str, citylimit: bool = True) -> Dict[str, Any]:
+        return {"keywords": keywords, "city": city, "citylimit": str(citylimit).lower()}
+
+    @staticmethod
+    def _geocode_arguments(address: str, city: Optional[str] = None) -> Dict[str, Any]:
+        arguments = {"address": address}
+        if city:
+            arguments["city"] = city
+        return arguments
+
+
+def check_batch_size(count: int):
+    """批量接口的条目数上限（settings.amap_batch_max_items），超出时抛出ValueError"""
+    limit = get_settings().amap_batch_max_items
+    if count > limit:
+        raise ValueError(f"Too many items in one batch: {count} (max {limit})")
+
+
+def check_matrix_size(count: int):
+    """出行时间矩阵的点数上限（settings.amap_matrix_max_points），超出时抛出ValueError"""
+    limit = get_settings().amap_matrix_max_points
+    if count > limit:
+        raise ValueError(f"Too many points in one matrix: {count} (max {limit})")
+
 
 # 创建全局服务实例
 _amap_service = None
@@ -0,0 +1,530 @@
+"""
+高德地图调用的传输层
+
+AmapService和LangChain工具都通过传输层调用高德地图，接口与MCPClient相同
+（call_tool / acall_tool / available_tools / diagnostics，工具名使用amap-mcp-server的名称），
+返回值也是MCP格式 {"content": [{"type": "text", "text": "<JSON>"}]}，所以上层不需要关心底层实现：
+
+- mcp:  经由 uvx amap-mcp-server 子进程（JSON-RPC over stdio，见mcp_client.py）
+- http: 进程内的 httpx.AsyncClient 直接请求高德REST API，连接保持复用（keep-alive），
+        没有子进程和两次序列化，不需要uvx
+
+通过 settings.amap_transport 选择，get_amap_transport() 返回全局共享的传输实例，外面按需包装：
+CachedAmapTransport（按工具名+规范化参数缓存结果）-> RateLimitedTransport（令牌桶和日配额）-> 传输
+缓存命中不经过限流，也不消耗配额
+"""
+
+import asyncio
+import concurrent.futures
+import copy
+import json
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from ..config import Settings, get_settings
+from .cache_service import TieredCache, get_tool_cache, get_tool_cache_ttl, make_cache_key
+from .mcp_client import MCPToolError, get_mcp_client, run_on_mcp_loop
+from .rate_limiter import RateLimiter, parse_rate_overrides
+from ..utils.amap_parser import payload_error
+
+DEFAULT_REST_BASE_URL = "https://restapi.amap.com"
+
+# MCP工具名 -> (REST路径, 固定参数)
+REST_ENDPOINTS: Dict[str, Tuple[str, Dict[str, str]]] = {
+    "maps_text_search": ("/v3/place/text", {}),
+    "maps_around_search": ("/v3/place/around", {}),
+    "maps_search_detail": ("/v3/place/detail", {}),
+    "maps_weather": ("/v3/weather/weatherInfo", {"extensions": "all"}),
+    "maps_geo": ("/v3/geocode/geo", {}),
+    "maps_regeocode": ("/v3/geocode/regeo", {}),
+    "maps_ip_location": ("/v3/ip", {}),
+    "maps_distance": ("/v3/distance", {}),
+    "maps_direction_walking": ("/v3/direction/walking", {}),
+    "maps_direction_driving": ("/v3/direction/driving", {}),
+    "maps_direction_bicycling": ("/v4/direction/bicycling", {}),
+    "maps_direction_transit_integrated": ("/v3/direction/transit/integrated", {}),
+}
+
+# 按地址规划路线的工具：先地理编码起终点，再调用按坐标规划的工具
+ADDRESS_ROUTE_TOOLS = {
+    "maps_direction_walking_by_address": "maps_direction_walking",
+    "maps_direction_driving_by_address": "maps_direction_driving",
+    "maps_direction_transit_integrated_by_address": "maps_direction_transit_integrated",
+}
+
+# 一次工具调用实际消耗的高德请求数（按地址规划 = 两次地理编码 + 一次路线），未列出的为1
+TOOL_REQUEST_COSTS = {name: 3 for name in ADDRESS_ROUTE_TOOLS}
+
+
+class UvxNotFoundError(RuntimeError):
+    """mcp传输需要uvx启动amap-mcp-server，但uvx不存在"""
+
+
+class AmapAPIError(MCPToolError):
+    """高德REST API返回了错误状态（工具级错误，与MCPToolError含义相同）"""
+
+
+class AmapHTTPTransport:
+    """
+    高德REST API传输 - 接口与MCPClient相同
+
+    httpx.AsyncClient运行在共享的MCP后台事件循环中（与MCP客户端相同），
+    所以同步调用(call_tool)可以在任意线程中使用，异步调用(acall_tool)可以在任意事件循环中await；
+    连接池保持长连接，并发请求共享连接而不是每次重新握手
+    """
+
+    kind = "http"
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = DEFAULT_REST_BASE_URL,
+        timeout: float = 10.0,
+        max_connections: int = 20
+    ):
+        """
+        初始化HTTP传输
+
+        Args:
+            api_key: 高德Web服务API Key
+            base_url: REST API地址（测试时指向本地桩服务器）
+            timeout: 单个请求的超时(秒)
+            max_connections: 连接池大小（同时也是保持的长连接数）
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+
+        self.total_calls = 0
+        self.total_failures = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def initialized(self) -> bool:
+        return self._client is not None and not self._client.is_closed
+
+    @property
+    def available_tools(self) -> List[str]:
+        """支持的工具名称（与amap-mcp-server同名）"""
+        return list(REST_ENDPOINTS) + list(ADDRESS_ROUTE_TOOLS)
+
+    def has_tool(self, tool_name: str) -> bool:
+        return tool_name in REST_ENDPOINTS or tool_name in ADDRESS_ROUTE_TOOLS
+
+    async def _start(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return True
+
+    def start(self):
+        """创建连接池（不需要启动任何进程）"""
+        return run_on_mcp_loop(self._start()).result()
+
+    async def astart(self):
+        """start的异步版本"""
+        return await asyncio.wrap_future(run_on_mcp_loop(self._start()))
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        调用高德工具（同步）
+
+        Args:
+            tool_name: 工具名称，如 "maps_text_search"
+            arguments: 工具参数（与amap-mcp-server相同）
+            timeout: 超时(秒)，默认使用self.timeout
+
+        Returns:
+            MCP格式的结果
+        """
+        return run_on_mcp_loop(self._call_tool(tool_name, arguments, timeout)).result()
+
+    async def acall_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """调用高德工具（异步）"""
+        return await asyncio.wrap_future(run_on_mcp_loop(self._call_tool(tool_name, arguments, timeout)))
+
+    async def _call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+        await self._start()
+        self.total_calls += 1
+        try:
+            if tool_name in ADDRESS_ROUTE_TOOLS:
+                data = await self._route_by_address(ADDRESS_ROUTE_TOOLS[tool_name], arguments, timeout)
+            else:
+                data = await self._request(tool_name, arguments, timeout)
+        except Exception as e:
+            self.total_failures += 1
+            self.last_error = str(e)
+            raise
+        return {"content": [{"type": "text", "text": json.dumps(data, ensure_ascii=False)}]}
+
+    async def _request(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+        """请求一个REST接口，返回解析后的JSON（status不为1时抛出AmapAPIError）"""
+        if tool_name not in REST_ENDPOINTS:
+            raise AmapAPIError(f"Unknown tool: {tool_name}")
+        path, fixed_params = REST_ENDPOINTS[tool_name]
+        params = {key: str(value) for key, value in arguments.items() if value is not None}
+        params.update(fixed_params)
+        params["key"] = self.api_key
+
+        try:
+            response = await self._client.get(path, params=params, timeout=timeout or self.timeout)
+        except httpx.TimeoutException:
+            raise TimeoutError(f"Amap request {tool_name} timed out")
+        response.raise_for_status()
+        data = response.json()
+
+        # v3接口用status/info，v4接口（骑行）用errcode/errmsg
+        if str(data.get("status", "1")) != "1" or data.get("errcode", 0) not in (0, "0"):
+            message = data.get("info") or data.get("errmsg") or "unknown error"
+            raise AmapAPIError(f"Amap {tool_name} failed: {message} ({data.get('infocode') or data.get('errcode')})")
+        return data
+
+    async def _route_by_address(self, route_tool: str, arguments: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+        """按地址规划路线：并发地理编码起终点，再按坐标规划"""
+        origin_city = arguments.get("origin_city")
+        destination_city = arguments.get("destination_city")
+        origin, destination = await asyncio.gather(
+            self._geocode(arguments["origin_address"], origin_city, timeout),
+            self._geocode(arguments["destination_address"], destination_city, timeout),
+        )
+
+        route_arguments = {"origin": origin, "destination": destination}
+        if route_tool == "maps_direction_transit_integrated":
+            route_arguments["city"] = origin_city
+            route_arguments["cityd"] = destination_city or origin_city
+        data = await self._request(route_tool, route_arguments, timeout)
+        data["origin"] = origin
+        data["destination"] = destination
+        return data
+
+    async def _geocode(self, address: str, city: Optional[str], timeout: Optional[float]) -> str:
+        """地址 -> "经度,纬度" """
+        data = await self._request("maps_geo", {"address": address, "city": city}, timeout)
+        geocodes = data.get("geocodes") or []
+        if not geocodes or not geocodes[0].get("location"):
+            raise AmapAPIError(f"Amap maps_geo found no location for {address}")
+        return geocodes[0]["location"]
+
+    def diagnostics(self, stderr_lines: int = 50) -> Dict[str, Any]:
+        """诊断信息（没有子进程，所以没有stderr日志）"""
+        return {
+            "transport": "http",
+            "base_url": self.base_url,
+            "initialized": self.initialized,
+            "max_connections": self.max_connections,
+            "total_calls": self.total_calls,
+            "total_failures": self.total_failures,
+            "last_error": self.last_error,
+        }
+
+    def stop(self):
+        """关闭连接池"""
+        client, self._client = self._client, None
+        if client is None:
+            return
+        try:
+            run_on_mcp_loop(client.aclose()).result(timeout=10)
+        except Exception:
+            pass
+
+
+class CachedAmapTransport:
+    """
+    带结果缓存的传输 - 接口与被包装的传输相同
+
+    大多数高德工具对相同参数返回相同结果，景点Agent、酒店Agent和/api/map/*路由的重复调用
+    不必每次都请求网络：
+    - 缓存键：传输类型 + 工具名 + 规范JSON参数（make_cache_key，参数顺序无关）
+    - TTL按工具分组（get_tool_cache_ttl），TTL为0的工具不缓存；错误结果不缓存
+    - 单飞：同一时刻相同的调用只有第一个真正请求，其余等待它的结果（同步和异步调用方都适用）
+    - cache_stats()/diagnostics() 提供按工具的命中、未命中、合并计数
+    """
+
+    def __init__(
+        self,
+        transport,
+        cache: TieredCache,
+        ttl_for: Callable[[str], float] = get_tool_cache_ttl
+    ):
+        """
+        Args:
+            transport: 被包装的传输（AmapHTTPTransport或MCPClientPool）
+            cache: 结果缓存
+            ttl_for: 工具名 -> TTL(秒)
+        """
+        self.transport = transport
+        self.cache = cache
+        self.ttl_for = ttl_for
+        # 不同传输返回的文本格式不同，缓存键按传输类型区分
+        self.namespace = getattr(transport, "kind", "mcp")
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._tool_stats: Dict[str, Dict[str, int]] = {}
+
+    def __getattr__(self, name: str):
+        # 其余属性（members、pending_stats等）直接使用被包装的传输
+        return getattr(self.transport, name)
+
+    @property
+    def initialized(self) -> bool:
+        return self.transport.initialized
+
+    @property
+    def available_tools(self) -> List[str]:
+        return self.transport.available_tools
+
+    def _count(self, tool_name: str, field: str):
+        with self._lock:
+            counts = self._tool_stats.setdefault(tool_name, {"hits": 0, "misses": 0, "coalesced": 0, "uncached": 0})
+            counts[field] += 1
+
+    def _lookup(self, tool_name: str, arguments: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """返回(缓存键, 缓存的结果)；不缓存的工具返回(None, None)"""
+        if self.ttl_for(tool_name) <= 0:
+            self._count(tool_name, "uncached")
+            return None, None
+        key = make_cache_key(f"tool:{self.namespace}:{tool_name}", arguments)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._count(tool_name, "hits")
+            return key, json.loads(cached)
+        return key, None
+
+    def _join(self, key: str) -> Tuple[concurrent.futures.Future, bool]:
+        """加入相同调用的单飞：返回(共享的Future, 是否由自己发起请求)"""
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                return shared, False
+            shared = concurrent.futures.Future()
+            # 标记为运行中：等待者被取消时不会连带取消共享的Future
+            shared.set_running_or_notify_cancel()
+            self._inflight[key] = shared
+            return shared, True
+
+    def _finish(self, tool_name: str, key: str, shared: concurrent.futures.Future, result=None, error=None):
+        """发起者完成请求：先写入缓存再结束单飞（之后的调用直接命中缓存），然后通知等待者"""
+        if error is None and _is_cacheable(result):
+            try:
+                self.cache.set(key, json.dumps(result, ensure_ascii=False), ttl=self.ttl_for(tool_name))
+            except Exception as e:
+                print(f"⚠️  Tool cache write failed: {str(e)}")
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            shared.set_exception(error if isinstance(error, Exception) else RuntimeError(f"Amap {tool_name} call cancelled"))
+        else:
+            shared.set_result(result)
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """调用工具（同步），命中缓存时不请求网络"""
+        key, cached = self._lookup(tool_name, arguments)
+        if cached is not None:
+            return cached
+        if key is None:
+            return self.transport.call_tool(tool_name, arguments, timeout)
+
+        shared, leader = self._join(key)
+        if not leader:
+            self._count(tool_name, "coalesced")
+            return copy.deepcopy(shared.result())
+        self._count(tool_name, "misses")
+        try:
+            result = self.transport.call_tool(tool_name, arguments, timeout)
+        except BaseException as e:
+            self._finish(tool_name, key, shared, error=e)
+            raise
+        self._finish(tool_name, key, shared, result=result)
+        return result
+
+    async def acall_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """调用工具（异步），命中缓存时不请求网络"""
+        key, cached = self._lookup(tool_name, arguments)
+        if cached is not None:
+            return cached
+        if key is None:
+            return await self.transport.acall_tool(tool_name, arguments, timeout)
+
+        shared, leader = self._join(key)
+        if not leader:
+            self._count(tool_name, "coalesced")
+            return copy.deepcopy(await asyncio.wrap_future(shared))
+        self._count(tool_name, "misses")
+        try:
+            result = await self.transport.acall_tool(tool_name, arguments, timeout)
+        except BaseException as e:
+            self._finish(tool_name, key, shared, error=e)
+            raise
+        self._finish(tool_name, key, shared, result=result)
+        return result
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """缓存统计：总体命中率和按工具的计数"""
+        with self._lock:
+            tools = {name: dict(counts) for name, counts in self._tool_stats.items()}
+        return {**self.cache.stats(), "in_flight": len(self._inflight), "tools": tools}
+
+    def diagnostics(self, stderr_lines: int = 50) -> Dict[str, Any]:
+        return {**self.transport.diagnostics(stderr_lines), "tool_cache": self.cache_stats()}
+
+
+class RateLimitedTransport:
+    """
+    带限流的传输 - 接口与被包装的传输相同
+
+    每次调用先从RateLimiter获取令牌（Key总桶 + 工具桶）并消耗当天配额：
+    - 令牌不足时排队等待（同步调用阻塞当前线程，异步调用只挂起协程），超过max_wait才失败
+    - 配额用完时直接抛出QuotaExceededError，不再请求高德
+    - 高德返回QPS/日配额超限的错误时，据此清空令牌或标记配额用完
+    """
+
+    def __init__(self, transport, limiter: RateLimiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    def __getattr__(self, name: str):
+        return getattr(self.transport, name)
+
+    @property
+    def initialized(self) -> bool:
+        return self.transport.initialized
+
+    @property
+    def available_tools(self) -> List[str]:
+        return self.transport.available_tools
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """调用工具（同步），等待令牌后发出"""
+        self.limiter.acquire(tool_name, TOOL_REQUEST_COSTS.get(tool_name, 1))
+        try:
+            result = self.transport.call_tool(tool_name, arguments, timeout)
+        except Exception as e:
+            self.limiter.report_limit_error(tool_name, str(e))
+            raise
+        self._check_result(tool_name, result)
+        return result
+
+    async def acall_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """调用工具（异步），等待令牌后发出"""
+        await self.limiter.aacquire(tool_name, TOOL_REQUEST_COSTS.get(tool_name, 1))
+        try:
+            result = await self.transport.acall_tool(tool_name, arguments, timeout)
+        except Exception as e:
+            self.limiter.report_limit_error(tool_name, str(e))
+            raise
+        self._check_result(tool_name, result)
+        return result
+
+    def _check_result(self, tool_name: str, result: Any):
+        """MCP服务器把高德的错误放在结果文本里返回"""
+        if not _is_cacheable(result):
+            self.limiter.report_limit_error(tool_name, json.dumps(result, ensure_ascii=False))
+
+    def diagnostics(self, stderr_lines: int = 50) -> Dict[str, Any]:
+        return {**self.transport.diagnostics(stderr_lines), "rate_limit": self.limiter.stats()}
+
+
+def _is_cacheable(result: Any) -> bool:
+    """只缓存成功的结果：MCP的isError结果和带错误信息的文本不缓存"""
+    if not isinstance(result, dict) or result.get("isError"):
+        return False
+    for item in result.get("content") or []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            data = json.loads(item.get("text") or "null")
+        except ValueError:
+            continue
+        if payload_error(data) is not None:
+            return False
+    return True
+
+
+def create_amap_transport(settings: Settings):
+    """
+    根据配置创建传输
+
+    Returns:
+        AmapHTTPTransport（http）或MCPClientPool（mcp）
+
+    Raises:
+        ValueError: 未配置高德API Key
+        UvxNotFoundError: mcp传输需要的uvx不存在
+    """
+    if not settings.amap_api_key:
+        raise ValueError("Amap API Key not configured. Please set AMAP_MAPS_API_KEY in .env file")
+
+    if settings.amap_transport == "http":
+        transport = AmapHTTPTransport(
+            settings.amap_api_key,
+            base_url=settings.amap_rest_base_url,
+            timeout=settings.amap_http_timeout,
+            max_connections=settings.amap_http_max_connections
+        )
+        transport.start()
+        print(f"✅ Amap HTTP transport initialized ({transport.base_url})")
+        return transport
+
+    # Check if uvx command exists
+    uvx_path = shutil.which("uvx")
+    if not uvx_path:
+        raise UvxNotFoundError(
+            "uvx command not found. Please install uv: "
+            "curl -LsSf https://astral.sh/uv/install.sh | sh"
+        )
+    env_dict = {"AMAP_MAPS_API_KEY": settings.amap_api_key}
+    transport = get_mcp_client([uvx_path, "amap-mcp-server"], env_dict)
+    print(f"✅ Amap MCP transport initialized")
+    return transport
+
+
+# 全局传输实例（单例模式）
+_amap_transport = None
+_amap_transport_lock = threading.Lock()
+
+
+def get_amap_transport():
+    """获取全局共享的高德传输实例（按settings.amap_transport选择mcp或http，按配置加上限流和结果缓存）"""
+    global _amap_transport
+
+    with _amap_transport_lock:
+        if _amap_transport is None:
+            settings = get_settings()
+            transport = create_amap_transport(settings)
+            if settings.amap_rate_limit_enabled:
+                transport = RateLimitedTransport(transport, RateLimiter(
+                    key_qps=settings.amap_key_qps,
+                    tool_qps=settings.amap_tool_qps,
+                    tool_qps_overrides=parse_rate_overrides(settings.amap_tool_qps_overrides),
+                    daily_quota=settings.amap_daily_quota,
+                    max_wait=settings.amap_rate_limit_max_wait
+                ))
+            cache = get_tool_cache()
+            _amap_transport = CachedAmapTransport(transport, cache) if cache is not None else transport
+        return _amap_transport
@@ -0,0 +1,107 @@
+"""
+预算服务 - 在本地确定性地计算旅行预算
+
+原来Budget汇总由LLM在规划JSON中直接给出，既消耗输出token，加法也经常算错。
+这里根据每天的明细计算：
+- 景点：attractions[].ticket_price
+- 餐饮：meals[].estimated_cost
+- 酒店：hotel.estimated_cost（每天一晚）
+- 交通：按TripRequest.transportation的费用模型，根据当天路线距离估算
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+from ..models.schemas import Budget, DayPlan
+from .itinerary_optimizer import haversine_km
+
+# 城市道路距离约为直线距离的1.3倍
+ROAD_DISTANCE_FACTOR = 1.3
+
+# 步行可接受的单段最远距离(公里)，混合模式下更远的路段改乘公共交通
+WALKING_MAX_KM = 1.5
+
+
+def public_transit_fare(km: float) -> int:
+    """地铁/公交单程票价：6公里内3元，之后每多10公里加1元（参考北京地铁计价）"""
+    if km <= 0:
+        return 0
+    if km <= 6:
+        return 3
+    return 3 + int((km - 6) // 10) + 1
+
+
+def driving_cost(km: float) -> float:
+    """自驾单段油费：约0.8元/公里"""
+    return 0.8 * km
+
+
+# 自驾每天的停车费
+DRIVING_DAILY_PARKING = 30
+
+
+def estimate_leg_cost(transportation: str, km: float) -> float:
+    """
+    单段路程的交通费用
+
+    Args:
+        transportation: 交通方式（公共交通/自驾/步行/混合）
+        km: 道路距离(公里)
+    """
+    if transportation == "步行":
+        return 0
+    if transportation == "自驾":
+        return driving_cost(km)
+    if transportation == "混合":
+        return 0 if km <= WALKING_MAX_KM else public_transit_fare(km)
+    # 公共交通及未知方式
+    return public_transit_fare(km)
+
+
+def day_route_legs(day: DayPlan) -> List[float]:
+    """
+    当天各段路程的道路距离(公里)
+
+    酒店有坐标时包含 酒店->第一个景点 和 最后一个景点->酒店 两段
+    """
+    points: List[Tuple[float, float]] = [
+        (attraction.location.longitude, attraction.location.latitude) for attraction in day.attractions
+    ]
+    if day.hotel and day.hotel.location and points:
+        hotel = (day.hotel.location.longitude, day.hotel.location.latitude)
+        points = [hotel] + points + [hotel]
+    return [
+        float(haversine_km(start[0], start[1], end[0], end[1])) * ROAD_DISTANCE_FACTOR
+        for start, end in zip(points, points[1:])
+    ]
+
+
+def estimate_day_transportation(day: DayPlan, transportation: Optional[str] = None) -> int:
+    """估算一天的交通费用(元)，交通方式默认取DayPlan.transportation"""
+    mode = (transportation or day.transportation or "").strip()
+    legs = day_route_legs(day)
+    cost = sum(estimate_leg_cost(mode, km) for km in legs)
+    if mode == "自驾" and legs:
+        cost += DRIVING_DAILY_PARKING
+    return int(round(cost))
+
+
+def compute_budget(days: Iterable[DayPlan], transportation: Optional[str] = None) -> Budget:
+    """
+    根据每日明细计算预算汇总
+
+    Args:
+        days: 每日行程
+        transportation: 交通方式（TripRequest.transportation），为None时使用每天自己的交通方式
+
+    Returns:
+        各项合计与总计都由本地计算的Budget
+    """
+    days = list(days)
+    budget = Budget(
+        total_attractions=sum(attraction.ticket_price for day in days for attraction in day.attractions),
+        total_hotels=sum(day.hotel.estimated_cost for day in days if day.hotel),
+        total_meals=sum(meal.estimated_cost for day in days for meal in day.meals),
+        total_transportation=sum(estimate_day_transportation(day, transportation) for day in days),
+    )
+    budget.total = budget.total_attractions + budget.total_hotels + budget.total_meals + budget.total_transportation
+    return budget
@@ -0,0 +1,349 @@
+"""
+缓存服务 - 内存LRU + SQLite磁盘两级缓存
+
+用于缓存代价高昂的结果（完整旅行计划、检索阶段输出等）：
+1. 内存层：OrderedDict实现的LRU，进程内毫秒级命中
+2. 磁盘层：SQLite，进程重启后仍然有效，按TTL过期、按条目数淘汰；可选zlib压缩存储
+
+缓存值统一为字符串（通常是JSON），由调用方负责序列化。
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from ..config import get_settings
+
+
+def make_cache_key(namespace: str, payload: Any) -> str:
+    """
+    根据命名空间和可JSON序列化的内容生成缓存键
+
+    payload会以sort_keys的规范JSON形式参与哈希，字典键顺序不影响结果
+    """
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class LRUCache:
+    """线程安全的内存LRU缓存（条目带过期时间）"""
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """返回(过期时间, 值)，不存在或已过期时返回None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    SQLite磁盘缓存
+
+    - 读取时删除已过期条目
+    - 写入后若条目数超过max_entries，先清理过期条目，再按最近访问时间淘汰
+    - compress=True时值以zlib压缩的BLOB存储（读取时两种格式都支持）
+    """
+
+    def __init__(self, path: str, max_entries: int = 2000, compress: bool = False):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.compress = compress
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """返回(过期时间, 值)，不存在或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if isinstance(value, bytes):
+                value = zlib.decompress(value).decode("utf-8")
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return expires_at, value
+
+    def set(self, key: str, value: str, expires_at: float):
+        now = time.time()
+        stored = zlib.compress(value.encode("utf-8")) if self.compress else value
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, stored, expires_at, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    " SELECT key FROM cache ORDER BY accessed_at ASC"
+                    " LIMIT max(0, (SELECT COUNT(*) FROM cache) - ?))",
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class TieredCache:
+    """
+    两级缓存：先查内存LRU，再查SQLite；磁盘命中会回填内存层
+
+    Args:
+        name: 缓存名称（用于日志和统计）
+        ttl: 默认过期时间(秒)
+        memory_size: 内存层最大条目数
+        disk_path: SQLite文件路径，为None时只使用内存层
+        max_disk_entries: 磁盘层最大条目数
+        compress: 磁盘层是否zlib压缩存储
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        memory_size: int = 128,
+        disk_path: Optional[str] = None,
+        max_disk_entries: int = 2000,
+        compress: bool = False
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.memory = LRUCache(memory_size)
+        self.disk = SQLiteCache(disk_path, max_disk_entries, compress) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            try:
+                entry = self.disk.get(key)
+            except (sqlite3.Error, zlib.error) as e:
+                print(f"⚠️  {self.name} cache disk read failed: {str(e)}")
+                entry = None
+            if entry is not None:
+                self.memory.set(key, entry[1], entry[0])
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self.memory.set(key, value, expires_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, expires_at)
+            except sqlite3.Error as e:
+                print(f"⚠️  {self.name} cache disk write failed: {str(e)}")
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+        }
+
+
+# 全局计划缓存实例
+_plan_cache: Optional[TieredCache] = None
+
+
+def get_plan_cache() -> Optional[TieredCache]:
+    """获取完整旅行计划缓存(单例模式)，未启用时返回None"""
+    global _plan_cache
+
+    settings = get_settings()
+    if not settings.plan_cache_enabled:
+        return None
+
+    if _plan_cache is None:
+        _plan_cache = TieredCache(
+            name="plan",
+            ttl=settings.plan_cache_ttl,
+            memory_size=settings.plan_cache_memory_size,
+            disk_path=str(Path(settings.cache_dir) / "plan_cache.sqlite3"),
+            max_disk_entries=settings.plan_cache_max_entries
+        )
+
+    return _plan_cache
+
+
+# 全局检索阶段缓存实例
+_stage_cache: Optional[TieredCache] = None
+
+
+def get_stage_cache() -> Optional[TieredCache]:
+    """
+    获取检索阶段缓存(单例模式)，未启用时返回None
+
+    所有阶段共用一个缓存实例，写入时按阶段传入各自的TTL（见get_stage_cache_ttl）
+    """
+    global _stage_cache
+
+    settings = get_settings()
+    if not settings.stage_cache_enabled:
+        return None
+
+    if _stage_cache is None:
+        _stage_cache = TieredCache(
+            name="stage",
+            ttl=settings.stage_cache_ttl_hotels,
+            memory_size=512,
+            disk_path=str(Path(settings.cache_dir) / "stage_cache.sqlite3"),
+            max_disk_entries=settings.stage_cache_max_entries
+        )
+
+    return _stage_cache
+
+
+def get_stage_cache_ttl(stage: str) -> int:
+    """检索阶段的缓存TTL(秒)：天气最短，POI最长"""
+    settings = get_settings()
+    return {
+        "attractions": settings.stage_cache_ttl_attractions,
+        "hotels": settings.stage_cache_ttl_hotels,
+        "weather": settings.stage_cache_ttl_weather,
+    }.get(stage, settings.stage_cache_ttl_hotels)
+
+
+# 高德工具调用结果的TTL分组：工具名 -> 分组
+TOOL_CACHE_GROUPS = {
+    "maps_text_search": "poi",
+    "maps_around_search": "poi",
+    "maps_search_detail": "poi",
+    "maps_geo": "geo",
+    "maps_regeocode": "geo",
+    "maps_distance": "route",
+    "maps_direction_walking": "route",
+    "maps_direction_driving": "route",
+    "maps_direction_bicycling": "route",
+    "maps_direction_transit_integrated": "route",
+    "maps_direction_walking_by_address": "route",
+    "maps_direction_driving_by_address": "route",
+    "maps_direction_transit_integrated_by_address": "route",
+    "maps_weather": "weather",
+}
+
+# 全局工具调用缓存实例
+_tool_cache: Optional[TieredCache] = None
+
+
+def get_tool_cache() -> Optional[TieredCache]:
+    """
+    获取高德工具调用结果缓存(单例模式)，未启用时返回None
+
+    磁盘层压缩存储（POI搜索结果是较大的JSON），写入时按工具传入各自的TTL（见get_tool_cache_ttl）
+    """
+    global _tool_cache
+
+    settings = get_settings()
+    if not settings.tool_cache_enabled:
+        return None
+
+    if _tool_cache is None:
+        _tool_cache = TieredCache(
+            name="tool",
+            ttl=settings.tool_cache_ttl_poi,
+            memory_size=settings.tool_cache_memory_size,
+            disk_path=str(Path(settings.cache_dir) / "tool_cache.sqlite3"),
+            max_disk_entries=settings.tool_cache_max_entries,
+            compress=True
+        )
+
+    return _tool_cache
+
+
+def get_tool_cache_ttl(tool_name: str) -> int:
+    """高德工具调用结果的缓存TTL(秒)，0表示不缓存（未列出的工具，如IP定位）"""
+    settings = get_settings()
+    return {
+        "poi": settings.tool_cache_ttl_poi,
+        "geo": settings.tool_cache_ttl_geo,
+        "route": settings.tool_cache_ttl_route,
+        "weather": settings.tool_cache_ttl_weather,
+    }.get(TOOL_CACHE_GROUPS.get(tool_name), 0)
@@ -0,0 +1,195 @@
+"""
+行程地理优化 - 在本地决定每天去哪些景点以及游览顺序
+
+规划提示词原本要求LLM"考虑景点之间的距离"，这种推理既慢又不可靠。
+这里直接用坐标计算：
+1. 均衡聚类：把候选景点分成travel_days个紧凑的组（k-means，每组容量上限相同）
+2. 路线排序：每组内用最近邻 + 2-opt 求近似最短游览顺序（开放路径）
+
+距离统一使用向量化的haversine球面距离（公里）。
+"""
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..models.schemas import DayPlan
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lng1, lat1, lng2, lat2) -> np.ndarray:
+    """球面距离(公里)，参数可以是标量或可广播的数组"""
+    lng1, lat1, lng2, lat2 = (np.radians(np.asarray(value, dtype=float)) for value in (lng1, lat1, lng2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix(coords: np.ndarray, others: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    两组坐标之间的距离矩阵
+
+    Args:
+        coords: (n, 2) 数组，每行为 [经度, 纬度]
+        others: (m, 2) 数组，默认与coords相同
+
+    Returns:
+        (n, m) 距离矩阵(公里)
+    """
+    coords = np.asarray(coords, dtype=float)
+    others = coords if others is None else np.asarray(others, dtype=float)
+    return haversine_km(coords[:, None, 0], coords[:, None, 1], others[None, :, 0], others[None, :, 1])
+
+
+def balanced_kmeans(coords: np.ndarray, k: int, max_iter: int = 50) -> np.ndarray:
+    """
+    均衡k-means聚类
+
+    每组最多 ceil(n/k) 个点且不为空，保证每天的景点数量接近。
+    初始中心用确定性的最远点采样（第一个中心取第一个点，即搜索相关度最高的POI），
+    因此同样的输入总是得到同样的分组。
+
+    Returns:
+        长度为n的组号数组
+    """
+    coords = np.asarray(coords, dtype=float)
+    n = len(coords)
+    if k <= 0 or n < k:
+        raise ValueError(f"Cannot split {n} points into {k} groups")
+
+    capacity = math.ceil(n / k)
+    centers = [0]
+    nearest = distance_matrix(coords, coords[:1])[:, 0]
+    while len(centers) < k:
+        farthest = int(np.argmax(nearest))
+        centers.append(farthest)
+        nearest = np.minimum(nearest, distance_matrix(coords, coords[farthest:farthest + 1])[:, 0])
+    centroids = coords[centers].copy()
+
+    labels = np.full(n, -1)
+    for _ in range(max_iter):
+        new_labels = _assign_with_capacity(distance_matrix(coords, centroids), capacity)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        centroids = np.array([coords[labels == group].mean(axis=0) for group in range(k)])
+    return labels
+
+
+def _assign_with_capacity(distances: np.ndarray, capacity: int) -> np.ndarray:
+    """按距离从小到大贪心分配，组满后顺延到下一个最近的组；空组从最大的组借一个最近的点"""
+    n, k = distances.shape
+    labels = np.full(n, -1)
+    sizes = np.zeros(k, dtype=int)
+    for flat_index in np.argsort(distances, axis=None, kind="stable"):
+        point, group = divmod(int(flat_index), k)
+        if labels[point] == -1 and sizes[group] < capacity:
+            labels[point] = group
+            sizes[group] += 1
+
+    for group in np.flatnonzero(sizes == 0):
+        donor = int(np.argmax(sizes))
+        members = np.flatnonzero(labels == donor)
+        point = members[int(np.argmin(distances[members, group]))]
+        labels[point] = group
+        sizes[donor] -= 1
+        sizes[group] += 1
+    return labels
+
+
+def order_route(coords: np.ndarray, start: Optional[Sequence[float]] = None) -> List[int]:
+    """
+    求近似最短的游览顺序（开放路径，不回到起点）
+
+    Args:
+        coords: (n, 2) 景点坐标
+        start: 可选的出发点 [经度, 纬度]（如酒店），第一个景点取离它最近的
+
+    Returns:
+        景点下标的游览顺序
+    """
+    coords = np.asarray(coords, dtype=float)
+    n = len(coords)
+    if n <= 1:
+        return list(range(n))
+
+    distances = distance_matrix(coords)
+    if start is not None:
+        first = int(np.argmin(distance_matrix(coords, np.asarray([start], dtype=float))[:, 0]))
+    else:
+        first = 0
+
+    # 最近邻构造初始路线
+    order = [first]
+    visited = np.zeros(n, dtype=bool)
+    visited[first] = True
+    for _ in range(n - 1):
+        remaining = np.where(visited, np.inf, distances[order[-1]])
+        next_point = int(np.argmin(remaining))
+        order.append(next_point)
+        visited[next_point] = True
+
+    return _two_opt(order, distances, fixed_start=start is not None)
+
+
+def _two_opt(order: List[int], distances: np.ndarray, fixed_start: bool) -> List[int]:
+    """2-opt改进：反转路线片段，直到没有能缩短总长度的反转"""
+    order = list(order)
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1 if fixed_start else 0, n - 1):
+            for j in range(i + 1, n):
+                before = distances[order[i - 1], order[i]] if i > 0 else 0.0
+                after = distances[order[j], order[j + 1]] if j < n - 1 else 0.0
+                new_before = distances[order[i - 1], order[j]] if i > 0 else 0.0
+                new_after = distances[order[i], order[j + 1]] if j < n - 1 else 0.0
+                if new_before + new_after < before + after - 1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+    return order
+
+
+def route_length(coords: np.ndarray, order: Sequence[int]) -> float:
+    """按给定顺序游览的总距离(公里)"""
+    if len(order) < 2:
+        return 0.0
+    coords = np.asarray(coords, dtype=float)[list(order)]
+    return float(haversine_km(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1]).sum())
+
+
+def group_into_days(coords: np.ndarray, travel_days: int) -> List[List[int]]:
+    """
+    把候选景点分到每天并排好顺序
+
+    Returns:
+        每天的景点下标列表（已按游览顺序排列）；组的顺序按组内最相关的景点排序
+    """
+    labels = balanced_kmeans(coords, travel_days)
+    groups = [np.flatnonzero(labels == group) for group in range(travel_days)]
+    groups.sort(key=lambda members: int(members.min()))
+    return [[int(members[i]) for i in order_route(np.asarray(coords)[members])] for members in groups]
+
+
+def nearest_index(point: Sequence[float], candidates: np.ndarray) -> int:
+    """离point最近的候选点下标"""
+    return int(np.argmin(distance_matrix(np.asarray([point], dtype=float), candidates)[0]))
+
+
+def order_day_attractions(day: DayPlan) -> DayPlan:
+    """
+    按最短路线重新排列一天内的景点（从酒店出发，若酒店有坐标）
+
+    LLM给出的顺序经常来回折返，这里只调整顺序，不增删景点
+    """
+    if len(day.attractions) < 2:
+        return day
+    coords = np.array([[a.location.longitude, a.location.latitude] for a in day.attractions])
+    start: Optional[Tuple[float, float]] = None
+    if day.hotel and day.hotel.location:
+        start = (day.hotel.location.longitude, day.hotel.location.latitude)
+    order = order_route(coords, start)
+    day.attractions = [day.attractions[i] for i in order]
+    return day
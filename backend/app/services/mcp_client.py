@@ -5,146 +5,560 @@ MCP客户端 - 实现完整的MCP协议流程
 1. 管理MCP服务器连接
 2. 实现完整的初始化流程
 3. 提供工具调用接口
+
+实现说明：
+- AsyncMCPClient 基于 asyncio.create_subprocess_exec，每个JSON-RPC请求对应一个
+  asyncio.Future，由唯一的读取任务按id分发响应，并发请求不占用线程
+- 所有AsyncMCPClient运行在一个共享的后台事件循环中（get_mcp_event_loop），
+  MCPClient 在其上提供同步(call_tool)和异步(acall_tool)两套接口，
+  同步工具、线程池和FastAPI的事件循环都可以直接使用
+- 每个进程只有一个写入任务拥有stdin：请求先进入队列，写入任务把排队的消息合并成
+  一次write + drain，保证每行都是完整的JSON消息；服务器支持时可以用JSON-RPC批量数组发送
+- MCPClientPool 维护多个MCP服务器进程，每次调用分配给在途请求最少的健康进程，
+  get_mcp_client 返回的就是连接池（大小由settings.mcp_pool_size决定）
 """
 
+import asyncio
+import concurrent.futures
 import json
-import subprocess
 import os
 import threading
 import time
-from typing import Dict, Any, Optional
-import queue
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, List, Optional
 
+from ..config import get_settings
 
-class MCPClient:
+
+# 单行JSON响应的最大长度（高德POI搜索结果可能超过asyncio默认的64KB）
+STREAM_LIMIT = 16 * 1024 * 1024
+
+# 默认请求超时(秒)
+DEFAULT_REQUEST_TIMEOUT = 30.0
+
+# 默认启动截止时间(秒)：启动进程 + initialize + tools/list 必须在此时间内完成
+# （uvx首次运行需要下载amap-mcp-server，所以留得比较宽）
+DEFAULT_STARTUP_TIMEOUT = 60.0
+
+# 进程崩溃后的重启退避：首次等待时间、上限，以及运行多久后退避时间重置(秒)
+RESTART_BACKOFF_INITIAL = 0.5
+RESTART_BACKOFF_MAX = 30.0
+RESTART_BACKOFF_RESET_AFTER = 60.0
+
+# 等待中请求表的容量：超过后新请求排队等待空位（计入请求的截止时间）
+DEFAULT_MAX_PENDING = 256
+
+# 记录多少个已放弃（超时/取消）的请求id，用于识别并丢弃迟到的响应
+MAX_ABANDONED_IDS = 1024
+
+# 每个进程保留的stderr日志大小(字节)
+DEFAULT_STDERR_BUFFER_BYTES = 64 * 1024
+
+# 写入任务一次最多合并多少条排队的消息
+MAX_WRITE_BATCH = 64
+
+# 连接池：连续失败多少次后暂时摘除进程，以及摘除多久(秒)
+POOL_MAX_CONSECUTIVE_FAILURES = 3
+POOL_UNHEALTHY_COOLDOWN = 30.0
+
+
+class MCPToolError(RuntimeError):
+    """工具本身返回的错误（参数错误、高德API错误等），与连接/进程故障区分"""
+
+
+class MCPServerCrashedError(ConnectionError):
+    """MCP服务器进程意外退出，等待中的请求全部以此错误失败"""
+
+    def __init__(self, returncode: Optional[int] = None, message: Optional[str] = None):
+        self.returncode = returncode
+        super().__init__(message or f"MCP server process exited (code {returncode})")
+
+
+class StderrRingBuffer:
+    """
+    环形缓冲区：只保留服务器stderr输出的最后max_bytes字节
+
+    服务器的stderr必须被持续读取，否则系统管道缓冲区写满后服务器会阻塞在写日志上，
+    所有工具调用随之卡住；保留最近的日志用于诊断，内存占用有上限
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_STDERR_BUFFER_BYTES):
+        self.max_bytes = max(1, max_bytes)
+        self._data = bytearray()
+        self.total_bytes = 0
+        self.dropped_bytes = 0
+
+    def write(self, chunk: bytes):
+        self._data.extend(chunk)
+        self.total_bytes += len(chunk)
+        overflow = len(self._data) - self.max_bytes
+        if overflow > 0:
+            del self._data[:overflow]
+            self.dropped_bytes += overflow
+
+    def text(self) -> str:
+        return self._data.decode("utf-8", errors="replace")
+
+    def tail(self, lines: int = 50) -> List[str]:
+        """最后若干行（第一行可能因截断而不完整）"""
+        if lines <= 0:
+            return []
+        return self.text().splitlines()[-lines:]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffered_bytes": len(self._data),
+            "max_bytes": self.max_bytes,
+            "total_bytes": self.total_bytes,
+            "dropped_bytes": self.dropped_bytes,
+        }
+
+
+# ============ 共享的后台事件循环 ============
+
+_mcp_loop: Optional[asyncio.AbstractEventLoop] = None
+_mcp_loop_lock = threading.Lock()
+
+
+def get_mcp_event_loop() -> asyncio.AbstractEventLoop:
+    """获取运行所有MCP连接的后台事件循环（首次调用时在守护线程中启动）"""
+    global _mcp_loop
+
+    with _mcp_loop_lock:
+        if _mcp_loop is None or _mcp_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="mcp-event-loop", daemon=True)
+            thread.start()
+            _mcp_loop = loop
+        return _mcp_loop
+
+
+def run_on_mcp_loop(coro: Awaitable) -> concurrent.futures.Future:
+    """把协程提交到MCP后台事件循环，返回线程安全的Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_mcp_event_loop())
+
+
+class AsyncMCPClient:
     """
-    MCP客户端 - 管理MCP服务器连接和通信
-    
+    asyncio原生的MCP客户端 - 管理MCP服务器连接和通信
+
     实现完整的MCP协议流程：
     1. 启动MCP服务器进程
     2. 发送initialize请求
     3. 等待initialize响应
     4. 发送initialized通知
     5. 之后才能发送工具调用请求
+
+    启动完全由协议驱动：不再固定等待，服务器能读取stdin后initialize请求自然会得到响应；
+    整个启动过程受startup_timeout截止时间约束，进程提前退出时立即失败。
+    握手完成后获取一次tools/list并缓存（available_tools），之后检查工具是否可用不需要往返
+
+    进程监管：读取任务发现服务器进程意外退出时，所有等待中的请求立即以
+    MCPServerCrashedError失败，然后按退避时间重新启动进程并重新握手；
+    重启期间的新请求会等待重启完成（最多request_timeout秒），而不是直接失败
+
+    等待中请求表：
+    - 容量为max_pending，占满时新请求排队等待空位，排队时间计入请求的截止时间
+    - 请求超时或被取消时立即移除自己的条目，id记入"已放弃"表；
+      之后迟到的响应直接丢弃并计数，不会再投递给任何对象
+    - pending_stats() 提供在途、已放弃等计数，长时间运行时内存保持平稳
+
+    写入：只有写入任务(_write_messages)操作stdin，高并发时排队的请求合并写入；
+    batch_requests=True时多条消息合并成一个JSON-RPC批量数组（仅用于支持批量请求的服务器，
+    握手阶段总是逐条发送），响应可以是单个对象也可以是数组
+
+    注意：一个实例只能在创建它的子进程所在的事件循环中使用
     """
-    
-    def __init__(self, server_command: list, env: Optional[Dict[str, str]] = None):
+
+    def __init__(
+        self,
+        server_command: list,
+        env: Optional[Dict[str, str]] = None,
+        request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+        startup_timeout: float = DEFAULT_STARTUP_TIMEOUT,
+        auto_restart: bool = True,
+        restart_backoff_max: float = RESTART_BACKOFF_MAX,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        stderr_buffer_bytes: int = DEFAULT_STDERR_BUFFER_BYTES,
+        batch_requests: bool = False
+    ):
         """
         初始化MCP客户端
-        
+
         Args:
             server_command: MCP服务器启动命令，如 ["uvx", "amap-mcp-server"]
             env: 环境变量字典
+            request_timeout: 单个请求的默认超时(秒)
+            startup_timeout: 启动截止时间(秒)
+            auto_restart: 进程意外退出后是否自动重启
+            restart_backoff_max: 重启退避时间上限(秒)
+            max_pending: 等待中请求表的容量
+            stderr_buffer_bytes: 保留的stderr日志大小(字节)
+            batch_requests: 是否把排队的请求合并为JSON-RPC批量数组发送
         """
         self.server_command = server_command
         self.env = env or {}
-        self.process: Optional[subprocess.Popen] = None
+        self.request_timeout = request_timeout
+        self.startup_timeout = startup_timeout
+        self.auto_restart = auto_restart
+        self.restart_backoff_max = restart_backoff_max
+        self.process: Optional[asyncio.subprocess.Process] = None
         self.initialized = False
+        self.server_info: Dict[str, Any] = {}
+        self.tools: List[Dict[str, Any]] = []
         self.request_id = 0
-        self.pending_requests: Dict[int, queue.Queue] = {}
-        self.lock = threading.Lock()
-        
+        self.pending_requests: Dict[int, asyncio.Future] = {}
+        self._reader_task: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        # stderr日志跨重启保留，便于查看崩溃前的输出
+        self.stderr_log = StderrRingBuffer(stderr_buffer_bytes)
+
+        # 写入任务与合并写入的计数
+        self.batch_requests = batch_requests
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.messages_written = 0
+        self.batches_sent = 0
+
+        # 等待中请求表的容量控制与计数
+        self.max_pending = max(1, max_pending)
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._abandoned: "OrderedDict[int, float]" = OrderedDict()
+        self.peak_in_flight = 0
+        self.timed_out_requests = 0
+        self.cancelled_requests = 0
+        self.late_responses = 0
+        self.unknown_responses = 0
+
+        # 监管状态
+        self.restart_count = 0
+        self.crash_count = 0
+        self.last_exit_code: Optional[int] = None
+        self.last_crash_at: Optional[float] = None
+        self._closed = True
+        self._started_at = 0.0
+        self._restart_delay = RESTART_BACKOFF_INITIAL
+        self._ready: Optional[asyncio.Event] = None
+        self._supervisor_task: Optional[asyncio.Task] = None
+
+    @property
+    def restarting(self) -> bool:
+        """是否正在重启"""
+        return self._supervisor_task is not None and not self._supervisor_task.done()
+
     def _get_next_id(self) -> int:
-        """获取下一个请求ID"""
-        with self.lock:
-            self.request_id += 1
-            return self.request_id
-    
-    def _send_request(self, method: str, params: Optional[Dict] = None) -> Dict[str, Any]:
+        """获取下一个请求ID（只在事件循环线程中调用，无需加锁）"""
+        self.request_id += 1
+        return self.request_id
+
+    def _deadline(self, timeout: Optional[float] = None) -> float:
+        """根据超时计算事件循环时间上的截止时刻"""
+        return asyncio.get_running_loop().time() + (timeout or self.request_timeout)
+
+    @staticmethod
+    def _remaining(deadline: float, method: str) -> float:
+        left = deadline - asyncio.get_running_loop().time()
+        if left <= 0:
+            raise TimeoutError(f"MCP request {method} timed out")
+        return left
+
+    async def _send_request(
+        self,
+        method: str,
+        params: Optional[Dict] = None,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
         """
         发送MCP请求并等待响应
-        
+
         Args:
             method: MCP方法名，如 "initialize", "tools/call"
             params: 请求参数
-            
+            timeout: 超时(秒)，默认使用request_timeout
+            deadline: 事件循环时间上的截止时刻，优先于timeout
+
         Returns:
             响应字典
         """
-        if not self.process:
-            raise RuntimeError("MCP server process not started")
-        
-        request_id = self._get_next_id()
-        request = {
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "method": method
-        }
-        if params:
-            request["params"] = params
-        
-        # 创建响应队列
-        response_queue = queue.Queue()
-        with self.lock:
-            self.pending_requests[request_id] = response_queue
-        
+        if deadline is None:
+            deadline = self._deadline(timeout)
+
+        # 等待请求表空位
         try:
-            # 发送请求（MCP协议要求每行一个JSON消息）
-            request_json = json.dumps(request) + "\n"
-            self.process.stdin.write(request_json)
-            self.process.stdin.flush()
-            
-            # 等待响应（最多30秒）
+            await asyncio.wait_for(self._slots.acquire(), timeout=self._remaining(deadline, method))
+        except asyncio.TimeoutError:
+            self.timed_out_requests += 1
+            raise TimeoutError(f"MCP request {method} timed out waiting for a free request slot")
+
+        try:
+            process, queue = self.process, self._write_queue
+            if not process or queue is None:
+                raise RuntimeError("MCP server process not started")
+
+            request_id = self._get_next_id()
+            request = {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": method
+            }
+            if params:
+                request["params"] = params
+
+            future = asyncio.get_running_loop().create_future()
+            self.pending_requests[request_id] = future
+            self.peak_in_flight = max(self.peak_in_flight, len(self.pending_requests))
             try:
-                response = response_queue.get(timeout=30)
-                return response
-            except queue.Empty:
-                raise TimeoutError(f"MCP request {method} timed out")
-        finally:
-            with self.lock:
+                # 交给写入任务发送；写入失败时写入任务会让future以MCPServerCrashedError失败
+                queue.put_nowait((request, future))
+                try:
+                    return await asyncio.wait_for(future, timeout=self._remaining(deadline, method))
+                except (asyncio.TimeoutError, TimeoutError):
+                    self.timed_out_requests += 1
+                    self._abandon(request_id)
+                    raise TimeoutError(f"MCP request {method} timed out")
+                except asyncio.CancelledError:
+                    self.cancelled_requests += 1
+                    self._abandon(request_id)
+                    raise
+            finally:
                 self.pending_requests.pop(request_id, None)
-    
-    def _read_responses(self):
-        """在后台线程中读取MCP服务器响应"""
-        while self.process and self.process.poll() is None:
-            try:
-                line = self.process.stdout.readline()
-                if not line:
-                    break
-                
-                line = line.strip()
-                if not line:
-                    continue
-                
+        finally:
+            self._slots.release()
+
+    def _abandon(self, request_id: int):
+        """记录已放弃的请求id（有上限，最旧的先淘汰），迟到的响应据此丢弃"""
+        self._abandoned[request_id] = time.time()
+        while len(self._abandoned) > MAX_ABANDONED_IDS:
+            self._abandoned.popitem(last=False)
+
+    def pending_stats(self) -> Dict[str, Any]:
+        """等待中请求表的计数"""
+        return {
+            "in_flight": len(self.pending_requests),
+            "max_pending": self.max_pending,
+            "peak_in_flight": self.peak_in_flight,
+            "orphaned": len(self._abandoned),
+            "timed_out": self.timed_out_requests,
+            "cancelled": self.cancelled_requests,
+            "late_responses_dropped": self.late_responses,
+            "unknown_responses_dropped": self.unknown_responses,
+            "writes": self.writes,
+            "messages_written": self.messages_written,
+            "batches_sent": self.batches_sent,
+        }
+
+    async def _write_messages(self, process: asyncio.subprocess.Process, queue: asyncio.Queue):
+        """唯一的写入任务：把排队的消息合并成一次写入，保证stdin上的消息分帧完整"""
+        try:
+            while True:
+                items = [await queue.get()]
+                while len(items) < MAX_WRITE_BATCH and not queue.empty():
+                    items.append(queue.get_nowait())
+                messages = [message for message, _ in items]
+
                 try:
-                    response = json.loads(line)
-                    request_id = response.get("id")
-                    if request_id and request_id in self.pending_requests:
-                        self.pending_requests[request_id].put(response)
-                except json.JSONDecodeError:
-                    # 忽略非JSON行（可能是日志）
+                    process.stdin.write(self._encode_messages(messages))
+                    await process.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError) as e:
+                    # 进程已经退出但读取任务还没发现
+                    error = MCPServerCrashedError(process.returncode, f"MCP server stdin closed: {str(e)}")
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(error)
                     continue
-            except Exception as e:
-                # Error reading MCP response (logged for debugging)
-                pass
+
+                self.writes += 1
+                self.messages_written += len(items)
+                for message, future in items:
+                    # 通知没有响应，写入完成即完成；请求的future由读取任务完成
+                    if "id" not in message and not future.done():
+                        future.set_result(None)
+        finally:
+            while not queue.empty():
+                _, future = queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("MCP server process stopped"))
+
+    def _encode_messages(self, messages: List[Dict[str, Any]]) -> bytes:
+        """每行一个JSON消息；启用批量请求且握手已完成时合并为一个JSON-RPC批量数组"""
+        if self.batch_requests and self.initialized and len(messages) > 1:
+            self.batches_sent += 1
+            return (json.dumps(messages) + "\n").encode("utf-8")
+        return "".join(json.dumps(message) + "\n" for message in messages).encode("utf-8")
+
+    def _stop_writer(self):
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+        self._writer_task = None
+        self._write_queue = None
+
+    async def _read_responses(self, process: asyncio.subprocess.Process):
+        """唯一的读取任务：按id把响应分发给等待中的Future，stdout关闭时交给_on_process_exit处理"""
+        while True:
+            try:
+                line = await process.stdout.readline()
+            except (asyncio.LimitOverrunError, ValueError) as e:
+                print(f"⚠️  MCP response line too long, skipped: {str(e)}")
+                continue
+            if not line:
                 break
-    
-    def start(self):
-        """启动MCP服务器并初始化"""
+
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                # 忽略非JSON行（可能是日志）
+                continue
+            # 批量请求的响应是数组
+            for item in response if isinstance(response, list) else [response]:
+                if isinstance(item, dict):
+                    self._dispatch_response(item)
+
+        returncode = await process.wait()
+        if process is not self.process:
+            return  # stop()或启动失败时已经清理
+        if self.initialized:
+            self._on_process_exit(returncode)
+        else:
+            # 握手阶段退出：让启动立即失败，由start()/_respawn()处理
+            self._fail_pending(MCPServerCrashedError(returncode))
+
+    def _dispatch_response(self, response: Dict[str, Any]):
+        """把一个响应交给对应id的Future"""
+        response_id = response.get("id")
+        future = self.pending_requests.get(response_id)
+        if future is not None:
+            if not future.done():
+                future.set_result(response)
+        elif self._abandoned.pop(response_id, None) is not None:
+            # 请求已超时/取消，迟到的响应直接丢弃
+            self.late_responses += 1
+        elif response_id is not None:
+            self.unknown_responses += 1
+
+    async def _drain_stderr(self, process: asyncio.subprocess.Process):
+        """持续读取stderr写入环形缓冲区，防止管道写满导致服务器阻塞"""
+        self.stderr_log.write(f"--- MCP server started (pid {process.pid}) ---\n".encode("utf-8"))
+        while True:
+            chunk = await process.stderr.read(4096)
+            if not chunk:
+                break
+            self.stderr_log.write(chunk)
+
+    def _fail_pending(self, error: BaseException) -> int:
+        """让所有等待中的请求以error失败，返回失败的数量"""
+        failed = 0
+        for future in list(self.pending_requests.values()):
+            if not future.done():
+                future.set_exception(error)
+                failed += 1
+        return failed
+
+    def _on_process_exit(self, returncode: Optional[int]):
+        """服务器进程意外退出：立即让所有等待中的请求失败，并安排重启"""
+        self.process = None
+        self.initialized = False
+        self.crash_count += 1
+        self.last_exit_code = returncode
+        self.last_crash_at = time.time()
+        if self._ready is not None:
+            self._ready.clear()
+        self._stop_writer()
+
+        failed = self._fail_pending(MCPServerCrashedError(returncode))
+        self._abandoned.clear()  # 旧进程的迟到响应不会再来了
+        print(f"❌ MCP server exited (code {returncode}), {failed} in-flight requests failed")
+
+        if self.auto_restart and not self._closed and not self.restarting:
+            # 进程运行不久就退出说明在反复崩溃，退避时间翻倍；运行较久则从初始值重新开始
+            if time.monotonic() - self._started_at > RESTART_BACKOFF_RESET_AFTER:
+                self._restart_delay = RESTART_BACKOFF_INITIAL
+            self._supervisor_task = asyncio.get_running_loop().create_task(self._respawn())
+
+    async def _respawn(self):
+        """按退避时间重启服务器进程并重新握手，直到成功或客户端被停止"""
+        while not self._closed:
+            delay = self._restart_delay
+            self._restart_delay = min(self._restart_delay * 2, self.restart_backoff_max)
+            print(f"🔄 Restarting MCP server in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+            if self._closed:
+                return
+            try:
+                await self._launch()
+            except Exception as e:
+                print(f"⚠️  MCP server restart failed: {str(e)}")
+                continue
+            self.restart_count += 1
+            print(f"✅ MCP server restarted (restart #{self.restart_count})")
+            return
+
+    def schedule_restart(self) -> bool:
+        """
+        按退避时间在后台重试启动（用于首次启动失败的连接池成员），在MCP事件循环中调用
+
+        Returns:
+            是否安排了重试（未开启auto_restart、已在运行或已在重启时为False）
+        """
+        if not self.auto_restart or self.process or self.restarting:
+            return False
+        self._closed = False
+        self._supervisor_task = asyncio.get_running_loop().create_task(self._respawn())
+        return True
+
+    async def start(self):
+        """启动MCP服务器并初始化（initialize握手 + 缓存tools/list），超过startup_timeout则失败"""
         if self.process:
             return  # 已经启动
-        
+
+        self._closed = False
+        try:
+            return await self._launch()
+        except Exception as e:
+            print(f"Failed to initialize MCP server: {e}")
+            await self.stop()
+            raise
+
+    async def _launch(self):
+        """启动进程并完成握手；失败时清理本次启动的进程后抛出异常"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.startup_timeout
+        if self._ready is None:
+            self._ready = asyncio.Event()
+
+        def remaining() -> float:
+            left = deadline - loop.time()
+            if left <= 0:
+                raise TimeoutError(f"MCP server did not start within {self.startup_timeout:.0f}s")
+            return left
+
         # 启动MCP服务器进程
         env = os.environ.copy()
         env.update(self.env)
-        
-        self.process = subprocess.Popen(
-            self.server_command,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+
+        process = await asyncio.create_subprocess_exec(
+            *self.server_command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
             env=env,
-            text=True,  # 使用文本模式
-            bufsize=1  # 行缓冲
+            limit=STREAM_LIMIT
         )
-        
-        # 启动响应读取线程
-        self.response_thread = threading.Thread(target=self._read_responses, daemon=True)
-        self.response_thread.start()
-        
-        # 等待服务器启动
-        time.sleep(0.5)
-        
+        self.process = process
+        self._started_at = time.monotonic()
+
+        # 启动写入任务、响应读取任务和stderr排空任务
+        self._stop_writer()
+        self._write_queue = asyncio.Queue()
+        self._writer_task = loop.create_task(self._write_messages(process, self._write_queue))
+        self._reader_task = loop.create_task(self._read_responses(process))
+        self._stderr_task = loop.create_task(self._drain_stderr(process))
+
         # 发送initialize请求
         initialize_params = {
             "protocolVersion": "2024-11-05",
@@ -156,110 +570,515 @@ class MCPClient:
                 "version": "1.0.0"
             }
         }
-        
+
         try:
-            response = self._send_request("initialize", initialize_params)
-            
+            response = await self._send_request("initialize", initialize_params, timeout=remaining())
+
             if "error" in response:
                 raise RuntimeError(f"MCP initialize failed: {response['error']}")
-            
+            self.server_info = response.get("result", {}).get("serverInfo", {})
+
             # 发送initialized通知
-            self._send_notification("notifications/initialized", {})
-            
-            self.initialized = True
-            return True
-        except Exception as e:
-            print(f"Failed to initialize MCP server: {e}")
-            self.stop()
+            await self._send_notification("notifications/initialized", {})
+
+            await self._fetch_tools(timeout=remaining())
+        except BaseException:
+            if self.process is process:
+                self.process = None
+                self._stop_writer()
+            await _terminate_process(process)
             raise
-    
-    def _send_notification(self, method: str, params: Optional[Dict] = None):
-        """发送MCP通知（不需要响应）"""
-        if not self.process:
+
+        self.initialized = True
+        self._ready.set()
+        return True
+
+    async def _send_notification(self, method: str, params: Optional[Dict] = None):
+        """发送MCP通知（不需要响应），等待写入任务写出"""
+        if not self.process or self._write_queue is None:
             raise RuntimeError("MCP server process not started")
-        
+
         notification = {
             "jsonrpc": "2.0",
             "method": method
         }
         if params:
             notification["params"] = params
-        
-        notification_json = json.dumps(notification) + "\n"
-        self.process.stdin.write(notification_json)
-        self.process.stdin.flush()
-    
-    def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+
+        written = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((notification, written))
+        await asyncio.wait_for(written, timeout=self.request_timeout)
+
+    async def _fetch_tools(self, timeout: Optional[float] = None):
+        """获取tools/list（支持nextCursor分页）并缓存"""
+        tools: List[Dict[str, Any]] = []
+        cursor = None
+        while True:
+            response = await self._send_request("tools/list", {"cursor": cursor} if cursor else None, timeout=timeout)
+            if "error" in response:
+                raise RuntimeError(f"MCP tools/list failed: {response['error']}")
+            result = response.get("result") or {}
+            tools.extend(tool for tool in result.get("tools", []) if isinstance(tool, dict))
+            cursor = result.get("nextCursor")
+            if not cursor:
+                break
+        self.tools = tools
+
+    async def refresh_tools(self) -> List[str]:
+        """重新获取工具列表（服务器更新工具后使用）"""
+        await self._fetch_tools()
+        return self.available_tools
+
+    @property
+    def available_tools(self) -> List[str]:
+        """缓存的工具名称列表"""
+        return [tool.get("name") for tool in self.tools if tool.get("name")]
+
+    def has_tool(self, tool_name: str) -> bool:
+        """检查工具是否可用（使用缓存，不需要往返）"""
+        return tool_name in self.available_tools
+
+    async def _wait_ready(self, deadline: float):
+        """重启期间等待服务器重新就绪（不超过请求的截止时间）"""
+        if self.initialized:
+            return
+        if not self.restarting or self._ready is None:
+            raise RuntimeError("MCP client not initialized. Call start() first.")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=self._remaining(deadline, "tools/call"))
+        except asyncio.TimeoutError:
+            raise TimeoutError("MCP server is restarting and not ready yet")
+
+    async def call_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
         """
         调用MCP工具
-        
+
         Args:
             tool_name: 工具名称，如 "maps_text_search"
             arguments: 工具参数
-            
+            timeout: 整个调用（等待重启、排队、响应）的超时(秒)，默认使用request_timeout
+
         Returns:
             工具调用结果
         """
-        if not self.initialized:
-            raise RuntimeError("MCP client not initialized. Call start() first.")
-        
+        deadline = self._deadline(timeout)
+        await self._wait_ready(deadline)
+
         params = {
             "name": tool_name,
             "arguments": arguments
         }
-        
-        response = self._send_request("tools/call", params)
-        
-        # 检查响应中的错误
-        if "error" in response:
-            error_info = response["error"]
-            if isinstance(error_info, dict):
-                error_msg = error_info.get("message", "Unknown error")
-                error_code = error_info.get("code", -1)
-                raise RuntimeError(f"MCP tool call failed (code {error_code}): {error_msg}")
-            else:
-                raise RuntimeError(f"MCP tool call failed: {error_info}")
-        
-        # 返回result字段，如果没有则返回整个response
-        result = response.get("result", response)
-        return result if result else {}
-    
+
+        response = await self._send_request("tools/call", params, deadline=deadline)
+        return _tool_result(response)
+
+    def diagnostics(self, stderr_lines: int = 50) -> Dict[str, Any]:
+        """诊断信息：进程、监管、请求表状态和最近的stderr日志"""
+        return {
+            "command": " ".join(self.server_command),
+            "pid": self.process.pid if self.process else None,
+            "initialized": self.initialized,
+            "server_info": self.server_info,
+            "available_tools": self.available_tools,
+            **self.supervisor_stats(),
+            "pending": self.pending_stats(),
+            "stderr": self.stderr_log.stats(),
+            "stderr_tail": self.stderr_log.tail(stderr_lines),
+        }
+
+    def supervisor_stats(self) -> Dict[str, Any]:
+        """进程监管统计"""
+        return {
+            "restarting": self.restarting,
+            "restart_count": self.restart_count,
+            "crash_count": self.crash_count,
+            "last_exit_code": self.last_exit_code,
+            "last_crash_at": self.last_crash_at,
+        }
+
+    async def stop(self):
+        """停止MCP服务器（不会触发自动重启）"""
+        self._closed = True
+        if self._supervisor_task is not None:
+            self._supervisor_task.cancel()
+            self._supervisor_task = None
+        process, self.process = self.process, None
+        self.initialized = False
+        self.tools = []
+        for task in (self._reader_task, self._stderr_task):
+            if task is not None:
+                task.cancel()
+        self._reader_task = self._stderr_task = None
+        self._stop_writer()
+        self._fail_pending(RuntimeError("MCP client stopped"))
+        if process is not None:
+            await _terminate_process(process)
+
+
+async def _terminate_process(process: asyncio.subprocess.Process):
+    """终止服务器进程（5秒内未退出则强制结束）"""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), timeout=5)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def _tool_result(response: Dict[str, Any]) -> Dict[str, Any]:
+    """检查tools/call响应中的错误，返回result字段"""
+    if "error" in response:
+        error_info = response["error"]
+        if isinstance(error_info, dict):
+            error_msg = error_info.get("message", "Unknown error")
+            error_code = error_info.get("code", -1)
+            raise MCPToolError(f"MCP tool call failed (code {error_code}): {error_msg}")
+        else:
+            raise MCPToolError(f"MCP tool call failed: {error_info}")
+
+    # 返回result字段，如果没有则返回整个response
+    result = response.get("result", response)
+    return result if result else {}
+
+
+class MCPClient:
+    """
+    MCP客户端 - 同步/异步两用的门面
+
+    底层的AsyncMCPClient运行在共享的MCP后台事件循环中：
+    - call_tool: 同步调用（阻塞当前线程直到响应返回），供同步工具和线程池使用
+    - acall_tool: 异步调用，可以在任意事件循环中await，不占用线程
+    """
+
+    def __init__(self, server_command: list, env: Optional[Dict[str, str]] = None, **client_options):
+        """
+        初始化MCP客户端
+
+        Args:
+            server_command: MCP服务器启动命令，如 ["uvx", "amap-mcp-server"]
+            env: 环境变量字典
+            **client_options: 传给AsyncMCPClient的参数（startup_timeout、auto_restart等）
+        """
+        self.server_command = server_command
+        self.env = env or {}
+        self._client = AsyncMCPClient(server_command, env, **client_options)
+
+    @property
+    def initialized(self) -> bool:
+        return self._client.initialized
+
+    @property
+    def available_tools(self) -> List[str]:
+        """缓存的工具名称列表"""
+        return self._client.available_tools
+
+    def has_tool(self, tool_name: str) -> bool:
+        return self._client.has_tool(tool_name)
+
+    @property
+    def process(self) -> Optional[asyncio.subprocess.Process]:
+        return self._client.process
+
+    def start(self):
+        """启动MCP服务器并初始化（阻塞直到握手完成）"""
+        return run_on_mcp_loop(self._client.start()).result()
+
+    async def astart(self):
+        """start的异步版本"""
+        return await asyncio.wrap_future(run_on_mcp_loop(self._client.start()))
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        调用MCP工具（同步）
+
+        Args:
+            tool_name: 工具名称，如 "maps_text_search"
+            arguments: 工具参数
+            timeout: 超时(秒)，默认使用客户端的request_timeout
+
+        Returns:
+            工具调用结果
+        """
+        return run_on_mcp_loop(self._client.call_tool(tool_name, arguments, timeout)).result()
+
+    async def acall_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """调用MCP工具（异步），调用方被取消时请求也会被取消并释放等待表中的位置"""
+        return await asyncio.wrap_future(run_on_mcp_loop(self._client.call_tool(tool_name, arguments, timeout)))
+
+    def pending_stats(self) -> Dict[str, Any]:
+        """等待中请求表的计数"""
+        return self._client.pending_stats()
+
+    def diagnostics(self, stderr_lines: int = 50) -> Dict[str, Any]:
+        """诊断信息（含最近的stderr日志）"""
+        return self._client.diagnostics(stderr_lines)
+
     def stop(self):
         """停止MCP服务器"""
-        if self.process:
-            try:
-                self.process.terminate()
-                self.process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.process.kill()
-            except Exception:
-                pass
-            finally:
-                self.process = None
-                self.initialized = False
+        try:
+            run_on_mcp_loop(self._client.stop()).result(timeout=10)
+        except Exception:
+            pass
+
+
+class _PoolMember:
+    """连接池中的一个MCP服务器进程及其负载、健康状态"""
+
+    def __init__(self, index: int, client: AsyncMCPClient):
+        self.index = index
+        self.client = client
+        self.in_flight = 0
+        self.total_calls = 0
+        self.total_failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.last_error: Optional[str] = None
+
+    def is_healthy(self, now: float) -> bool:
+        return self.client.initialized and now >= self.unhealthy_until
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "pid": self.client.process.pid if self.client.process else None,
+            "initialized": self.client.initialized,
+            "healthy": self.is_healthy(time.monotonic()),
+            "in_flight": self.in_flight,
+            "total_calls": self.total_calls,
+            "total_failures": self.total_failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            **self.client.supervisor_stats(),
+            "pending": self.client.pending_stats(),
+        }
+
+
+class MCPClientPool:
+    """
+    MCP服务器进程池 - 接口与MCPClient相同
+
+    单个进程意味着所有POI、天气、路线调用都串行经过一条stdio管道和一个
+    Python服务器进程；连接池把调用分散到多个进程：
+    - 分配：选择在途请求最少的健康进程（负载相同时轮流使用）
+    - 健康跟踪：超时、进程故障等传输层错误连续出现POOL_MAX_CONSECUTIVE_FAILURES次后，
+      该进程暂时不再接收请求（POOL_UNHEALTHY_COOLDOWN秒后重新参与分配）；
+      工具本身返回的错误(MCPToolError)不影响健康状态
+    - 进程崩溃时由各自的AsyncMCPClient自动重启，重启期间不参与分配；
+      首次启动失败的进程同样在后台按退避时间重试
+    - 所有进程都不健康时仍然选择负载最低的进程，而不是直接失败
+    """
+
+    def __init__(
+        self,
+        server_command: list,
+        env: Optional[Dict[str, str]] = None,
+        size: int = 2,
+        **client_options
+    ):
+        """
+        Args:
+            server_command: MCP服务器启动命令
+            env: 环境变量字典
+            size: 进程数量
+            **client_options: 传给每个AsyncMCPClient的参数（startup_timeout、auto_restart等）
+        """
+        self.server_command = server_command
+        self.env = env or {}
+        self.size = max(1, size)
+        self.members: List[_PoolMember] = [
+            _PoolMember(index, AsyncMCPClient(server_command, env, **client_options))
+            for index in range(self.size)
+        ]
+        self._next_index = 0
+
+    @property
+    def initialized(self) -> bool:
+        return any(member.client.initialized for member in self.members)
+
+    @property
+    def available_tools(self) -> List[str]:
+        """缓存的工具名称列表（所有进程运行同一个服务器，取任一已初始化的进程）"""
+        for member in self.members:
+            if member.client.initialized:
+                return member.client.available_tools
+        return []
+
+    def has_tool(self, tool_name: str) -> bool:
+        return tool_name in self.available_tools
+
+    def start(self):
+        """并发启动所有进程（阻塞直到握手完成），至少一个成功即可"""
+        return run_on_mcp_loop(self._start()).result()
+
+    async def astart(self):
+        """start的异步版本"""
+        return await asyncio.wrap_future(run_on_mcp_loop(self._start()))
+
+    async def _start(self):
+        results = await asyncio.gather(
+            *(member.client.start() for member in self.members),
+            return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for member, result in zip(self.members, results):
+            if isinstance(result, BaseException):
+                member.last_error = str(result)
+        if len(errors) == len(self.members):
+            raise errors[0]
+        if errors:
+            print(f"⚠️  {len(errors)}/{len(self.members)} MCP server processes failed to start, retrying in background")
+            # 启动失败的进程按退避时间在后台重试，成功后initialized为True，重新参与分配
+            for member, result in zip(self.members, results):
+                if isinstance(result, BaseException):
+                    member.client.schedule_restart()
+        return True
+
+    def _select_member(self) -> _PoolMember:
+        """选择在途请求最少的健康进程（从上次位置开始轮询，负载相同的进程轮流使用）"""
+        now = time.monotonic()
+        ordered = self.members[self._next_index:] + self.members[:self._next_index]
+        candidates = [member for member in ordered if member.is_healthy(now)]
+        if not candidates:
+            candidates = [member for member in ordered if member.client.initialized] or ordered
+        member = min(candidates, key=lambda candidate: candidate.in_flight)
+        self._next_index = (member.index + 1) % len(self.members)
+        return member
+
+    async def _call_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """在MCP事件循环中执行：选进程、计数、记录健康状态"""
+        member = self._select_member()
+        member.in_flight += 1
+        member.total_calls += 1
+        try:
+            result = await member.client.call_tool(tool_name, arguments, timeout)
+        except MCPToolError:
+            member.consecutive_failures = 0
+            raise
+        except MCPServerCrashedError as e:
+            # 进程崩溃由监管任务负责重启，重启期间initialized为False，自然不会被选中
+            member.total_failures += 1
+            member.last_error = str(e)
+            raise
+        except Exception as e:
+            member.total_failures += 1
+            member.consecutive_failures += 1
+            member.last_error = str(e) or type(e).__name__
+            if member.consecutive_failures >= POOL_MAX_CONSECUTIVE_FAILURES:
+                member.unhealthy_until = time.monotonic() + POOL_UNHEALTHY_COOLDOWN
+                print(f"⚠️  MCP server #{member.index} marked unhealthy: {member.last_error}")
+            raise
+        else:
+            member.consecutive_failures = 0
+            member.unhealthy_until = 0.0
+            return result
+        finally:
+            member.in_flight -= 1
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """调用MCP工具（同步）"""
+        return run_on_mcp_loop(self._call_tool(tool_name, arguments, timeout)).result()
+
+    async def acall_tool(
+        self,
+        tool_name: str,
+        arguments: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """调用MCP工具（异步）"""
+        return await asyncio.wrap_future(run_on_mcp_loop(self._call_tool(tool_name, arguments, timeout)))
+
+    def diagnostics(self, stderr_lines: int = 50) -> Dict[str, Any]:
+        """每个进程的诊断信息（含最近的stderr日志）"""
+        return {
+            "transport": "mcp",
+            "size": self.size,
+            "processes": [
+                {**member.client.diagnostics(stderr_lines), **member.stats()}
+                for member in self.members
+            ],
+        }
+
+    def pending_stats(self) -> Dict[str, Any]:
+        """所有进程等待中请求表计数的合计"""
+        totals: Dict[str, Any] = {}
+        for member in self.members:
+            for name, value in member.client.pending_stats().items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池状态（每个进程的负载和健康信息）"""
+        return {
+            "size": self.size,
+            "available_tools": self.available_tools,
+            "members": [member.stats() for member in self.members],
+        }
+
+    def stop(self):
+        """停止所有MCP服务器进程"""
+        async def stop_all():
+            await asyncio.gather(*(member.client.stop() for member in self.members), return_exceptions=True)
+        try:
+            run_on_mcp_loop(stop_all()).result(timeout=15)
+        except Exception:
+            pass
 
 
 # 全局MCP客户端实例（单例模式）
-_mcp_clients: Dict[str, MCPClient] = {}
+_mcp_clients: Dict[str, MCPClientPool] = {}
+_mcp_clients_lock = threading.Lock()
 
 
-def get_mcp_client(server_command: list, env: Optional[Dict[str, str]] = None) -> MCPClient:
+def get_mcp_client(server_command: list, env: Optional[Dict[str, str]] = None) -> MCPClientPool:
     """
     获取MCP客户端实例（单例模式）
-    
+
+    每个启动命令对应一个进程池，大小由settings.mcp_pool_size决定
+
     Args:
         server_command: MCP服务器启动命令
         env: 环境变量字典
-        
+
     Returns:
-        MCPClient实例
+        MCPClientPool实例（接口与MCPClient相同）
     """
     # 使用命令作为key
     key = " ".join(server_command)
-    
-    if key not in _mcp_clients:
-        client = MCPClient(server_command, env)
-        client.start()
-        _mcp_clients[key] = client
-    
+
+    with _mcp_clients_lock:
+        if key not in _mcp_clients:
+            settings = get_settings()
+            client = MCPClientPool(
+                server_command,
+                env,
+                size=settings.mcp_pool_size,
+                startup_timeout=settings.mcp_startup_timeout,
+                auto_restart=settings.mcp_auto_restart,
+                restart_backoff_max=settings.mcp_restart_backoff_max,
+                max_pending=settings.mcp_max_pending,
+                stderr_buffer_bytes=settings.mcp_stderr_buffer_kb * 1024,
+                batch_requests=settings.mcp_batch_requests
+            )
+            client.start()
+            _mcp_clients[key] = client
+
     return _mcp_clients[key]
@@ -25,15 +25,79 @@ MCP工具封装 - LangChain版本
    - 接口适配LangChain的Tool Calling标准
 """
 
+import asyncio
 import json
 import subprocess
 import os
-from typing import Optional, Type
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Type
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
-from ..config import get_settings
-from .mcp_client import get_mcp_client
+from .amap_transport import UvxNotFoundError, get_amap_transport
 from ..utils.city_translator import translate_city_name
+from ..utils.prompt_compaction import merge_poi_results
+
+# 多关键词搜索一次最多的关键词数和返回的POI数
+MULTI_SEARCH_MAX_KEYWORDS = 8
+MULTI_SEARCH_MAX_RESULTS = 30
+
+# uvx命令不存在时返回给Agent的错误信息
+UVX_NOT_FOUND_ERROR = {
+    "error": "uvx command not found",
+    "message": "Please install uv: https://github.com/astral-sh/uv",
+    "install_command": "curl -LsSf https://astral.sh/uv/install.sh | sh"
+}
+
+
+class AmapToolRuntime:
+    """
+    高德工具共享的运行时上下文
+
+    传输（MCP进程池或HTTP连接池）和uvx可执行文件只在第一次使用时解析一次，
+    之后所有工具实例、所有调用共用；mcp传输缺少uvx时记录为不可用（安装uv后需重启服务）
+    """
+
+    def __init__(self, transport=None, unavailable: Optional[Dict[str, str]] = None):
+        self.transport = transport
+        self.unavailable = unavailable
+
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[dict]:
+        """同步调用，运行时不可用时返回None"""
+        if self.transport is None:
+            return None
+        return self.transport.call_tool(tool_name=tool_name, arguments=arguments)
+
+    async def acall_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Optional[dict]:
+        """异步调用（不占用线程），运行时不可用时返回None"""
+        if self.transport is None:
+            return None
+        return await self.transport.acall_tool(tool_name, arguments)
+
+
+# 全局工具运行时（单例模式）
+_tool_runtime: Optional[AmapToolRuntime] = None
+_tool_runtime_lock = threading.Lock()
+
+
+def get_tool_runtime() -> AmapToolRuntime:
+    """获取工具运行时（首次调用时解析传输，可能需要等待MCP服务器启动）"""
+    global _tool_runtime
+
+    with _tool_runtime_lock:
+        if _tool_runtime is None:
+            try:
+                _tool_runtime = AmapToolRuntime(transport=get_amap_transport())
+            except UvxNotFoundError:
+                _tool_runtime = AmapToolRuntime(unavailable=UVX_NOT_FOUND_ERROR)
+        return _tool_runtime
+
+
+async def aget_tool_runtime() -> AmapToolRuntime:
+    """get_tool_runtime的异步版本：只有首次解析（启动传输）在工作线程中进行"""
+    if _tool_runtime is not None:
+        return _tool_runtime
+    return await asyncio.to_thread(get_tool_runtime)
 
 
 class AmapTextSearchInput(BaseModel):
@@ -79,80 +143,67 @@ class AmapTextSearchTool(BaseTool):
         3. 返回搜索结果
         """
         try:
-            settings = get_settings()
-            
-            # 检查uvx命令是否存在
-            import shutil
-            uvx_path = shutil.which("uvx")
-            if not uvx_path:
+            result = get_tool_runtime().call_tool("maps_text_search", self._build_arguments(keywords, city, citylimit))
+            return self._format_result(result)
+        except Exception as e:
+            return f"Error calling AmapTextSearchTool: {str(e)}"
+
+    def _build_arguments(self, keywords: str, city: str, citylimit: str = "true") -> Dict[str, str]:
+        """构造maps_text_search的参数"""
+        # Translate city name to Chinese for Amap API compatibility
+        chinese_city = translate_city_name(city)
+        print(f"   🔄 Translated city name: {city} -> {chinese_city}")
+        return {
+            "keywords": keywords,
+            "city": chinese_city,  # Use Chinese city name
+            "citylimit": citylimit
+        }
+
+    def _format_result(self, result: Optional[dict]) -> str:
+        """
+        处理结果（result是字典，包含MCP协议响应）
+        MCP工具可能返回不同的格式，需要统一处理
+        """
+        if result is None:
+            return json.dumps(UVX_NOT_FOUND_ERROR, ensure_ascii=False)
+        if "content" in result:
+            content = result["content"]
+            if isinstance(content, list):
+                # 如果是列表，检查是否包含文本内容
+                if len(content) > 0:
+                    if isinstance(content[0], dict):
+                        # 如果是字典列表，提取文本或格式化
+                        text_content = content[0].get("text", "")
+                        if text_content:
+                            return text_content
+                        # 如果没有text字段，格式化整个列表
+                        return self._format_poi_results(content)
+                    else:
+                        return json.dumps(content, ensure_ascii=False)
+                return "No results found"
+            elif isinstance(content, str):
+                return content
+            else:
+                return json.dumps(content, ensure_ascii=False)
+        elif "text" in result:
+            return result["text"]
+        elif "error" in result:
+            # MCP协议错误响应
+            error_info = result["error"]
+            if isinstance(error_info, dict):
                 return json.dumps({
-                    "error": "uvx command not found",
-                    "message": "Please install uv: https://github.com/astral-sh/uv",
-                    "install_command": "curl -LsSf https://astral.sh/uv/install.sh | sh"
+                    "error": "MCP protocol error",
+                    "message": error_info.get("message", "Unknown error"),
+                    "code": error_info.get("code", -1)
                 }, ensure_ascii=False)
-            
-            # 获取MCP客户端（单例模式，会自动初始化）
-            env = {"AMAP_MAPS_API_KEY": settings.amap_api_key}
-            mcp_client = get_mcp_client([uvx_path, "amap-mcp-server"], env)
-            
-            # Translate city name to Chinese for Amap API compatibility
-            chinese_city = translate_city_name(city)
-            print(f"   🔄 Translated city name: {city} -> {chinese_city}")
-            
-            # 调用工具
-            # mcp_client.call_tool()返回的是字典，不是subprocess结果
-            result = mcp_client.call_tool(
-                tool_name="maps_text_search",
-                arguments={
-                    "keywords": keywords,
-                    "city": chinese_city,  # Use Chinese city name
-                    "citylimit": citylimit
-                }
-            )
-            
-            # 处理结果（result是字典，包含MCP协议响应）
-            # MCP工具可能返回不同的格式，需要统一处理
-            if "content" in result:
-                content = result["content"]
-                if isinstance(content, list):
-                    # 如果是列表，检查是否包含文本内容
-                    if len(content) > 0:
-                        if isinstance(content[0], dict):
-                            # 如果是字典列表，提取文本或格式化
-                            text_content = content[0].get("text", "")
-                            if text_content:
-                                return text_content
-                            # 如果没有text字段，格式化整个列表
-                            return self._format_poi_results(content)
-                        else:
-                            return json.dumps(content, ensure_ascii=False)
-                    return "No results found"
-                elif isinstance(content, str):
-                    return content
-                else:
-                    return json.dumps(content, ensure_ascii=False)
-            elif "text" in result:
-                return result["text"]
-            elif "error" in result:
-                # MCP协议错误响应
-                error_info = result["error"]
-                if isinstance(error_info, dict):
-                    return json.dumps({
-                        "error": "MCP protocol error",
-                        "message": error_info.get("message", "Unknown error"),
-                        "code": error_info.get("code", -1)
-                    }, ensure_ascii=False)
-                else:
-                    return json.dumps({"error": str(error_info)}, ensure_ascii=False)
             else:
-                # 检查是否直接包含POI数据
-                if "pois" in result:
-                    return self._format_poi_results(result["pois"])
-                # 其他格式，直接返回
-                return json.dumps(result, ensure_ascii=False)
-
-        except Exception as e:
-            return f"Error calling AmapTextSearchTool: {str(e)}"
+                return json.dumps({"error": str(error_info)}, ensure_ascii=False)
+        else:
+            # 检查是否直接包含POI数据
+            if "pois" in result:
+                return self._format_poi_results(result["pois"])
+            # 其他格式，直接返回
+            return json.dumps(result, ensure_ascii=False)
     
     def _format_poi_results(self, pois: list) -> str:
         """
@@ -177,8 +228,17 @@ class AmapTextSearchTool(BaseTool):
         city: str,
         citylimit: str = "true"
     ) -> str:
-        """异步版本（暂时使用同步实现）"""
-        return self._run(keywords, city, citylimit)
+        """
+        异步版本
+
+        直接await传输的acall_tool，等待响应期间不占用线程，多个请求的工具I/O可以重叠
+        """
+        try:
+            runtime = await aget_tool_runtime()
+            result = await runtime.acall_tool("maps_text_search", self._build_arguments(keywords, city, citylimit))
+            return self._format_result(result)
+        except Exception as e:
+            return f"Error calling AmapTextSearchTool: {str(e)}"
 
 
 class AmapWeatherInput(BaseModel):
@@ -206,54 +266,139 @@ class AmapWeatherTool(BaseTool):
     def _run(self, city: str) -> str:
         """调用MCP服务器查询天气"""
         try:
-            settings = get_settings()
-            
-            # 检查uvx命令是否存在
-            import shutil
-            uvx_path = shutil.which("uvx")
-            if not uvx_path:
-                return json.dumps({
-                    "error": "uvx command not found",
-                    "message": "Please install uv: https://github.com/astral-sh/uv",
-                    "install_command": "curl -LsSf https://astral.sh/uv/install.sh | sh"
-                }, ensure_ascii=False)
-            
-            # 获取MCP客户端（单例模式，会自动初始化）
-            env_dict = {"AMAP_MAPS_API_KEY": settings.amap_api_key}
-            mcp_client = get_mcp_client([uvx_path, "amap-mcp-server"], env_dict)
-            
-            # Translate city name to Chinese - Weather API REQUIRES Chinese city names
-            chinese_city = translate_city_name(city)
-            print(f"   🔄 Translated city name: {city} -> {chinese_city}")
-            
-            # 调用工具
-            result = mcp_client.call_tool(
-                tool_name="maps_weather",
-                arguments={"city": chinese_city}  # Use Chinese city name (required for weather API)
-            )
-            
-            # 处理结果
-            if "content" in result:
-                content = result["content"]
-                if isinstance(content, list):
-                    if len(content) > 0 and isinstance(content[0], dict):
-                        return content[0].get("text", json.dumps(content, ensure_ascii=False))
-                    return json.dumps(content, ensure_ascii=False)
-                elif isinstance(content, str):
-                    return content
-                else:
-                    return json.dumps(content, ensure_ascii=False)
-            elif "text" in result:
-                return result["text"]
-            else:
-                return json.dumps(result, ensure_ascii=False)
-
+            return self._format_result(get_tool_runtime().call_tool("maps_weather", self._build_arguments(city)))
         except Exception as e:
             return f"Error calling AmapWeatherTool: {str(e)}"
+
+    def _build_arguments(self, city: str) -> Dict[str, str]:
+        """构造maps_weather的参数"""
+        # Translate city name to Chinese - Weather API REQUIRES Chinese city names
+        chinese_city = translate_city_name(city)
+        print(f"   🔄 Translated city name: {city} -> {chinese_city}")
+        return {"city": chinese_city}  # Use Chinese city name (required for weather API)
+
+    def _format_result(self, result: Optional[dict]) -> str:
+        """处理结果"""
+        if result is None:
+            return json.dumps(UVX_NOT_FOUND_ERROR, ensure_ascii=False)
+        if "content" in result:
+            content = result["content"]
+            if isinstance(content, list):
+                if len(content) > 0 and isinstance(content[0], dict):
+                    return content[0].get("text", json.dumps(content, ensure_ascii=False))
+                return json.dumps(content, ensure_ascii=False)
+            elif isinstance(content, str):
+                return content
+            else:
+                return json.dumps(content, ensure_ascii=False)
+        elif "text" in result:
+            return result["text"]
+        else:
+            return json.dumps(result, ensure_ascii=False)
     
     async def _arun(self, city: str) -> str:
-        """异步版本"""
-        return self._run(city)
+        """异步版本（直接await传输，不占用线程）"""
+        try:
+            runtime = await aget_tool_runtime()
+            result = await runtime.acall_tool("maps_weather", self._build_arguments(city))
+            return self._format_result(result)
+        except Exception as e:
+            return f"Error calling AmapWeatherTool: {str(e)}"
+
+
+class AmapMultiSearchInput(BaseModel):
+    """高德地图多关键词POI搜索工具输入参数"""
+    keywords: List[str] = Field(description="List of search keywords, one per interest, e.g. ['历史文化', '美食', '自然风光']")
+    city: str = Field(description="City name, e.g., 'Beijing', 'Shanghai'")
+    citylimit: str = Field(default="true", description="Whether to limit search within city boundaries")
+
+
+class AmapMultiSearchTool(BaseTool):
+    """
+    高德地图多关键词POI搜索工具 - LangChain版本
+
+    功能：一次工具调用搜索多个关键词（每个用户偏好一个），
+    各关键词的maps_text_search并发执行，按POI id去重后合并成一个紧凑列表
+
+    用户选择多个偏好时，Agent不需要为每个偏好单独调用一次工具（受max_iterations限制），
+    一次往返就能覆盖所有偏好；结果按关键词轮流排列，截断后每个偏好仍然有代表
+    """
+    name: str = "amap_maps_multi_search"
+    description: str = (
+        "Search Amap POIs for several keywords at once (e.g. one keyword per user preference). "
+        "Input: keywords (a list) and city. The searches run concurrently and the results are merged "
+        "into one deduplicated list; each POI notes which keyword found it. "
+        "Prefer this over repeated amap_maps_text_search calls when there is more than one keyword."
+    )
+    args_schema: Type[BaseModel] = AmapMultiSearchInput
+
+    def _run(self, keywords: List[str], city: str, citylimit: str = "true") -> str:
+        """同步版本：各关键词在线程池中并发搜索"""
+        try:
+            runtime = get_tool_runtime()
+            if runtime.transport is None:
+                return json.dumps(runtime.unavailable, ensure_ascii=False)
+            keywords, arguments = self._build_searches(keywords, city, citylimit)
+            with ThreadPoolExecutor(max_workers=len(keywords)) as executor:
+                outcomes = list(executor.map(lambda args: self._search(runtime, args), arguments))
+            return self._merge(city, keywords, outcomes)
+        except Exception as e:
+            return f"Error calling AmapMultiSearchTool: {str(e)}"
+
+    async def _arun(self, keywords: List[str], city: str, citylimit: str = "true") -> str:
+        """异步版本：各关键词的搜索用asyncio.gather并发执行，不占用线程"""
+        try:
+            runtime = await aget_tool_runtime()
+            if runtime.transport is None:
+                return json.dumps(runtime.unavailable, ensure_ascii=False)
+            keywords, arguments = self._build_searches(keywords, city, citylimit)
+            outcomes = await asyncio.gather(*(self._asearch(runtime, args) for args in arguments))
+            return self._merge(city, keywords, list(outcomes))
+        except Exception as e:
+            return f"Error calling AmapMultiSearchTool: {str(e)}"
+
+    def _build_searches(self, keywords: List[str], city: str, citylimit: str) -> Tuple[List[str], List[Dict[str, str]]]:
+        """去掉空白和重复的关键词，构造每个关键词的maps_text_search参数"""
+        unique = list(dict.fromkeys(keyword.strip() for keyword in keywords if keyword and keyword.strip()))
+        unique = unique[:MULTI_SEARCH_MAX_KEYWORDS]
+        if not unique:
+            raise ValueError("keywords must contain at least one keyword")
+        chinese_city = translate_city_name(city)
+        print(f"   🔄 Translated city name: {city} -> {chinese_city}")
+        return unique, [{"keywords": keyword, "city": chinese_city, "citylimit": citylimit} for keyword in unique]
+
+    @staticmethod
+    def _search(runtime: AmapToolRuntime, arguments: Dict[str, str]) -> Tuple[Optional[dict], Optional[str]]:
+        """单个关键词的搜索，返回(结果, 错误信息)，失败不影响其他关键词"""
+        try:
+            return runtime.call_tool("maps_text_search", arguments), None
+        except Exception as e:
+            return None, str(e)
+
+    @staticmethod
+    async def _asearch(runtime: AmapToolRuntime, arguments: Dict[str, str]) -> Tuple[Optional[dict], Optional[str]]:
+        try:
+            return await runtime.acall_tool("maps_text_search", arguments), None
+        except Exception as e:
+            return None, str(e)
+
+    def _merge(self, city: str, keywords: List[str], outcomes: List[Tuple[Optional[dict], Optional[str]]]) -> str:
+        """合并各关键词的结果（全部失败时返回Error字符串）"""
+        errors = {keyword: error for keyword, (_, error) in zip(keywords, outcomes) if error}
+        if len(errors) == len(keywords):
+            raise RuntimeError("; ".join(f"{keyword}: {error}" for keyword, error in errors.items()))
+
+        # 复用单关键词工具的结果解析（MCP文本内容 -> POI JSON）
+        text_search = AmapTextSearchTool()
+        results = [
+            (keyword, text_search._format_result(result))
+            for keyword, (result, error) in zip(keywords, outcomes) if not error
+        ]
+        pois = merge_poi_results(results, limit=MULTI_SEARCH_MAX_RESULTS)
+        merged: Dict[str, Any] = {"city": city, "keywords": keywords, "count": len(pois), "pois": pois}
+        if errors:
+            merged["errors"] = errors
+        return json.dumps(merged, ensure_ascii=False)
 
 
 def get_amap_tools() -> list[BaseTool]:
@@ -270,6 +415,7 @@ def get_amap_tools() -> list[BaseTool]:
     """
     return [
         AmapTextSearchTool(),
+        AmapMultiSearchTool(),
         AmapWeatherTool(),
         # 其他工具可以在这里添加
     ]
@@ -0,0 +1,258 @@
+"""
+限流服务 - 令牌桶 + 每日配额
+
+高德Key有每秒请求数(QPS)和每日调用量两种限制，超出后返回错误结果，
+Agent会把错误当成需要重试的情况，额外消耗LLM迭代。这里在请求发出前限流：
+1. TokenBucket：按预约顺序排队，等待时间超过截止时间才失败，吞吐保持在允许的最大速率
+2. DailyQuota：按北京时间自然日统计用量，配额用完后当天直接拒绝，并提供剩余量
+3. RateLimiter：组合每个Key的总桶、每个工具的桶和每个工具的每日配额
+
+状态只保存在进程内存中（进程重启后当天的用量从0开始计）
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# 高德的日配额按北京时间零点重置
+QUOTA_TIMEZONE = timezone(timedelta(hours=8))
+
+
+class RateLimitTimeoutError(TimeoutError):
+    """在截止时间内等不到令牌"""
+
+
+class QuotaExceededError(RuntimeError):
+    """今天的调用配额已经用完"""
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    每次获取先"预约"令牌（令牌数可以为负），负数部分按速率折算成需要等待的时间，
+    所以排队的调用方按预约顺序依次放行；预计等待超过截止时间时退还令牌并失败
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数（即允许的QPS）
+            capacity: 桶容量（允许的突发量），默认与rate相同且至少为1
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.total_waited = 0.0
+        self.rejected = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, cost: float = 1.0) -> float:
+        """预约令牌，返回需要等待的秒数（0表示立即可用）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= cost
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.total_waited += wait
+            return wait
+
+    def refund(self, cost: float = 1.0):
+        """退还预约的令牌（调用没有发出时）"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + cost)
+
+    def drain(self):
+        """清空令牌（服务器报告QPS超限时使用，之后的调用按速率重新排队）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "available": round(self.available, 2),
+            "total_waited": round(self.total_waited, 3),
+            "rejected": self.rejected,
+        }
+
+
+class DailyQuota:
+    """每日配额（北京时间自然日），limit为0表示不限"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._day = self._today()
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+
+    def _roll(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.used = 0
+
+    def consume(self, cost: int = 1) -> bool:
+        """消耗配额，剩余不足时返回False（不消耗）"""
+        with self._lock:
+            self._roll()
+            if self.limit and self.used + cost > self.limit:
+                return False
+            self.used += cost
+            return True
+
+    def refund(self, cost: int = 1):
+        with self._lock:
+            self.used = max(0, self.used - cost)
+
+    def exhaust(self):
+        """服务器报告日配额已用完：当天剩余量记为0"""
+        with self._lock:
+            self._roll()
+            self.used = max(self.used, self.limit)
+
+    @property
+    def remaining(self) -> Optional[int]:
+        """当天剩余量，不限时为None"""
+        with self._lock:
+            self._roll()
+            return max(0, self.limit - self.used) if self.limit else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"day": self._day, "limit": self.limit, "used": self.used, "remaining": self.remaining}
+
+
+class RateLimiter:
+    """
+    每个Key的总令牌桶 + 每个工具的令牌桶和每日配额
+
+    Args:
+        key_qps: 整个Key的QPS上限，0表示不限
+        tool_qps: 每个工具的默认QPS上限，0表示不限
+        tool_qps_overrides: 个别工具的QPS上限
+        daily_quota: 每个工具的每日配额，0表示不限
+        max_wait: 排队等待令牌的最长时间(秒)
+    """
+
+    def __init__(
+        self,
+        key_qps: float = 0,
+        tool_qps: float = 0,
+        tool_qps_overrides: Optional[Dict[str, float]] = None,
+        daily_quota: int = 0,
+        max_wait: float = 15.0
+    ):
+        self.key_bucket = TokenBucket(key_qps) if key_qps > 0 else None
+        self.tool_qps = tool_qps
+        self.tool_qps_overrides = tool_qps_overrides or {}
+        self.daily_quota = daily_quota
+        self.max_wait = max_wait
+        self._tool_buckets: Dict[str, Optional[TokenBucket]] = {}
+        self._quotas: Dict[str, DailyQuota] = {}
+        self._lock = threading.Lock()
+
+    def _tool_bucket(self, tool_name: str) -> Optional[TokenBucket]:
+        with self._lock:
+            if tool_name not in self._tool_buckets:
+                qps = self.tool_qps_overrides.get(tool_name, self.tool_qps)
+                self._tool_buckets[tool_name] = TokenBucket(qps) if qps > 0 else None
+            return self._tool_buckets[tool_name]
+
+    def quota(self, tool_name: str) -> DailyQuota:
+        with self._lock:
+            if tool_name not in self._quotas:
+                self._quotas[tool_name] = DailyQuota(self.daily_quota)
+            return self._quotas[tool_name]
+
+    def _reserve(self, tool_name: str, cost: int, max_wait: Optional[float]) -> float:
+        """消耗配额并预约两个桶的令牌，返回需要等待的秒数"""
+        quota = self.quota(tool_name)
+        if not quota.consume(cost):
+            raise QuotaExceededError(f"Daily quota for {tool_name} exhausted ({quota.limit} calls)")
+
+        buckets: List[TokenBucket] = [bucket for bucket in (self.key_bucket, self._tool_bucket(tool_name)) if bucket]
+        wait = max([bucket.reserve(cost) for bucket in buckets], default=0.0)
+        limit = self.max_wait if max_wait is None else max_wait
+        if wait > limit:
+            for bucket in buckets:
+                bucket.refund(cost)
+                bucket.rejected += 1
+            quota.refund(cost)
+            raise RateLimitTimeoutError(f"Rate limit for {tool_name}: no capacity within {limit:.1f}s")
+        return wait
+
+    def _release(self, tool_name: str, cost: int):
+        """调用没有发出（等待时被取消）：退还令牌和配额"""
+        for bucket in (self.key_bucket, self._tool_bucket(tool_name)):
+            if bucket:
+                bucket.refund(cost)
+        self.quota(tool_name).refund(cost)
+
+    def acquire(self, tool_name: str, cost: int = 1, max_wait: Optional[float] = None):
+        """同步获取（阻塞当前线程直到轮到自己）"""
+        wait = self._reserve(tool_name, cost, max_wait)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tool_name: str, cost: int = 1, max_wait: Optional[float] = None):
+        """异步获取（等待期间不占用事件循环）"""
+        wait = self._reserve(tool_name, cost, max_wait)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self._release(tool_name, cost)
+                raise
+
+    def report_limit_error(self, tool_name: str, message: str):
+        """根据高德返回的错误信息调整状态：QPS超限时清空令牌，日配额超限时当天不再请求"""
+        if "DAILY_QUERY_OVER_LIMIT" in message:
+            self.quota(tool_name).exhaust()
+        elif "QPS_HAS_EXCEEDED" in message:
+            for bucket in (self.key_bucket, self._tool_bucket(tool_name)):
+                if bucket:
+                    bucket.drain()
+
+    def stats(self) -> Dict[str, Any]:
+        """各桶状态和每个工具的配额用量/剩余"""
+        with self._lock:
+            tools: List[Tuple[str, Optional[TokenBucket]]] = list(self._tool_buckets.items())
+            quotas = dict(self._quotas)
+        return {
+            "key": self.key_bucket.stats() if self.key_bucket else None,
+            "max_wait": self.max_wait,
+            "tools": {
+                name: {
+                    "bucket": bucket.stats() if bucket else None,
+                    "quota": quotas[name].stats() if name in quotas else None,
+                }
+                for name, bucket in tools
+            },
+        }
+
+
+def parse_rate_overrides(text: str) -> Dict[str, float]:
+    """解析 "maps_weather=5,maps_geo=10" 形式的配置"""
+    overrides = {}
+    for item in text.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            overrides[name.strip()] = float(value)
+    return overrides
@@ -0,0 +1,153 @@
+"""
+出行时间矩阵 - 一天的景点和酒店之间两两的路线距离/时间
+
+N个点有 N(N-1)/2 对，全部调用高德路线接口既慢又消耗配额，这里做了三件事：
+1. 对称缓存：A->B 和 B->A 共用一条路线，缓存键是量化后的坐标（默认保留4位小数，约11米），
+   所以同一景点的坐标略有差异时也能命中
+2. 近邻优先：先并发规划每个点按球面距离最近的 neighbors 个点
+3. 剪枝：球面距离除以该出行方式的最高速度是出行时间的下界。
+   某一对的下界已经不小于两个端点各自第 neighbors 短的已知路线时间，它就不可能进入任一端点
+   按出行时间排序的前 neighbors 名，这一对不再请求，改用球面距离估算（标记为estimated）；
+   没被剪掉的点对作为下一轮并发规划，直到没有需要规划的点对
+
+路线调用本身通过AmapService的批量调用完成（去重、并发上限、限流和工具缓存都在那里）。
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .cache_service import get_tool_cache, get_tool_cache_ttl, make_cache_key
+
+# 出行方式 -> 按坐标规划路线的工具
+MATRIX_ROUTE_TOOLS = {
+    "walking": "maps_direction_walking",
+    "bicycling": "maps_direction_bicycling",
+    "driving": "maps_direction_driving",
+    "transit": "maps_direction_transit_integrated",
+}
+
+# 各出行方式的 (最高速度, 平均速度)，单位km/h：最高速度用于下界剪枝，平均速度用于估算被剪掉的点对
+MODE_SPEEDS_KMH = {
+    "walking": (7.0, 4.5),
+    "bicycling": (25.0, 12.0),
+    "driving": (120.0, 30.0),
+    "transit": (100.0, 20.0),
+}
+
+# 实际路线距离 ≈ 球面距离 × 绕行系数
+DETOUR_FACTOR = 1.3
+
+Pair = Tuple[int, int]
+
+
+def quantize(location: Sequence[float], precision: int) -> str:
+    """[经度, 纬度] -> "lng,lat"（保留precision位小数），同时用作路线接口的坐标参数"""
+    return f"{location[0]:.{precision}f},{location[1]:.{precision}f}"
+
+
+def pair_cache_key(route_type: str, a: str, b: str, city: Optional[str] = None) -> str:
+    """对称点对的缓存键（两个量化坐标排序后参与哈希）"""
+    return make_cache_key("route_matrix", [route_type, city or "", sorted([a, b])])
+
+
+def nearest_pairs(distances: np.ndarray, neighbors: int) -> Set[Pair]:
+    """每个点与其球面距离最近的neighbors个点组成的点对（i < j）"""
+    n = len(distances)
+    if neighbors <= 0 or neighbors >= n - 1:
+        return {(i, j) for i in range(n) for j in range(i + 1, n)}
+    pairs = set()
+    for i in range(n):
+        order = [j for j in np.argsort(distances[i], kind="stable") if j != i][:neighbors]
+        pairs.update((min(i, int(j)), max(i, int(j))) for j in order)
+    return pairs
+
+
+def lower_bound_seconds(distances: np.ndarray, route_type: str) -> np.ndarray:
+    """出行时间下界(秒)：球面距离按最高速度计算"""
+    max_speed, _ = MODE_SPEEDS_KMH.get(route_type, MODE_SPEEDS_KMH["walking"])
+    return distances / max_speed * 3600
+
+
+def undominated_pairs(
+    candidates: Set[Pair],
+    known: Dict[Pair, Tuple[float, int]],
+    lower_bounds: np.ndarray,
+    neighbors: int
+) -> Set[Pair]:
+    """
+    还需要规划的点对
+
+    端点已有至少neighbors条已知路线时，阈值取其中第neighbors短的时间，否则阈值为无穷大；
+    下界小于任一端点阈值的点对可能进入该端点的前neighbors名，需要规划。
+    已知路线越多阈值只会越小，所以反复调用直到返回空集合即可结束
+    """
+    n = len(lower_bounds)
+    durations: List[List[int]] = [[] for _ in range(n)]
+    for (i, j), (_, duration) in known.items():
+        durations[i].append(duration)
+        durations[j].append(duration)
+    thresholds = [sorted(times)[neighbors - 1] if len(times) >= neighbors else float("inf") for times in durations]
+    return {(i, j) for i, j in candidates if lower_bounds[i, j] < max(thresholds[i], thresholds[j])}
+
+
+def estimate_route(distance_km: float, route_type: str) -> Tuple[float, int]:
+    """按球面距离估算 (路线距离(米), 时间(秒))"""
+    _, speed = MODE_SPEEDS_KMH.get(route_type, MODE_SPEEDS_KMH["walking"])
+    distance = distance_km * DETOUR_FACTOR
+    return round(distance * 1000, 1), int(round(distance / speed * 3600))
+
+
+def load_cached_pairs(keys: Dict[Pair, str]) -> Dict[Pair, Tuple[float, int]]:
+    """读取已缓存的点对（工具缓存关闭时为空）"""
+    cache = get_tool_cache()
+    if cache is None:
+        return {}
+    cached = {}
+    for pair, key in keys.items():
+        value = cache.get(key)
+        if value is not None:
+            data = json.loads(value)
+            cached[pair] = (data["distance"], data["duration"])
+    return cached
+
+
+def store_cached_pairs(keys: Dict[Pair, str], routes: Dict[Pair, Tuple[float, int]], route_type: str):
+    """写入新规划的点对，TTL与路线工具相同"""
+    cache = get_tool_cache()
+    if cache is None:
+        return
+    ttl = get_tool_cache_ttl(MATRIX_ROUTE_TOOLS[route_type])
+    if ttl <= 0:
+        return
+    for pair, (distance, duration) in routes.items():
+        try:
+            cache.set(keys[pair], json.dumps({"distance": distance, "duration": duration}), ttl=ttl)
+        except Exception as e:
+            print(f"⚠️  Route matrix cache write failed: {str(e)}")
+
+
+def build_matrix(distances: np.ndarray, routes: Dict[Pair, Tuple[float, int]], route_type: str) -> Dict[str, Any]:
+    """
+    组装对称矩阵，没有路线的点对用估算值
+
+    Returns:
+        {"durations": 秒, "distances": 米, "estimated": 是否为估算值}，均为 n×n 列表
+    """
+    n = len(distances)
+    durations = [[0] * n for _ in range(n)]
+    lengths = [[0.0] * n for _ in range(n)]
+    estimated = [[False] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            if (i, j) in routes:
+                distance, duration = routes[(i, j)]
+                is_estimate = False
+            else:
+                distance, duration = estimate_route(float(distances[i, j]), route_type)
+                is_estimate = True
+            durations[i][j] = durations[j][i] = duration
+            lengths[i][j] = lengths[j][i] = distance
+            estimated[i][j] = estimated[j][i] = is_estimate
+    return {"durations": durations, "distances": lengths, "estimated": estimated}
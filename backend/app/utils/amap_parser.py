@@ -0,0 +1,216 @@
+"""
+Amap tool results -> typed models
+
+Both transports return MCP-style results ({"content": [{"type": "text", "text": "<JSON>"}]}),
+but the JSON inside differs a little between amap-mcp-server and the REST API
+(e.g. {"results": [...]} vs {"geocodes": [...]}, {"forecasts": [...]} vs
+{"forecasts": [{"casts": [...]}]}). The parsers here accept both shapes:
+
+- The payload is loaded with json.loads (no regex); prose around a JSON object
+  is tolerated by falling back to the outermost {...} block
+- Each item is mapped field-by-field onto a plain dict and validated with
+  Model.model_validate, so Amap's quirks ([] for missing values, numbers as
+  strings, "lng,lat" locations) are handled without per-field exceptions
+- Items that still fail validation (e.g. a POI without coordinates) are skipped
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from ..models.schemas import Location, POIInfo, RouteInfo, WeatherInfo
+from .prompt_compaction import field_text, find_forecasts, find_pois, load_json
+
+ROUTE_LABELS = {"walking": "步行", "driving": "驾车", "transit": "公交", "bicycling": "骑行"}
+
+# 路线描述中最多列出的步骤数
+MAX_ROUTE_STEPS = 5
+
+
+class AmapParseError(ValueError):
+    """The tool result is an error or does not contain a JSON payload"""
+
+
+def tool_result_payload(result: Optional[Dict[str, Any]]) -> Any:
+    """
+    Extract the JSON payload from an MCP-style tool result
+
+    Raises:
+        AmapParseError: The result is an MCP error or its text is not JSON
+    """
+    if not isinstance(result, dict):
+        raise AmapParseError("Empty tool result")
+
+    content = result.get("content")
+    if isinstance(content, list) and content and isinstance(content[0], dict):
+        text = content[0].get("text", "")
+    elif isinstance(content, str):
+        text = content
+    elif "text" in result:
+        text = result["text"]
+    else:
+        # Already a payload (e.g. a result built in-process)
+        return result
+
+    if result.get("isError"):
+        raise AmapParseError(f"Amap tool error: {text}")
+    if not isinstance(text, str):
+        return text
+    try:
+        return json.loads(text)
+    except ValueError:
+        data = load_json(text)
+    if data is None:
+        raise AmapParseError(f"Amap tool returned no JSON: {text[:200]}")
+    return data
+
+
+def payload_error(data: Any) -> Optional[str]:
+    """
+    Error message of an error payload, None for a normal payload
+
+    amap-mcp-server and the tools themselves (e.g. uvx missing) reply {"error": ...};
+    the REST API replies {"status": "0", "info": ...}
+    """
+    if not isinstance(data, dict):
+        return None
+    if "error" in data:
+        return field_text(data["error"]) or "unknown error"
+    if str(data.get("status", "1")) != "1":
+        return field_text(data.get("info")) or f"status {field_text(data.get('status'))}"
+    return None
+
+
+def parse_location(value: Any) -> Optional[Location]:
+    """"116.397,39.918", {"longitude": ..., "latitude": ...} or {"lng": ..., "lat": ...} -> Location"""
+    if isinstance(value, str):
+        longitude, _, latitude = value.partition(",")
+        value = {"longitude": longitude.strip(), "latitude": latitude.strip()}
+    elif isinstance(value, dict) and "lng" in value:
+        value = {"longitude": value.get("lng"), "latitude": value.get("lat")}
+    try:
+        return Location.model_validate(value)
+    except ValidationError:
+        return None
+
+
+def parse_pois(data: Any) -> List[POIInfo]:
+    """POI search / detail payload -> POIInfo list (POIs without coordinates are skipped)"""
+    pois = []
+    for poi in find_pois(data):
+        location = parse_location(poi.get("location"))
+        if location is None:
+            continue
+        try:
+            pois.append(POIInfo.model_validate({
+                "id": field_text(poi.get("id")),
+                "name": field_text(poi.get("name")),
+                "type": field_text(poi.get("type") or poi.get("typecode")),
+                "address": field_text(poi.get("address")),
+                "location": location,
+                "tel": field_text(poi.get("tel")) or None,
+            }))
+        except ValidationError:
+            continue
+    return pois
+
+
+def parse_weather(data: Any) -> List[WeatherInfo]:
+    """Weather payload -> one WeatherInfo per forecast day"""
+    forecasts = []
+    for cast in find_forecasts(data):
+        try:
+            forecasts.append(WeatherInfo.model_validate({
+                "date": field_text(cast.get("date")),
+                "day_weather": field_text(cast.get("dayweather")),
+                "night_weather": field_text(cast.get("nightweather")),
+                "day_temp": field_text(cast.get("daytemp")),
+                "night_temp": field_text(cast.get("nighttemp")),
+                "wind_direction": field_text(cast.get("daywind")),
+                "wind_power": field_text(cast.get("daypower")),
+            }))
+        except ValidationError:
+            continue
+    return forecasts
+
+
+def parse_geocode(data: Any) -> Optional[Location]:
+    """Geocode payload (REST {"geocodes": [...]} or MCP {"results": [...]}) -> first Location"""
+    if not isinstance(data, dict):
+        return None
+    for item in data.get("geocodes") or data.get("results") or []:
+        if isinstance(item, dict):
+            location = parse_location(item.get("location"))
+            if location is not None:
+                return location
+    return None
+
+
+def parse_poi_detail(data: Any) -> Dict[str, Any]:
+    """POI detail payload -> the detail dict (REST wraps it as {"pois": [detail]}, MCP returns it directly)"""
+    if isinstance(data, dict) and isinstance(data.get("pois"), list) and data["pois"]:
+        data = data["pois"][0]
+    return data if isinstance(data, dict) else {"raw": data}
+
+
+def parse_route(data: Any, route_type: str) -> Optional[RouteInfo]:
+    """
+    Route payload -> RouteInfo for the first (recommended) plan
+
+    Walking/driving use route.paths[0]; transit uses route.transits[0], whose
+    description lists the lines to take instead of turn-by-turn steps.
+    """
+    if not isinstance(data, dict):
+        return None
+    # v3路线接口为 {"route": {...}}，v4骑行接口为 {"data": {...}}
+    route = next((data[key] for key in ("route", "data") if isinstance(data.get(key), dict)), data)
+
+    if route.get("transits"):
+        plan = route["transits"][0]
+        distance = plan.get("distance") or route.get("distance")
+        steps = _transit_lines(plan)
+        separator = " → "
+    elif route.get("paths"):
+        plan = route["paths"][0]
+        distance = plan.get("distance")
+        steps = [field_text(step.get("instruction")) for step in plan.get("steps") or [] if isinstance(step, dict)]
+        separator = "；"
+    else:
+        return None
+
+    summary = f"{ROUTE_LABELS.get(route_type, route_type)} {_number(distance) / 1000:.1f}公里，约{round(_number(plan.get('duration')) / 60)}分钟"
+    steps = [step for step in steps if step][:MAX_ROUTE_STEPS]
+    try:
+        return RouteInfo.model_validate({
+            "distance": _number(distance),
+            "duration": int(_number(plan.get("duration"))),
+            "route_type": route_type,
+            "description": f"{summary}：{separator.join(steps)}" if steps else summary,
+        })
+    except ValidationError:
+        return None
+
+
+def _transit_lines(plan: dict) -> List[str]:
+    """Bus/subway/railway names of a transit plan, in riding order"""
+    lines = []
+    for segment in plan.get("segments") or []:
+        if not isinstance(segment, dict):
+            continue
+        bus = segment.get("bus") if isinstance(segment.get("bus"), dict) else {}
+        buslines = bus.get("buslines") or []
+        if buslines and isinstance(buslines[0], dict):
+            lines.append(field_text(buslines[0].get("name")))
+        railway = segment.get("railway") if isinstance(segment.get("railway"), dict) else {}
+        if railway.get("name"):
+            lines.append(field_text(railway.get("name")))
+    return lines
+
+
+def _number(value: Any) -> float:
+    """Amap numbers are strings, and [] when missing"""
+    try:
+        return float(field_text(value) or 0)
+    except ValueError:
+        return 0.0
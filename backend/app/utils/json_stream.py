@@ -0,0 +1,109 @@
+"""
+Incremental JSON parsing for streamed LLM output
+
+The planner returns one large JSON object. While its tokens are still
+arriving, DayPlanStreamParser extracts every complete element of the
+top-level "days" array so each DayPlan can be sent to the client as soon
+as its closing brace has been generated.
+"""
+
+import json
+from typing import List, Optional
+
+
+class DayPlanStreamParser:
+    """
+    Extract complete items of the top-level "days" array from a token stream
+
+    The parser keeps a character-level scanner state (string/escape flags,
+    nesting depth, last key seen at the top level), so every chunk is
+    scanned exactly once. Text before the JSON object, such as a ```json
+    fence, is skipped.
+
+    Example:
+        parser = DayPlanStreamParser()
+        for chunk in chunks:
+            for day in parser.feed(chunk):
+                print(day["day_index"])
+    """
+
+    def __init__(self, array_key: str = "days"):
+        self.array_key = array_key
+        self.buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start: Optional[int] = None
+        self._last_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[dict]:
+        """
+        Append a chunk and return the array items completed by it
+
+        Args:
+            chunk: Next piece of streamed text
+
+        Returns:
+            List of parsed items (dicts) that became complete
+        """
+        self.buffer += chunk
+        items = []
+
+        while self._pos < len(self.buffer):
+            index = self._pos
+            char = self.buffer[index]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._string_start is not None:
+                        # Candidate key of the top-level object
+                        self._last_key = self.buffer[self._string_start:index]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = index + 1
+            elif char in "{[":
+                if (
+                    char == "["
+                    and self._depth == 1
+                    and self._array_depth is None
+                    and self._last_key == self.array_key
+                ):
+                    self._array_depth = self._depth + 1
+                elif char == "{" and self._array_depth is not None and self._depth == self._array_depth:
+                    self._item_start = index
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if (
+                    char == "}"
+                    and self._item_start is not None
+                    and self._depth == self._array_depth
+                ):
+                    item = self._decode(self.buffer[self._item_start:index + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._item_start = None
+                elif char == "]" and self._array_depth is not None and self._depth == self._array_depth - 1:
+                    self._array_depth = -1  # Array finished, ignore later arrays with the same key
+
+        return items
+
+    @staticmethod
+    def _decode(text: str) -> Optional[dict]:
+        """Decode one array item, skipping malformed ones"""
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return value if isinstance(value, dict) else None
@@ -0,0 +1,264 @@
+"""
+Prompt compaction for retrieval stage outputs
+
+Amap tool results are verbose JSON (photos, business areas, phone numbers,
+nested biz_ext objects...) and the planner only needs a handful of fields.
+This module turns a stage output into a compact table before it is pasted
+into the planner prompt:
+
+- POI results -> "id | name | type | lng,lat | address | rating | cost" rows,
+  deduplicated and limited to the top-K in search-relevance order
+- Weather results -> one row per forecast day
+- Anything else (e.g. an agent's prose answer) is kept as-is
+
+Every section is capped at a token budget; rows that do not fit are dropped
+and the number of omitted rows is noted.
+
+The payload helpers (load_json, find_pois, find_forecasts, field_text) are
+shared with amap_parser, which reads the same response shapes.
+"""
+
+import json
+import re
+from itertools import zip_longest
+from typing import Any, List, Optional, Tuple
+
+# CJK characters are roughly one token each, other text roughly four characters per token
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+POI_COLUMNS = "id | name | type | lng,lat | address | rating | cost"
+WEATHER_COLUMNS = "date | day | night | temp day/night (°C) | wind"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap, tokenizer-independent token estimate for mixed Chinese/English text"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_budget(text: str, token_budget: int) -> str:
+    """Cut text so that its estimated size fits the token budget"""
+    if estimate_tokens(text) <= token_budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= token_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + " ...(truncated)"
+
+
+def compact_stage_output(stage: str, output: str, top_k: int = 15, token_budget: int = 800) -> str:
+    """
+    Compact one retrieval stage output for the planner prompt
+
+    Args:
+        stage: Stage name ("attractions", "hotels" or "weather")
+        output: Raw stage output (tool JSON or agent text)
+        top_k: Maximum number of POI rows
+        token_budget: Estimated token limit for the section
+
+    Returns:
+        Compact section text
+    """
+    data = load_json(output)
+    if data is not None:
+        if stage == "weather":
+            rows = [_weather_row(cast) for cast in find_forecasts(data)]
+            if rows:
+                return _render_table(WEATHER_COLUMNS, rows, token_budget)
+        else:
+            pois = _dedupe_pois(find_pois(data))
+            if pois:
+                rows = [_poi_row(poi) for poi in pois[:top_k]]
+                omitted = len(pois) - len(rows)
+                return _render_table(POI_COLUMNS, rows, token_budget, omitted)
+    return truncate_to_budget(output, token_budget)
+
+
+def parse_poi_table(text: str) -> List[dict]:
+    """
+    Read rows back from a POI table produced by compact_stage_output
+
+    Returns:
+        List of {"id", "name", "type", "longitude", "latitude", "address"} dicts;
+        rows without valid coordinates are skipped
+    """
+    lines = text.splitlines()
+    if not lines or lines[0] != POI_COLUMNS:
+        return []
+    pois = []
+    for line in lines[1:]:
+        fields = line.split(" | ")
+        if len(fields) != 7:
+            continue
+        try:
+            longitude, latitude = (float(value) for value in fields[3].split(","))
+        except ValueError:
+            continue
+        pois.append({
+            "id": fields[0],
+            "name": fields[1],
+            "type": fields[2],
+            "longitude": longitude,
+            "latitude": latitude,
+            "address": fields[4],
+        })
+    return pois
+
+
+def merge_poi_results(results: List[Tuple[str, str]], limit: Optional[int] = None) -> List[dict]:
+    """
+    Merge POI search outputs for several keywords into one compact list
+
+    Results are interleaved round-robin (first POI of every keyword, then the
+    second, ...) so that a limit keeps every keyword represented, and POIs found
+    by more than one keyword are kept once.
+
+    Args:
+        results: (keyword, raw tool output) pairs
+        limit: Maximum number of POIs
+
+    Returns:
+        List of {"id", "name", "type", "location", "address", "rating", "cost", "keyword"} dicts
+    """
+    per_keyword = []
+    for keyword, output in results:
+        data = load_json(output)
+        per_keyword.append([(keyword, poi) for poi in (find_pois(data) if data is not None else [])])
+
+    interleaved = [item for group in zip_longest(*per_keyword) for item in group if item is not None]
+    keywords = {id(poi): keyword for keyword, poi in interleaved}
+    pois = _dedupe_pois([poi for _, poi in interleaved])[:limit]
+    return [_compact_poi(poi, keywords[id(poi)]) for poi in pois]
+
+
+def _compact_poi(poi: dict, keyword: str) -> dict:
+    """Keep only the fields the planner uses (same fields as a POI table row)"""
+    id_, name, poi_type, location, address, rating, cost = _poi_row(poi).split(" | ")
+    return {
+        "id": id_,
+        "name": name,
+        "type": poi_type,
+        "location": location,
+        "address": address,
+        "rating": rating,
+        "cost": cost,
+        "keyword": keyword,
+    }
+
+
+def load_json(output: str) -> Optional[Any]:
+    """Parse the output itself or the first {...} block inside it"""
+    text = output.strip()
+    candidates = [text]
+    start, end = text.find("{"), text.rfind("}")
+    if 0 < start < end:
+        candidates.append(text[start:end + 1])
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def find_pois(data: Any) -> List[dict]:
+    """Collect POI dicts from the MCP ({"pois": [...]}) or REST response shapes"""
+    if isinstance(data, list):
+        return [item for item in data if isinstance(item, dict) and item.get("name")]
+    if isinstance(data, dict):
+        for key in ("pois", "results", "data"):
+            if isinstance(data.get(key), list):
+                return find_pois(data[key])
+    return []
+
+
+def find_forecasts(data: Any) -> List[dict]:
+    """Collect forecast days ({"forecasts": [...]} or REST {"forecasts": [{"casts": [...]}]})"""
+    if not isinstance(data, dict):
+        return []
+    forecasts = data.get("forecasts") or data.get("casts") or []
+    if not isinstance(forecasts, list):
+        return []
+    casts = []
+    for item in forecasts:
+        if isinstance(item, dict) and isinstance(item.get("casts"), list):
+            casts.extend(cast for cast in item["casts"] if isinstance(cast, dict))
+        elif isinstance(item, dict) and item.get("date"):
+            casts.append(item)
+    return casts
+
+
+def _dedupe_pois(pois: List[dict]) -> List[dict]:
+    """Drop repeated POIs (same id, or same name and address), keeping the first"""
+    seen = set()
+    unique = []
+    for poi in pois:
+        keys = {("name", field_text(poi.get("name")), field_text(poi.get("address")))}
+        if poi.get("id"):
+            keys.add(("id", field_text(poi.get("id"))))
+        if keys & seen:
+            continue
+        seen |= keys
+        unique.append(poi)
+    return unique
+
+
+def _poi_row(poi: dict) -> str:
+    biz_ext = poi.get("biz_ext") if isinstance(poi.get("biz_ext"), dict) else {}
+    poi_type = field_text(poi.get("type") or poi.get("typecode"))
+    location = poi.get("location")
+    if isinstance(location, dict):
+        location = f"{location.get('longitude', '')},{location.get('latitude', '')}"
+    return " | ".join([
+        field_text(poi.get("id")),
+        field_text(poi.get("name")),
+        poi_type.split(";")[-1],  # "风景名胜;公园广场;公园" -> "公园"
+        field_text(location),
+        field_text(poi.get("address")),
+        field_text(biz_ext.get("rating") or poi.get("rating")),
+        field_text(biz_ext.get("cost") or poi.get("cost")),
+    ])
+
+
+def _weather_row(cast: dict) -> str:
+    wind = field_text(cast.get("daywind"))
+    if cast.get("daypower"):
+        wind = f"{wind} {field_text(cast.get('daypower'))}".strip()
+    return " | ".join([
+        field_text(cast.get("date")),
+        field_text(cast.get("dayweather")),
+        field_text(cast.get("nightweather")),
+        f"{field_text(cast.get('daytemp'))}/{field_text(cast.get('nighttemp'))}",
+        wind,
+    ])
+
+
+def _render_table(columns: str, rows: List[str], token_budget: int, omitted: int = 0) -> str:
+    """Render rows under a header, dropping trailing rows that exceed the budget"""
+    lines = [columns]
+    used = estimate_tokens(columns)
+    for index, row in enumerate(rows):
+        cost = estimate_tokens(row) + 1
+        if used + cost > token_budget:
+            omitted += len(rows) - index
+            break
+        lines.append(row)
+        used += cost
+    if omitted:
+        lines.append(f"({omitted} more results omitted)")
+    return "\n".join(lines)
+
+
+def field_text(value: Any) -> str:
+    """Amap uses [] for missing fields; normalize everything to a single-line string"""
+    if value is None or value == [] or value == {}:
+        return ""
+    if isinstance(value, list):
+        value = ",".join(field_text(item) for item in value)
+    return " ".join(str(value).replace("|", "/").split())
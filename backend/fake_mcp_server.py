@@ -0,0 +1,109 @@
+"""
+Fake MCP Server for Tests
+
+A minimal stdio JSON-RPC server that speaks enough of the MCP protocol for
+the MCP client tests (initialize, tools/list, tools/call). No network and no
+Amap key are needed.
+
+Tools:
+- echo: returns its arguments and the server pid; {"delay": seconds} delays
+        the response (requests are handled concurrently, so delays overlap)
+- crash: exits the process immediately with code 3
+- log: writes {"kb": n} kilobytes of log lines to stderr before responding
+
+JSON-RPC batch arrays are accepted and answered with one response array.
+
+Environment:
+- FAKE_MCP_STARTUP_DELAY: seconds to sleep before reading stdin (slow start)
+
+Usage:
+    python fake_mcp_server.py
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+TOOLS = [
+    {"name": "echo", "description": "Echo the arguments", "inputSchema": {"type": "object"}},
+]
+
+_write_lock = threading.Lock()
+
+
+def write_message(message):
+    with _write_lock:
+        sys.stdout.write(json.dumps(message, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+def handle_request(request):
+    """Handle one request and return its response (None for notifications)"""
+    method = request.get("method")
+    params = request.get("params") or {}
+    request_id = request.get("id")
+    if request_id is None:
+        return None  # notification
+
+    if method == "initialize":
+        result = {
+            "protocolVersion": params.get("protocolVersion", "2024-11-05"),
+            "capabilities": {"tools": {}},
+            "serverInfo": {"name": "fake-mcp-server", "version": "1.0.0"},
+        }
+    elif method == "tools/list":
+        result = {"tools": TOOLS}
+    elif method == "tools/call":
+        name = params.get("name")
+        arguments = params.get("arguments") or {}
+        if name == "crash":
+            os._exit(3)
+        if name == "log":
+            line = f"fake server log line from pid {os.getpid()} " + "x" * 60 + "\n"
+            for _ in range(int(arguments.get("kb", 1)) * 1024 // len(line)):
+                sys.stderr.write(line)
+            sys.stderr.flush()
+            return {"jsonrpc": "2.0", "id": request_id, "result": {"content": [{"type": "text", "text": "logged"}]}}
+        if name != "echo":
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32602, "message": f"Unknown tool: {name}"}}
+        time.sleep(float(arguments.get("delay", 0)))
+        result = {"content": [{"type": "text", "text": json.dumps(arguments, ensure_ascii=False)}], "pid": os.getpid()}
+    else:
+        return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32601, "message": f"Unknown method: {method}"}}
+
+    return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+
+def handle_single(request):
+    response = handle_request(request)
+    if response is not None:
+        write_message(response)
+
+
+def handle_batch(requests):
+    """Handle a JSON-RPC batch concurrently and answer with one array"""
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        responses = list(executor.map(handle_request, requests))
+    responses = [response for response in responses if response is not None]
+    if responses:
+        write_message(responses)
+
+
+def main():
+    time.sleep(float(os.environ.get("FAKE_MCP_STARTUP_DELAY", 0)))
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        message = json.loads(line)
+        if isinstance(message, list):
+            threading.Thread(target=handle_batch, args=(message,), daemon=True).start()
+        elif "id" in message:
+            threading.Thread(target=handle_single, args=(message,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Amap Parser Test Script
+
+Purpose:
+1. Verify POI, weather and geocode payloads parse into typed models for both the MCP and REST shapes
+2. Verify walking/driving and transit routes parse into RouteInfo
+3. Verify error results, non-JSON text and incomplete items are handled
+4. Verify AmapService returns parsed models end to end (stub REST server)
+
+No network or Amap key is required.
+
+Usage:
+    python test_amap_parser.py
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.models.schemas import Location, POIInfo, RouteInfo, WeatherInfo
+from app.services.amap_service import AmapService
+from app.services.amap_transport import AmapHTTPTransport
+from app.utils.amap_parser import (
+    AmapParseError, parse_geocode, parse_location, parse_pois, parse_route, parse_weather, tool_result_payload
+)
+from test_amap_transport import start_stub_server
+
+
+def _result(payload) -> dict:
+    """Wrap a payload like the transports do"""
+    return {"content": [{"type": "text", "text": json.dumps(payload, ensure_ascii=False)}]}
+
+
+MCP_POIS = {"suggestion": {"keywords": [], "ciytes": []}, "pois": [
+    {"id": "B000A8UIN8", "name": "故宫博物院", "address": "景山前街4号", "typecode": "110201", "location": "116.397026,39.918058"},
+    {"id": "B000A81CB2", "name": "天坛公园", "address": [], "typecode": "110101"},  # no coordinates
+]}
+REST_POIS = {"status": "1", "pois": [
+    {"id": "B000A7BM4H", "name": "全聚德", "type": "餐饮服务;中餐厅;特色/地方风味餐厅", "address": "前门大街30号",
+     "location": "116.398,39.899", "tel": "010-65112418", "biz_ext": {"rating": "4.5"}},
+    {"id": "B0FFFAB6J2", "name": "护国寺小吃", "type": "餐饮服务", "address": "护国寺大街93号", "location": "116.372,39.935", "tel": []},
+]}
+MCP_WEATHER = {"city": "北京市", "forecasts": [
+    {"date": "2025-06-01", "dayweather": "晴", "nightweather": "多云", "daytemp": "30", "nighttemp": "18",
+     "daywind": "南", "daypower": "1-3"},
+]}
+REST_WEATHER = {"status": "1", "forecasts": [{"city": "北京市", "casts": [
+    {"date": "2025-06-01", "dayweather": "晴", "nightweather": "多云", "daytemp": "30", "nighttemp": "18", "daywind": "南", "daypower": "≤3"},
+    {"date": "2025-06-02", "dayweather": "小雨", "nightweather": "阴", "daytemp": "26℃", "nighttemp": "17", "daywind": [], "daypower": []},
+]}]}
+WALKING_ROUTE = {"route": {"origin": "116.397,39.918", "destination": "116.410,39.881", "paths": [
+    {"distance": "4860", "duration": "3880", "steps": [
+        {"instruction": "向南步行120米左转"}, {"instruction": "沿前门大街步行1.2千米"}, {"instruction": []}
+    ]}
+]}}
+TRANSIT_ROUTE = {"status": "1", "route": {"distance": "6300", "transits": [
+    {"duration": "2400", "distance": "7100", "segments": [
+        {"walking": {"distance": "300"}, "bus": {"buslines": [{"name": "地铁2号线(内环)"}]}},
+        {"bus": {"buslines": [{"name": "120路(北京站东--大北窑南)"}, {"name": "8路"}]}},
+        {"walking": {"distance": "200"}, "bus": {"buslines": []}},
+    ]}
+]}}
+
+
+def test_poi_weather_geocode():
+    """Both response shapes parse into POIInfo, WeatherInfo and Location"""
+    print("=" * 60)
+    print("Test 1: POI / Weather / Geocode")
+    print("=" * 60)
+
+    pois = parse_pois(tool_result_payload(_result(MCP_POIS)))
+    assert [poi.name for poi in pois] == ["故宫博物院"], "POIs without coordinates are skipped"
+    assert pois[0].type == "110201" and pois[0].location == Location(longitude=116.397026, latitude=39.918058)
+
+    pois = parse_pois(tool_result_payload(_result(REST_POIS)))
+    assert all(isinstance(poi, POIInfo) for poi in pois) and len(pois) == 2
+    assert pois[0].tel == "010-65112418" and pois[1].tel is None and pois[1].address == "护国寺大街93号"
+
+    forecasts = parse_weather(tool_result_payload(_result(REST_WEATHER)))
+    assert [cast.date for cast in forecasts] == ["2025-06-01", "2025-06-02"]
+    assert isinstance(forecasts[0], WeatherInfo) and forecasts[0].day_temp == 30 and forecasts[1].day_temp == 26
+    assert forecasts[1].wind_direction == "" and forecasts[0].wind_power == "≤3"
+    assert parse_weather(tool_result_payload(_result(MCP_WEATHER)))[0].night_weather == "多云"
+
+    assert parse_geocode({"status": "1", "geocodes": [{"location": "116.4,39.9"}]}) == Location(longitude=116.4, latitude=39.9)
+    assert parse_geocode({"results": [{"location": []}, {"location": "121.47,31.23"}]}).latitude == 31.23
+    assert parse_geocode({"geocodes": []}) is None
+    assert parse_location({"lng": "116.4", "lat": "39.9"}).longitude == 116.4
+    assert parse_location("") is None and parse_location([]) is None
+
+    print("✅ MCP and REST shapes parsed")
+    return True
+
+
+def test_routes():
+    """Walking paths and transit plans parse into RouteInfo"""
+    print("\n" + "=" * 60)
+    print("Test 2: Routes")
+    print("=" * 60)
+
+    route = parse_route(tool_result_payload(_result(WALKING_ROUTE)), "walking")
+    print(route.description)
+    assert isinstance(route, RouteInfo) and route.distance == 4860 and route.duration == 3880
+    assert route.description == "步行 4.9公里，约65分钟：向南步行120米左转；沿前门大街步行1.2千米"
+
+    route = parse_route(tool_result_payload(_result(TRANSIT_ROUTE)), "transit")
+    print(route.description)
+    assert route.distance == 7100 and route.duration == 2400
+    assert route.description.endswith("地铁2号线(内环) → 120路(北京站东--大北窑南)")
+
+    assert parse_route({"route": {"paths": []}}, "walking") is None
+    assert parse_route({"route": {"paths": [{"distance": [], "duration": []}]}}, "driving").description == "驾车 0.0公里，约0分钟"
+
+    print("✅ Routes parsed")
+    return True
+
+
+def test_errors():
+    """Errors raise AmapParseError; prose around JSON is tolerated"""
+    print("\n" + "=" * 60)
+    print("Test 3: Errors")
+    print("=" * 60)
+
+    for result in [
+        None,
+        {"content": [{"type": "text", "text": "API request failed: INVALID_USER_KEY"}], "isError": True},
+        {"content": [{"type": "text", "text": "No results found"}]},
+    ]:
+        try:
+            tool_result_payload(result)
+            assert False, f"no error for {result}"
+        except AmapParseError:
+            pass
+
+    wrapped = {"content": [{"type": "text", "text": "Result: " + json.dumps(MCP_WEATHER, ensure_ascii=False)}]}
+    assert len(parse_weather(tool_result_payload(wrapped))) == 1
+    assert parse_pois({"unexpected": True}) == [] and parse_weather([]) == []
+
+    print("✅ Errors handled")
+    return True
+
+
+def test_service():
+    """AmapService returns parsed models from the transport"""
+    print("\n" + "=" * 60)
+    print("Test 4: AmapService")
+    print("=" * 60)
+
+    server = start_stub_server()
+    transport = AmapHTTPTransport("test-key", base_url=f"http://127.0.0.1:{server.server_port}")
+    service = AmapService.__new__(AmapService)
+    service.transport = transport
+    try:
+        pois = service.search_poi("故宫", "北京")
+        assert [poi.id for poi in pois] == ["B000A8UIN8"]
+        assert service.get_weather("北京")[0].day_weather == "晴"
+        assert service.geocode("故宫", "北京").longitude == 116.397026
+        route = service.plan_route("故宫", "天坛", "北京", "北京", "walking")
+        assert route.distance == 1200 and route.duration == 900 and route.route_type == "walking"
+        assert service.search_poi("invalid", "北京") == []  # errors are logged, not raised
+        assert service.get_poi_detail("B000A8UIN8")["name"] == "故宫博物院"
+
+        # Parsing is cheap next to the request itself
+        payload = _result({"status": "1", "pois": REST_POIS["pois"] * 25})
+        started = time.perf_counter()
+        for _ in range(200):
+            parse_pois(tool_result_payload(payload))
+        elapsed = (time.perf_counter() - started) / 200
+        print(f"50 POIs parsed in {elapsed * 1000:.2f}ms")
+        assert elapsed < 0.02
+    finally:
+        transport.stop()
+        server.shutdown()
+
+    print("✅ AmapService returns typed models")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("POI / Weather / Geocode", test_poi_weather_geocode),
+        ("Routes", test_routes),
+        ("Errors", test_errors),
+        ("AmapService", test_service),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
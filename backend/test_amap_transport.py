@@ -0,0 +1,423 @@
+"""
+Amap Transport Test Script
+
+Purpose:
+1. Verify the HTTP transport maps MCP tool names to Amap REST endpoints
+2. Verify results use the MCP content format so callers need no changes
+3. Verify connections are kept alive and shared by concurrent calls
+4. Verify address-based routes geocode both ends first
+5. Verify settings select the transport
+6. Verify the tool cache: canonical keys, per-tool TTL, compressed disk tier, single-flight
+7. Verify the LangChain tools run asynchronously on the shared tool runtime
+8. Verify the multi-keyword search tool merges concurrent searches into one list
+
+These tests run a local stub of the Amap REST API, so no network or Amap key is required.
+
+Usage:
+    python test_amap_transport.py
+"""
+
+import asyncio
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.config import Settings
+from app.services.amap_transport import AmapAPIError, AmapHTTPTransport, CachedAmapTransport, create_amap_transport
+from app.services.cache_service import TieredCache, get_tool_cache_ttl
+from app.services import mcp_tools
+from app.services.mcp_tools import AmapMultiSearchTool, AmapTextSearchTool, AmapToolRuntime, AmapWeatherTool
+from app.agents.trip_planner_agent import MultiAgentTripPlanner
+from app.models.schemas import TripRequest
+
+STUB_RESPONSES = {
+    "/v3/place/text": {"status": "1", "count": "1", "pois": [
+        {"id": "B000A8UIN8", "name": "故宫博物院", "type": "风景名胜", "location": "116.397026,39.918058", "address": "景山前街4号"}
+    ]},
+    "/v3/weather/weatherInfo": {"status": "1", "forecasts": [{"city": "北京市", "casts": [
+        {"date": "2025-06-01", "dayweather": "晴", "nightweather": "多云", "daytemp": "30", "nighttemp": "18"}
+    ]}]},
+    "/v3/place/detail": {"status": "1", "pois": [
+        {"id": "B000A8UIN8", "name": "故宫博物院", "location": "116.397026,39.918058", "photos": [{"url": "http://example.com/1.jpg"}]}
+    ]},
+    "/v3/geocode/geo": {"status": "1", "geocodes": [{"location": "116.397026,39.918058"}]},
+    "/v3/direction/walking": {"status": "1", "route": {"paths": [{"distance": "1200", "duration": "900"}]}},
+}
+
+FORBIDDEN_CITY = {"id": "B000A8UIN8", "name": "故宫博物院", "type": "风景名胜", "location": "116.397026,39.918058", "address": "景山前街4号"}
+POIS_BY_KEYWORD = {
+    "历史文化": [FORBIDDEN_CITY, {"id": "B000A81CB2", "name": "天坛公园", "location": "116.410829,39.881913", "address": "天坛东里甲1号"}],
+    "美食": [{"id": "B000A7BM4H", "name": "全聚德", "location": "116.398,39.899", "address": "前门大街30号", "biz_ext": {"rating": "4.5", "cost": "150"}}, FORBIDDEN_CITY],
+    "自然风光": [{"id": "B000A7O1CU", "name": "颐和园", "location": "116.275,39.999", "address": "新建宫门路19号"}],
+}
+
+
+class StubAmapHandler(BaseHTTPRequestHandler):
+    """Answers like the Amap REST API and records every request"""
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append((url.path, params, self.client_address))
+        time.sleep(float(params.get("delay", self.server.delay)))
+
+        if params.get("keywords") == "invalid":
+            data = {"status": "0", "info": "INVALID_PARAMS", "infocode": "20000"}
+        elif params.get("keywords") in POIS_BY_KEYWORD:
+            data = {"status": "1", "pois": POIS_BY_KEYWORD[params["keywords"]]}
+        else:
+            data = STUB_RESPONSES.get(url.path, {"status": "0", "info": "UNKNOWN_PATH"})
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubAmapServer(ThreadingHTTPServer):
+    request_queue_size = 128  # accept concurrent connections without SYN retries
+    daemon_threads = True
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = StubAmapServer(("127.0.0.1", 0), StubAmapHandler)
+    server.requests = []
+    server.delay = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _payload(result: dict) -> dict:
+    return json.loads(result["content"][0]["text"])
+
+
+def test_tool_mapping():
+    """MCP tool names become REST requests with the key; errors raise AmapAPIError"""
+    print("=" * 60)
+    print("Test 1: Tool Mapping")
+    print("=" * 60)
+
+    server = start_stub_server()
+    transport = AmapHTTPTransport("test-key", base_url=f"http://127.0.0.1:{server.server_port}")
+    transport.start()
+    try:
+        result = transport.call_tool("maps_text_search", {"keywords": "景点", "city": "北京", "citylimit": "true"})
+        assert _payload(result)["pois"][0]["name"] == "故宫博物院"
+        path, params, _ = server.requests[-1]
+        assert path == "/v3/place/text"
+        assert params == {"keywords": "景点", "city": "北京", "citylimit": "true", "key": "test-key"}
+
+        weather = transport.call_tool("maps_weather", {"city": "北京"})
+        assert _payload(weather)["forecasts"][0]["casts"][0]["dayweather"] == "晴"
+        assert server.requests[-1][1]["extensions"] == "all"
+
+        try:
+            transport.call_tool("maps_text_search", {"keywords": "invalid", "city": "北京"})
+            assert False, "API error was not raised"
+        except AmapAPIError as e:
+            assert "INVALID_PARAMS" in str(e)
+        assert not transport.has_tool("maps_unknown")
+        assert transport.diagnostics()["total_failures"] == 1
+    finally:
+        transport.stop()
+        server.shutdown()
+
+    print("✅ Tools mapped to REST endpoints")
+    return True
+
+
+def test_keep_alive_pooling():
+    """Sequential and concurrent calls reuse pooled connections"""
+    print("\n" + "=" * 60)
+    print("Test 2: Keep-Alive Pooling")
+    print("=" * 60)
+
+    server = start_stub_server()
+    transport = AmapHTTPTransport("test-key", base_url=f"http://127.0.0.1:{server.server_port}", max_connections=4)
+    transport.start()
+    try:
+        for _ in range(20):
+            transport.call_tool("maps_weather", {"city": "北京"})
+        sequential_connections = {address for _, _, address in server.requests}
+        assert len(sequential_connections) == 1, f"{len(sequential_connections)} connections for sequential calls"
+
+        async def burst():
+            return await asyncio.gather(*(
+                transport.acall_tool("maps_text_search", {"keywords": f"景点{i}", "city": "北京"}) for i in range(50)
+            ))
+
+        results = asyncio.run(burst())
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results += list(executor.map(lambda i: transport.call_tool("maps_weather", {"city": "上海"}), range(30)))
+        assert len(results) == 80
+        connections = {address for _, _, address in server.requests}
+        print(f"{len(server.requests)} requests over {len(connections)} connections")
+        assert len(connections) <= 4
+    finally:
+        transport.stop()
+        server.shutdown()
+
+    print("✅ Connections kept alive and pooled")
+    return True
+
+
+def test_route_by_address():
+    """Address routes geocode origin and destination, then plan by coordinates"""
+    print("\n" + "=" * 60)
+    print("Test 3: Route by Address")
+    print("=" * 60)
+
+    server = start_stub_server()
+    transport = AmapHTTPTransport("test-key", base_url=f"http://127.0.0.1:{server.server_port}")
+    transport.start()
+    try:
+        result = transport.call_tool("maps_direction_walking_by_address", {
+            "origin_address": "天安门", "destination_address": "故宫", "origin_city": "北京"
+        })
+        route = _payload(result)
+        assert route["route"]["paths"][0]["distance"] == "1200"
+        assert route["origin"] == "116.397026,39.918058"
+        paths = [path for path, _, _ in server.requests]
+        assert paths.count("/v3/geocode/geo") == 2 and paths[-1] == "/v3/direction/walking"
+        assert server.requests[-1][1]["origin"] == "116.397026,39.918058"
+    finally:
+        transport.stop()
+        server.shutdown()
+
+    print("✅ Address routes resolved")
+    return True
+
+
+def test_transport_selection():
+    """settings.amap_transport selects the HTTP transport; a missing key is rejected"""
+    print("\n" + "=" * 60)
+    print("Test 4: Transport Selection")
+    print("=" * 60)
+
+    transport = create_amap_transport(Settings(amap_api_key="test-key", amap_transport="http", amap_http_max_connections=5))
+    try:
+        assert isinstance(transport, AmapHTTPTransport)
+        assert transport.max_connections == 5 and transport.initialized
+    finally:
+        transport.stop()
+
+    try:
+        create_amap_transport(Settings(amap_api_key="", amap_transport="http"))
+        assert False, "missing key was accepted"
+    except ValueError:
+        pass
+
+    print("✅ Transport selected by settings")
+    return True
+
+
+def test_tool_cache():
+    """Repeated calls are served from cache; concurrent identical calls hit the API once"""
+    print("\n" + "=" * 60)
+    print("Test 5: Tool Cache")
+    print("=" * 60)
+
+    server = start_stub_server()
+    transport = AmapHTTPTransport("test-key", base_url=f"http://127.0.0.1:{server.server_port}")
+    transport.start()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        disk_path = str(Path(cache_dir) / "tool_cache.sqlite3")
+        cached = CachedAmapTransport(transport, TieredCache("tool", ttl=60, memory_size=16, disk_path=disk_path, compress=True))
+        try:
+            # Argument order does not matter
+            first = cached.call_tool("maps_text_search", {"keywords": "景点", "city": "北京"})
+            second = cached.call_tool("maps_text_search", {"city": "北京", "keywords": "景点"})
+            assert first == second and len(server.requests) == 1
+
+            # Errors are not cached
+            for _ in range(2):
+                try:
+                    cached.call_tool("maps_text_search", {"keywords": "invalid", "city": "北京"})
+                    assert False, "API error was not raised"
+                except AmapAPIError:
+                    pass
+            assert len(server.requests) == 3
+
+            # Tools without a TTL are never cached
+            assert get_tool_cache_ttl("maps_ip_location") == 0 and get_tool_cache_ttl("maps_weather") > 0
+            uncached = CachedAmapTransport(transport, cached.cache, ttl_for=lambda tool_name: 0)
+            uncached.call_tool("maps_weather", {"city": "北京"})
+            uncached.call_tool("maps_weather", {"city": "北京"})
+            assert len(server.requests) == 5
+
+            # Single-flight: 20 async and 5 thread callers share one request
+            slow = {"keywords": "博物馆", "city": "北京", "delay": 0.3}
+
+            async def burst():
+                return await asyncio.gather(*(cached.acall_tool("maps_text_search", dict(slow)) for _ in range(20)))
+
+            requests_before = len(server.requests)
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                thread_results = [executor.submit(cached.call_tool, "maps_text_search", dict(slow)) for _ in range(5)]
+                async_results = asyncio.run(burst())
+                results = async_results + [future.result() for future in thread_results]
+            assert len(server.requests) - requests_before == 1
+            assert all(result == results[0] for result in results)
+            stats = cached.cache_stats()["tools"]["maps_text_search"]
+            print(f"maps_text_search cache counts: {stats}")
+            assert stats["coalesced"] + stats["hits"] >= 24 and stats["misses"] == 4
+
+            # The compressed disk tier survives a new memory tier
+            reopened = CachedAmapTransport(transport, TieredCache("tool", ttl=60, memory_size=16, disk_path=disk_path, compress=True))
+            assert reopened.call_tool("maps_text_search", {"keywords": "景点", "city": "北京"}) == first
+            assert len(server.requests) - requests_before == 1
+            with sqlite3.connect(disk_path) as conn:
+                assert all(isinstance(row[0], bytes) for row in conn.execute("SELECT value FROM cache"))
+        finally:
+            transport.stop()
+            server.shutdown()
+
+    print("✅ Tool calls cached and deduplicated")
+    return True
+
+
+def test_async_tools():
+    """Concurrent tool _arun calls overlap their I/O instead of occupying a thread each"""
+    print("\n" + "=" * 60)
+    print("Test 6: Async Tools")
+    print("=" * 60)
+
+    server = start_stub_server()
+    server.delay = 0.3
+    transport = AmapHTTPTransport("test-key", base_url=f"http://127.0.0.1:{server.server_port}", max_connections=40)
+    transport.start()
+    previous_runtime = mcp_tools._tool_runtime
+    mcp_tools._tool_runtime = AmapToolRuntime(transport=transport)
+    try:
+        search, weather = AmapTextSearchTool(), AmapWeatherTool()
+
+        async def run():
+            started = time.monotonic()
+            outputs = await asyncio.gather(
+                *(search.ainvoke({"keywords": f"景点{i}", "city": "Beijing"}) for i in range(20)),
+                *(weather.ainvoke({"city": "Shanghai"}) for _ in range(10))
+            )
+            return outputs, time.monotonic() - started
+
+        outputs, elapsed = asyncio.run(run())
+        print(f"30 tool calls with 0.3s latency in {elapsed:.2f}s")
+        assert all(not output.startswith("Error") for output in outputs), outputs[0]
+        assert "故宫博物院" in outputs[0] and "晴" in outputs[-1]
+        assert elapsed < 1.0, f"tool calls were not overlapped ({elapsed:.2f}s)"
+        assert server.requests[0][1]["city"] == "北京"
+
+        # Sync _run uses the same runtime
+        assert "故宫博物院" in search.invoke({"keywords": "景点", "city": "北京"})
+
+        # Without uvx the runtime reports the install hint instead of failing
+        mcp_tools._tool_runtime = AmapToolRuntime(unavailable=mcp_tools.UVX_NOT_FOUND_ERROR)
+        assert "uvx command not found" in asyncio.run(weather.ainvoke({"city": "北京"}))
+    finally:
+        mcp_tools._tool_runtime = previous_runtime
+        transport.stop()
+        server.shutdown()
+
+    print("✅ Tools run asynchronously")
+    return True
+
+
+def test_multi_search():
+    """One tool call searches every preference concurrently and merges the POIs"""
+    print("\n" + "=" * 60)
+    print("Test 7: Multi-Keyword Search")
+    print("=" * 60)
+
+    server = start_stub_server()
+    server.delay = 0.3
+    transport = AmapHTTPTransport("test-key", base_url=f"http://127.0.0.1:{server.server_port}")
+    transport.start()
+    previous_runtime = mcp_tools._tool_runtime
+    mcp_tools._tool_runtime = AmapToolRuntime(transport=transport)
+    try:
+        tool = AmapMultiSearchTool()
+        keywords = ["历史文化", "美食", "自然风光", "美食", " "]
+        started = time.monotonic()
+        merged = json.loads(asyncio.run(tool.ainvoke({"keywords": keywords, "city": "Beijing"})))
+        elapsed = time.monotonic() - started
+        print(f"{merged['count']} POIs for {merged['keywords']} in {elapsed:.2f}s")
+
+        assert merged["keywords"] == ["历史文化", "美食", "自然风光"]
+        assert len(server.requests) == 3 and elapsed < 0.8, f"searches were not concurrent ({elapsed:.2f}s)"
+        # Round-robin across keywords, the Forbidden City is kept once
+        assert [poi["name"] for poi in merged["pois"]] == ["故宫博物院", "全聚德", "颐和园", "天坛公园"]
+        assert merged["pois"][0]["keyword"] == "历史文化"
+        assert merged["pois"][1]["rating"] == "4.5" and merged["pois"][1]["cost"] == "150"
+
+        # The sync path and partial failures
+        server.delay = 0
+        merged = json.loads(tool.invoke({"keywords": ["自然风光", "invalid"], "city": "北京"}))
+        assert [poi["name"] for poi in merged["pois"]] == ["颐和园"]
+        assert "INVALID_PARAMS" in merged["errors"]["invalid"]
+        assert tool.invoke({"keywords": ["invalid"], "city": "北京"}).startswith("Error")
+
+        # The attraction stage uses the multi-keyword tool for several preferences
+        request = TripRequest(
+            city="Beijing", start_date="2025-06-01", end_date="2025-06-02", travel_days=2,
+            transportation="公共交通", accommodation="经济型酒店", preferences=["历史文化", "美食"]
+        )
+        planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+        tool_name, arguments = planner._build_direct_tool_call("attractions", request)
+        assert tool_name == "amap_maps_multi_search" and arguments["keywords"] == ["历史文化", "美食"]
+        assert "amap_maps_multi_search" in planner._build_attraction_query(request)
+        request.preferences = ["历史文化"]
+        assert planner._build_direct_tool_call("attractions", request)[0] == "amap_maps_text_search"
+    finally:
+        mcp_tools._tool_runtime = previous_runtime
+        transport.stop()
+        server.shutdown()
+
+    print("✅ Preferences covered in one tool call")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Tool Mapping", test_tool_mapping),
+        ("Keep-Alive Pooling", test_keep_alive_pooling),
+        ("Route by Address", test_route_by_address),
+        ("Transport Selection", test_transport_selection),
+        ("Tool Cache", test_tool_cache),
+        ("Async Tools", test_async_tools),
+        ("Multi-Keyword Search", test_multi_search),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,187 @@
+"""
+Batch Endpoints Test Script
+
+Purpose:
+1. Verify /api/map/poi/batch returns results in request order with per-item errors
+2. Verify duplicate items are called once and distinct items run concurrently under the cap
+3. Verify /api/map/geocode/batch and /api/poi/detail/batch
+4. Verify oversized and empty batches are rejected
+
+The routes run against a stub Amap REST server; no network or Amap key is required.
+
+Usage:
+    python test_batch_endpoints.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import map as map_routes
+from app.api.routes import poi as poi_routes
+from app.config import get_settings
+from app.services import amap_service
+from app.services.amap_service import AmapService
+from app.services.amap_transport import AmapHTTPTransport
+from test_amap_transport import start_stub_server
+
+
+def create_client():
+    """Routers under /api with the Amap service pointed at a stub server"""
+    server = start_stub_server()
+    transport = AmapHTTPTransport("test-key", base_url=f"http://127.0.0.1:{server.server_port}")
+    service = AmapService.__new__(AmapService)
+    service.transport = transport
+    amap_service._amap_service = service
+
+    app = FastAPI()
+    app.include_router(map_routes.router, prefix="/api")
+    app.include_router(poi_routes.router, prefix="/api")
+    return TestClient(app), server, transport
+
+
+def close_client(server, transport):
+    amap_service._amap_service = None
+    transport.stop()
+    server.shutdown()
+
+
+def test_poi_batch():
+    """Ordered results, per-item errors, deduplication and concurrency"""
+    print("=" * 60)
+    print("Test 1: POI Batch")
+    print("=" * 60)
+
+    client, server, transport = create_client()
+    server.delay = 0.3
+    try:
+        queries = [
+            {"keywords": "历史文化", "city": "北京"},
+            {"keywords": "美食", "city": "北京"},
+            {"keywords": "invalid", "city": "北京"},
+            {"keywords": "历史文化", "city": "北京"},
+            {"keywords": "自然风光", "city": "北京", "citylimit": False},
+            {"keywords": "故宫", "city": "北京"},
+        ]
+        started = time.monotonic()
+        response = client.post("/api/map/poi/batch", json={"queries": queries})
+        elapsed = time.monotonic() - started
+        body = response.json()
+        print(f"{body['message']} in {elapsed:.2f}s, {len(server.requests)} Amap requests")
+
+        assert response.status_code == 200 and body["success"]
+        assert [item["keywords"] for item in body["data"]] == [query["keywords"] for query in queries]
+        assert [item["success"] for item in body["data"]] == [True, True, False, True, True, True]
+        assert "INVALID_PARAMS" in body["data"][2]["message"] and body["data"][2]["data"] == []
+        assert [poi["name"] for poi in body["data"][0]["data"]] == ["故宫博物院", "天坛公园"]
+        assert body["data"][3] == body["data"][0]
+        assert len(server.requests) == 5, "duplicate queries are searched once"
+        assert elapsed < 0.8, f"queries were not concurrent ({elapsed:.2f}s)"
+
+        # The concurrency cap bounds how many calls are in flight
+        settings = get_settings()
+        previous = settings.amap_batch_concurrency
+        settings.amap_batch_concurrency = 2
+        try:
+            started = time.monotonic()
+            response = client.post("/api/map/poi/batch", json={
+                "queries": [{"keywords": f"景点{i}", "city": "上海"} for i in range(4)]
+            })
+            elapsed = time.monotonic() - started
+        finally:
+            settings.amap_batch_concurrency = previous
+        print(f"4 queries with concurrency 2 in {elapsed:.2f}s")
+        assert response.status_code == 200 and 0.55 < elapsed < 1.0, f"{elapsed:.2f}s"
+    finally:
+        close_client(server, transport)
+
+    print("✅ POI batch ordered, deduplicated and concurrent")
+    return True
+
+
+def test_geocode_and_detail_batch():
+    """Geocode and POI detail batches"""
+    print("\n" + "=" * 60)
+    print("Test 2: Geocode / Detail Batch")
+    print("=" * 60)
+
+    client, server, transport = create_client()
+    try:
+        response = client.post("/api/map/geocode/batch", json={"addresses": [
+            {"address": "故宫", "city": "北京"},
+            {"address": "天坛"},
+            {"address": "故宫", "city": "北京"},
+        ]})
+        body = response.json()
+        assert response.status_code == 200 and body["message"] == "Geocode batch: 3/3 succeeded"
+        assert [item["address"] for item in body["data"]] == ["故宫", "天坛", "故宫"]
+        assert body["data"][1]["data"] == {"longitude": 116.397026, "latitude": 39.918058}
+        assert body["data"][1]["city"] is None
+        assert len(server.requests) == 2
+
+        response = client.post("/api/poi/detail/batch", json={"ids": ["B000A8UIN8", "B000A8UIN8", "B000A81CB2"]})
+        body = response.json()
+        assert response.status_code == 200 and [item["id"] for item in body["data"]] == ["B000A8UIN8", "B000A8UIN8", "B000A81CB2"]
+        assert body["data"][0]["data"]["name"] == "故宫博物院" and body["data"][0]["data"]["photos"]
+        assert len(server.requests) == 4
+    finally:
+        close_client(server, transport)
+
+    print("✅ Geocode and detail batches served")
+    return True
+
+
+def test_batch_limits():
+    """Empty and oversized batches are rejected before any Amap call"""
+    print("\n" + "=" * 60)
+    print("Test 3: Batch Limits")
+    print("=" * 60)
+
+    client, server, transport = create_client()
+    try:
+        limit = get_settings().amap_batch_max_items
+        response = client.post("/api/poi/detail/batch", json={"ids": [f"B{i}" for i in range(limit + 1)]})
+        assert response.status_code == 400 and "max" in response.json()["detail"]
+        assert client.post("/api/map/poi/batch", json={"queries": []}).status_code == 422
+        assert client.post("/api/map/geocode/batch", json={"addresses": []}).status_code == 422
+        assert server.requests == []
+    finally:
+        close_client(server, transport)
+
+    print("✅ Limits enforced")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("POI Batch", test_poi_batch),
+        ("Geocode / Detail Batch", test_geocode_and_detail_batch),
+        ("Batch Limits", test_batch_limits),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
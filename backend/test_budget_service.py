@@ -0,0 +1,142 @@
+"""
+Budget Service Test Script
+
+Purpose:
+1. Verify totals are summed from the day details
+2. Verify the transportation cost model for each transportation mode
+3. Verify the budget returned by the LLM is replaced by the local one
+
+Usage:
+    python test_budget_service.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.agents.trip_planner_agent import MultiAgentTripPlanner
+from app.models.schemas import TripRequest, DayPlan, Attraction, Meal, Hotel, Location
+from app.services.budget_service import compute_budget, estimate_day_transportation, public_transit_fare
+from test_concurrent_planning import override_settings
+
+
+def _make_day(day_index: int = 0, transportation: str = "公共交通") -> DayPlan:
+    """Hotel plus two attractions about 1 km and 10 km away"""
+    return DayPlan(
+        date=f"2025-06-0{day_index + 1}",
+        day_index=day_index,
+        description="",
+        transportation=transportation,
+        accommodation="经济型酒店",
+        hotel=Hotel(name="Hotel", location=Location(longitude=116.40, latitude=39.90), estimated_cost=300),
+        attractions=[
+            Attraction(name="Near", address="", location=Location(longitude=116.40, latitude=39.909),
+                       visit_duration=60, description="", ticket_price=60),
+            Attraction(name="Far", address="", location=Location(longitude=116.40, latitude=39.99),
+                       visit_duration=60, description="", ticket_price=40),
+        ],
+        meals=[
+            Meal(type="lunch", name="Lunch", estimated_cost=50),
+            Meal(type="dinner", name="Dinner", estimated_cost=80),
+        ]
+    )
+
+
+def test_totals():
+    """Category totals and the grand total add up"""
+    print("=" * 60)
+    print("Test 1: Budget Totals")
+    print("=" * 60)
+
+    budget = compute_budget([_make_day(0), _make_day(1)], "步行")
+    print(budget)
+    assert (budget.total_attractions, budget.total_hotels, budget.total_meals) == (200, 600, 260)
+    assert budget.total_transportation == 0
+    assert budget.total == 1060
+    print("✅ Totals computed")
+    return True
+
+
+def test_transportation_modes():
+    """Each transportation mode uses its own cost model"""
+    print("\n" + "=" * 60)
+    print("Test 2: Transportation Cost Model")
+    print("=" * 60)
+
+    assert public_transit_fare(0) == 0
+    assert public_transit_fare(5) == 3
+    assert public_transit_fare(12) == 4
+
+    day = _make_day()
+    costs = {mode: estimate_day_transportation(day, mode) for mode in ("公共交通", "自驾", "步行", "混合")}
+    print(f"Costs: {costs}")
+    # Legs: hotel->Near ~1.3 km, Near->Far ~11.7 km, Far->hotel ~13 km (road distance)
+    assert costs["步行"] == 0
+    assert costs["公共交通"] == 3 + 4 + 4
+    assert costs["混合"] == 4 + 4  # the short first leg is walked
+    assert costs["自驾"] > 30
+    assert estimate_day_transportation(day) == costs["公共交通"]  # defaults to the day's own mode
+    print("✅ Transportation modes priced")
+    return True
+
+
+def test_llm_budget_replaced():
+    """A wrong budget from the planner output is overwritten"""
+    print("\n" + "=" * 60)
+    print("Test 3: LLM Budget Replaced")
+    print("=" * 60)
+
+    request = TripRequest(
+        city="Beijing", start_date="2025-06-01", end_date="2025-06-01", travel_days=1,
+        transportation="步行", accommodation="经济型酒店", preferences=[]
+    )
+    response = json.dumps({
+        "city": "Beijing",
+        "start_date": "2025-06-01",
+        "end_date": "2025-06-01",
+        "days": [_make_day().model_dump()],
+        "weather_info": [],
+        "overall_suggestions": "",
+        "budget": {"total_attractions": 1, "total_hotels": 1, "total_meals": 1, "total_transportation": 1, "total": 999}
+    })
+
+    planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+    with override_settings(itinerary_optimizer_enabled=False):
+        trip_plan, parsed = planner._finish_plan(response, request)
+
+    assert parsed
+    assert trip_plan.budget.total == 100 + 300 + 130
+    print("✅ Budget computed locally")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Budget Totals", test_totals),
+        ("Transportation Cost Model", test_transportation_modes),
+        ("LLM Budget Replaced", test_llm_budget_replaced),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
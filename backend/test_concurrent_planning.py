@@ -0,0 +1,228 @@
+"""
+Concurrent Retrieval Stages Test Script
+
+Purpose:
+1. Verify the attraction, weather and hotel stages run in parallel
+2. Verify per-stage timeouts and partial-result handling
+3. Verify aplan_trip serves concurrent requests on one event loop
+4. Verify the direct pipeline mode calls tools without the LLM agents
+
+These tests use stub agents, so no LLM or MCP server is required.
+
+Usage:
+    python test_concurrent_planning.py
+"""
+
+import asyncio
+import json
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.agents.trip_planner_agent import MultiAgentTripPlanner
+from app.models.schemas import TripRequest
+from app.config import get_settings
+
+
+class StubAgent:
+    """Stub agent that sleeps and returns a fixed output"""
+
+    def __init__(self, delay: float, output: str):
+        self.delay = delay
+        self.output = output
+        self.name = "Stub Agent"
+
+    def run(self, query: str) -> str:
+        time.sleep(self.delay)
+        return self.output
+
+    async def arun(self, query: str) -> str:
+        await asyncio.sleep(self.delay)
+        return self.output
+
+
+@contextmanager
+def override_settings(**values):
+    """Temporarily override settings; plan and stage caches are disabled by default"""
+    values.setdefault("plan_cache_enabled", False)
+    values.setdefault("stage_cache_enabled", False)
+    settings = get_settings()
+    original = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield settings
+    finally:
+        for name, value in original.items():
+            setattr(settings, name, value)
+
+
+def _make_planner(attraction_agent, weather_agent, hotel_agent) -> MultiAgentTripPlanner:
+    """Create a planner without initializing the LLM"""
+    planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+    planner.attraction_agent = attraction_agent
+    planner.weather_agent = weather_agent
+    planner.hotel_agent = hotel_agent
+    return planner
+
+
+def _make_request() -> TripRequest:
+    return TripRequest(
+        city="Beijing",
+        start_date="2025-06-01",
+        end_date="2025-06-02",
+        travel_days=2,
+        transportation="公共交通",
+        accommodation="经济型酒店",
+        preferences=["历史文化"]
+    )
+
+
+def test_stages_run_concurrently():
+    """Three 0.5s stages should finish in roughly 0.5s, not 1.5s"""
+    print("=" * 60)
+    print("Test 1: Concurrent Retrieval Stages")
+    print("=" * 60)
+
+    with override_settings(agent_execution_mode="concurrent", agent_stage_timeout=5):
+        planner = _make_planner(
+            StubAgent(0.5, "attractions"),
+            StubAgent(0.5, "weather"),
+            StubAgent(0.5, "hotels")
+        )
+        started = time.monotonic()
+        results = planner._run_retrieval_stages(_make_request())
+        elapsed = time.monotonic() - started
+
+    print(f"Elapsed: {elapsed:.2f}s")
+    assert results == {"attractions": "attractions", "weather": "weather", "hotels": "hotels"}
+    assert elapsed < 1.2, f"stages did not overlap ({elapsed:.2f}s)"
+    print("✅ Stages ran concurrently")
+    return True
+
+
+def test_stage_timeout_and_failure():
+    """A slow stage and a failing stage are replaced by notes"""
+    print("\n" + "=" * 60)
+    print("Test 2: Stage Timeout and Partial Results")
+    print("=" * 60)
+
+    with override_settings(agent_execution_mode="concurrent", agent_stage_timeout=0.5):
+        planner = _make_planner(
+            StubAgent(0.1, "attractions"),
+            StubAgent(0.1, "Error: weather tool failed"),
+            StubAgent(3, "Error: finished after the stage timeout")
+        )
+        started = time.monotonic()
+        results = planner._run_retrieval_stages(_make_request())
+        elapsed = time.monotonic() - started
+
+    print(f"Elapsed: {elapsed:.2f}s")
+    assert results["attractions"] == "attractions"
+    assert "unavailable" in results["weather"]
+    assert "timed out" in results["hotels"]
+    assert elapsed < 1.5, f"timed out stage blocked the join ({elapsed:.2f}s)"
+    print("✅ Partial results returned within the stage timeout")
+    return True
+
+
+def test_aplan_trip_concurrent_requests():
+    """Five async plans with 0.3s stages should overlap on one event loop"""
+    print("\n" + "=" * 60)
+    print("Test 3: aplan_trip Concurrent Requests")
+    print("=" * 60)
+
+    planner = _make_planner(
+        StubAgent(0.3, "attractions"),
+        StubAgent(0.3, "weather"),
+        StubAgent(0.3, "hotels")
+    )
+    planner.planner_agent = StubAgent(0.1, json.dumps({
+        "city": "Beijing",
+        "start_date": "2025-06-01",
+        "end_date": "2025-06-02",
+        "days": [],
+        "overall_suggestions": "Enjoy the trip"
+    }))
+
+    async def run_many():
+        return await asyncio.gather(*(planner.aplan_trip(_make_request()) for _ in range(5)))
+
+    with override_settings():
+        started = time.monotonic()
+        plans = asyncio.run(run_many())
+        elapsed = time.monotonic() - started
+
+    print(f"Elapsed: {elapsed:.2f}s for {len(plans)} plans")
+    assert all(plan.overall_suggestions == "Enjoy the trip" for plan in plans)
+    assert elapsed < 1.5, f"requests blocked each other ({elapsed:.2f}s)"
+    print("✅ Async plans overlapped without blocking")
+    return True
+
+
+class StubTool:
+    """Stub LangChain tool that records its calls"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = []
+
+    def invoke(self, arguments: dict) -> str:
+        self.calls.append(arguments)
+        return f"{self.name} result"
+
+
+def test_direct_pipeline_mode():
+    """Direct mode calls the MCP tools straight from the request fields"""
+    print("\n" + "=" * 60)
+    print("Test 4: Direct Pipeline Mode")
+    print("=" * 60)
+
+    with override_settings(agent_pipeline_mode="direct"):
+        failing_agent = StubAgent(0, "Error: agents must not be called in direct mode")
+        planner = _make_planner(failing_agent, failing_agent, failing_agent)
+        search_tool = StubTool("amap_maps_text_search")
+        weather_tool = StubTool("amap_maps_weather")
+        planner.amap_tools = [search_tool, weather_tool]
+        results = planner._run_retrieval_stages(_make_request())
+
+    assert results["weather"] == "amap_maps_weather result"
+    assert weather_tool.calls == [{"city": "北京"}]
+    assert {"keywords": "历史文化", "city": "北京"} in search_tool.calls
+    assert {"keywords": "经济型酒店", "city": "北京"} in search_tool.calls
+    print("✅ Direct mode used the tools with request fields")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Concurrent Stages", test_stages_run_concurrently),
+        ("Stage Timeout", test_stage_timeout_and_failure),
+        ("Async Concurrent Requests", test_aplan_trip_concurrent_requests),
+        ("Direct Pipeline Mode", test_direct_pipeline_mode),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,313 @@
+"""
+Itinerary Optimizer Test Script
+
+Purpose:
+1. Verify the vectorized haversine distance
+2. Verify balanced clustering splits POIs into compact, equal-sized days
+3. Verify nearest neighbour + 2-opt removes back-and-forth routes
+4. Verify the planner allocates days locally from the compacted POI table
+5. Verify the planner keeps the locally optimized order and streams days in the final order
+6. Verify agent-mode stages feed the agents' tool results to the optimizer
+
+Usage:
+    python test_itinerary_optimizer.py
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.agents.trip_planner_agent import MultiAgentTripPlanner
+from app.models.schemas import TripRequest, DayPlan, Attraction, Hotel, Location
+from app.services.itinerary_optimizer import (
+    haversine_km, balanced_kmeans, order_route, route_length, order_day_attractions
+)
+from app.utils.prompt_compaction import compact_stage_output, parse_poi_table
+from test_concurrent_planning import override_settings
+
+# Three areas of Beijing, three POIs each
+AREAS = {
+    "north": (116.39, 40.00),
+    "center": (116.40, 39.91),
+    "west": (116.27, 39.99),
+}
+
+
+def _area_coords():
+    coords, names = [], []
+    for area, (lng, lat) in AREAS.items():
+        for offset in range(3):
+            coords.append([lng + offset * 0.005, lat + offset * 0.003])
+            names.append(f"{area}-{offset}")
+    return np.array(coords), names
+
+
+def test_haversine():
+    """Distance between Tiananmen and the Summer Palace is about 15 km"""
+    print("=" * 60)
+    print("Test 1: Haversine Distance")
+    print("=" * 60)
+
+    distance = float(haversine_km(116.397, 39.909, 116.273, 39.999))
+    print(f"Distance: {distance:.2f} km")
+    assert 14 < distance < 16
+    assert float(haversine_km(116.4, 39.9, 116.4, 39.9)) == 0.0
+    print("✅ Haversine distance correct")
+    return True
+
+
+def test_balanced_clustering():
+    """Interleaved POIs from three areas are grouped back by area"""
+    print("\n" + "=" * 60)
+    print("Test 2: Balanced Clustering")
+    print("=" * 60)
+
+    coords, names = _area_coords()
+    interleave = [0, 3, 6, 1, 4, 7, 2, 5, 8]
+    labels = balanced_kmeans(coords[interleave], 3)
+    groups = {}
+    for index, label in zip(interleave, labels):
+        groups.setdefault(int(label), set()).add(names[index].split("-")[0])
+
+    print(f"Groups: {groups}")
+    assert len(groups) == 3
+    assert all(len(areas) == 1 for areas in groups.values())
+    assert sorted(np.bincount(labels).tolist()) == [3, 3, 3]
+
+    # Unbalanced input still yields non-empty groups within capacity
+    labels = balanced_kmeans(np.array([[116.4, 39.9]] * 5 + [[116.5, 40.0]]), 3)
+    assert np.bincount(labels, minlength=3).min() >= 1
+    assert np.bincount(labels).max() <= 2
+    print("✅ POIs grouped into compact, balanced days")
+    return True
+
+
+def test_route_ordering():
+    """A zig-zag route along a line is reordered into a straight walk"""
+    print("\n" + "=" * 60)
+    print("Test 3: Route Ordering")
+    print("=" * 60)
+
+    coords = np.array([[116.40 + x * 0.01, 39.9] for x in (0, 4, 1, 3, 2)])
+    order = order_route(coords)
+    print(f"Order: {order}, length {route_length(coords, order):.2f} km (was {route_length(coords, range(5)):.2f} km)")
+    assert [coords[i][0] for i in order] in (sorted(coords[:, 0]), sorted(coords[:, 0], reverse=True))
+
+    day = DayPlan(
+        date="2025-06-01", day_index=0, description="", transportation="", accommodation="",
+        attractions=[
+            Attraction(name=f"A{x}", address="", location=Location(longitude=116.40 + x * 0.01, latitude=39.9),
+                       visit_duration=60, description="")
+            for x in (2, 0, 1)
+        ]
+    )
+    order_day_attractions(day)
+    assert [a.name for a in day.attractions] in (["A0", "A1", "A2"], ["A2", "A1", "A0"])
+    print("✅ Routes ordered without back-and-forth")
+    return True
+
+
+def test_local_allocation():
+    """The planner allocates days from the compacted POI table without an LLM call"""
+    print("\n" + "=" * 60)
+    print("Test 4: Local Allocation")
+    print("=" * 60)
+
+    coords, names = _area_coords()
+    attractions = compact_stage_output("attractions", json.dumps({"pois": [
+        {"id": f"P{i}", "name": name, "address": "", "location": f"{lng},{lat}"}
+        for i, (name, (lng, lat)) in enumerate(zip(names, coords))
+    ]}))
+    hotels = compact_stage_output("hotels", json.dumps({"pois": [
+        {"id": "H1", "name": "Far Hotel", "address": "", "location": "117.2,39.1"},
+        {"id": "H2", "name": "Central Hotel", "address": "", "location": "116.36,39.96"},
+    ]}))
+    request = TripRequest(
+        city="Beijing", start_date="2025-06-01", end_date="2025-06-03", travel_days=3,
+        transportation="公共交通", accommodation="经济型酒店", preferences=[]
+    )
+
+    planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+    with override_settings(itinerary_optimizer_enabled=True, itinerary_attractions_per_day=3):
+        allocation = planner._allocate_days(request, {"attractions": attractions, "hotels": hotels})
+        query = planner._build_planner_query(request, attractions, "weather", hotels)
+
+    days = allocation["days"]
+    for day in days.values():
+        print(f"Day {day['day_index'] + 1}: {day['attractions']} ({day['hotel']})")
+        assert len({name.split("-")[0] for name in day["attractions"]}) == 1
+        assert day["hotel"] == "Central Hotel"
+    assert "Daily Routes (already optimized by distance)" in query
+
+    with override_settings(itinerary_optimizer_enabled=True):
+        assert planner._local_allocation(request, {"attractions": "some prose", "hotels": ""}) is None
+    print("✅ Days allocated locally")
+    return True
+
+
+class StubPlanner:
+    """Stub planner that streams a fixed response in small chunks"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    async def astream(self, query: str):
+        for i in range(0, len(self.text), 32):
+            await asyncio.sleep(0)
+            yield self.text[i:i + 32]
+
+
+def _line_plan(names, hotel_lng) -> str:
+    """One-day plan visiting A0..A2 (spread along a line) in the given order"""
+    day = DayPlan(
+        date="2025-06-01", day_index=0, description="", transportation="", accommodation="",
+        hotel=Hotel(name="Hotel", location=Location(longitude=hotel_lng, latitude=39.9)),
+        attractions=[
+            Attraction(name=name, address="", location=Location(longitude=116.40 + int(name[1]) * 0.01, latitude=39.9),
+                       visit_duration=60, description="")
+            for name in names
+        ]
+    )
+    return json.dumps({
+        "city": "Beijing", "start_date": "2025-06-01", "end_date": "2025-06-01",
+        "days": [day.model_dump()], "weather_info": [], "overall_suggestions": ""
+    })
+
+
+def test_optimized_order_kept():
+    """The order the local optimizer gave the LLM is kept; otherwise streamed days are reordered like the plan"""
+    print("\n" + "=" * 60)
+    print("Test 5: Optimized Order Kept")
+    print("=" * 60)
+
+    attractions = compact_stage_output("attractions", json.dumps({"pois": [
+        {"id": f"P{x}", "name": f"A{x}", "address": "", "location": f"{116.40 + x * 0.01},39.9"} for x in (1, 0, 2)
+    ]}))
+    request = TripRequest(
+        city="Beijing", start_date="2025-06-01", end_date="2025-06-01", travel_days=1,
+        transportation="步行", accommodation="经济型酒店", preferences=[]
+    )
+
+    async def stream(planner, stage_results):
+        async def stage(name, request):
+            return stage_results[name]
+        planner._arun_stage_checked = stage
+        events = [event async for event in planner.astream_trip(request)]
+        days = [[a["name"] for a in data["attractions"]] for name, data in events if name == "day"]
+        plan = [a["name"] for a in events[-1][1]["days"][0]["attractions"]]
+        return days, plan
+
+    planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+    with override_settings(itinerary_optimizer_enabled=True, itinerary_attractions_per_day=3, planner_mode="single"):
+        stage_results = {"attractions": attractions, "weather": "weather", "hotels": ""}
+        route = planner._local_allocation(request, stage_results)["days"][0]["attractions"]
+        # Starting from a hotel next to the last attraction would reverse the route
+        hotel_lng = 116.40 + int(route[-1][1]) * 0.01
+        planner.planner_agent = StubPlanner(_line_plan(route, hotel_lng))
+        days, plan = asyncio.run(stream(planner, stage_results))
+        print(f"Optimized route {route}: streamed {days}, final {plan}")
+        assert days == [route] and plan == route
+
+        # Without a local route the LLM's zig-zag is reordered, in the stream too
+        planner.planner_agent = StubPlanner(_line_plan(["A2", "A0", "A1"], 116.43))
+        days, plan = asyncio.run(stream(planner, {**stage_results, "attractions": "some prose"}))
+        print(f"LLM route reordered: streamed {days}, final {plan}")
+        assert days == [["A2", "A1", "A0"]] and plan == ["A2", "A1", "A0"]
+
+    print("✅ Optimized order kept and streamed days match the plan")
+    return True
+
+
+class ObservingAgent:
+    """Stub LangChain agent wrapper: a prose answer plus the raw tool results it saw"""
+
+    def __init__(self, answer: str, observations):
+        self.answer = answer
+        self.observations = observations
+        self.name = "Observing Agent"
+
+    def run_with_observations(self, query: str):
+        return self.answer, self.observations
+
+    async def arun_with_observations(self, query: str):
+        return self.answer, self.observations
+
+
+def test_agent_mode_allocation():
+    """In agent mode the tool results, not the prose answer, reach the optimizer"""
+    print("\n" + "=" * 60)
+    print("Test 6: Agent Mode Allocation")
+    print("=" * 60)
+
+    coords, names = _area_coords()
+    searches = [
+        json.dumps({"pois": [
+            {"id": f"P{i}", "name": name, "address": "", "location": f"{lng},{lat}"}
+            for i, (name, (lng, lat)) in enumerate(zip(names, coords)) if i % 2 == parity
+        ]}, ensure_ascii=False)
+        for parity in (0, 1)
+    ]
+    planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+    planner.attraction_agent = ObservingAgent("I found nine great attractions in Beijing.", [
+        searches[0], json.dumps({"error": "Request failed: timeout"}), searches[1]
+    ])
+    planner.weather_agent = ObservingAgent("Sunny all week.", [json.dumps({"forecasts": [
+        {"date": "2025-06-01", "dayweather": "晴", "nightweather": "晴", "daytemp": "30", "nighttemp": "20"}
+    ]})])
+    planner.hotel_agent = ObservingAgent("No hotels found, sorry.", [])
+    request = TripRequest(
+        city="Beijing", start_date="2025-06-01", end_date="2025-06-03", travel_days=3,
+        transportation="公共交通", accommodation="经济型酒店", preferences=[]
+    )
+
+    with override_settings(agent_pipeline_mode="agent", agent_execution_mode="concurrent",
+                           itinerary_optimizer_enabled=True, itinerary_attractions_per_day=3):
+        stage_results = asyncio.run(planner._arun_retrieval_stages(request))
+        assert stage_results == planner._run_retrieval_stages(request)
+        allocation = planner._local_allocation(request, stage_results)
+
+    assert allocation is not None, "optimizer did not run in agent mode"
+    for day in allocation["days"].values():
+        assert len({name.split("-")[0] for name in day["attractions"]}) == 1, day
+    assert sum(len(day["attractions"]) for day in allocation["days"].values()) == 9
+    assert "晴" in stage_results["weather"] and stage_results["hotels"].startswith("No hotels found")
+    print(f"✅ {len(parse_poi_table(stage_results['attractions']))} POIs from tool results allocated into 3 days")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Haversine Distance", test_haversine),
+        ("Balanced Clustering", test_balanced_clustering),
+        ("Route Ordering", test_route_ordering),
+        ("Local Allocation", test_local_allocation),
+        ("Optimized Order Kept", test_optimized_order_kept),
+        ("Agent Mode Allocation", test_agent_mode_allocation),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,442 @@
+"""
+MCP Client Test Script
+
+Purpose:
+1. Verify the initialize handshake and tool calls against a local MCP server
+2. Verify hundreds of concurrent async calls are multiplexed on one process
+3. Verify the sync facade works from worker threads and reports tool errors
+4. Verify the process pool spreads calls and tracks per-process health
+5. Verify startup is protocol-driven, bounded by a deadline, and caches tools/list
+6. Verify a server crash fails in-flight calls at once and the server is respawned
+7. Verify timed-out and cancelled calls free their slots and late responses are dropped
+8. Verify server stderr is drained continuously into a bounded ring buffer
+9. Verify one writer task coalesces concurrent requests and keeps message framing intact
+10. Verify a pool process that fails its first start is retried and rejoins the rotation
+
+These tests use fake_mcp_server.py, so no uvx, network or Amap key is required.
+
+Usage:
+    python test_mcp_client.py
+"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.services.mcp_client import (
+    AsyncMCPClient, MCPClient, MCPClientPool, MCPToolError, MCPServerCrashedError, StderrRingBuffer
+)
+
+FAKE_SERVER_COMMAND = [sys.executable, str(project_root / "fake_mcp_server.py")]
+
+
+def _echoed(result: dict) -> dict:
+    """Decode the arguments echoed back by the fake server"""
+    return json.loads(result["content"][0]["text"])
+
+
+def test_async_concurrent_calls():
+    """200 concurrent 0.5s calls complete in about 0.5s without extra threads"""
+    print("=" * 60)
+    print("Test 1: Concurrent Async Calls")
+    print("=" * 60)
+
+    async def run():
+        client = AsyncMCPClient(FAKE_SERVER_COMMAND)
+        await client.start()
+        try:
+            threads_before = threading.active_count()
+            started = time.monotonic()
+            results = await asyncio.gather(*(
+                client.call_tool("echo", {"index": i, "delay": 0.5}) for i in range(200)
+            ))
+            elapsed = time.monotonic() - started
+            threads_after = threading.active_count()
+        finally:
+            await client.stop()
+        return results, elapsed, threads_before, threads_after
+
+    results, elapsed, threads_before, threads_after = asyncio.run(run())
+    print(f"Elapsed: {elapsed:.2f}s, threads {threads_before} -> {threads_after}")
+    assert [_echoed(result)["index"] for result in results] == list(range(200))
+    assert elapsed < 3, f"calls were not multiplexed ({elapsed:.2f}s)"
+    assert threads_after <= threads_before + 1
+    print("✅ Concurrent calls multiplexed on one process")
+    return True
+
+
+def test_sync_facade():
+    """The facade serves sync callers in threads and async callers on other loops"""
+    print("\n" + "=" * 60)
+    print("Test 2: Sync/Async Facade")
+    print("=" * 60)
+
+    client = MCPClient(FAKE_SERVER_COMMAND)
+    client.start()
+    try:
+        assert client.initialized
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda i: client.call_tool("echo", {"index": i}), range(20)))
+        assert [_echoed(result)["index"] for result in results] == list(range(20))
+
+        result = asyncio.run(client.acall_tool("echo", {"text": "北京"}))
+        assert _echoed(result) == {"text": "北京"}
+
+        try:
+            client.call_tool("missing_tool", {})
+            assert False, "tool error was not raised"
+        except RuntimeError as e:
+            assert "Unknown tool" in str(e)
+    finally:
+        client.stop()
+
+    assert not client.initialized
+    print("✅ Facade works from threads and event loops")
+    return True
+
+
+def test_pool_dispatch_and_health():
+    """Concurrent calls use every process; failing processes are taken out of rotation"""
+    print("\n" + "=" * 60)
+    print("Test 3: Process Pool")
+    print("=" * 60)
+
+    pool = MCPClientPool(FAKE_SERVER_COMMAND, size=3)
+    pool.start()
+    try:
+        async def burst():
+            return await asyncio.gather(*(pool.acall_tool("echo", {"delay": 0.2}) for _ in range(30)))
+
+        started = time.monotonic()
+        pids = [result["pid"] for result in asyncio.run(burst())]
+        elapsed = time.monotonic() - started
+        counts = {pid: pids.count(pid) for pid in set(pids)}
+        print(f"Calls per process: {list(counts.values())} in {elapsed:.2f}s")
+        assert len(counts) == 3
+        assert max(counts.values()) - min(counts.values()) <= 1
+
+        # Tool errors do not affect health
+        try:
+            pool.call_tool("missing_tool", {})
+            assert False, "tool error was not raised"
+        except MCPToolError:
+            pass
+        assert all(member.consecutive_failures == 0 for member in pool.members)
+
+        # Repeated timeouts mark a process unhealthy; it then receives no calls
+        broken = pool.members[0]
+        broken.client.request_timeout = 0.05
+        for _ in range(3):
+            pool._next_index = 0
+            try:
+                pool.call_tool("echo", {"delay": 0.3})
+                assert False, "timeout was not raised"
+            except TimeoutError:
+                pass
+        assert not pool.stats()["members"][0]["healthy"]
+        broken_pid = broken.client.process.pid
+        pids = [pool.call_tool("echo", {})["pid"] for _ in range(6)]
+        assert broken_pid not in pids
+    finally:
+        pool.stop()
+
+    print("✅ Pool spreads load and tracks health")
+    return True
+
+
+def test_startup_handshake():
+    """Startup has no fixed sleep, honours its deadline and caches the tool list"""
+    print("\n" + "=" * 60)
+    print("Test 4: Startup Handshake")
+    print("=" * 60)
+
+    async def run():
+        client = AsyncMCPClient(FAKE_SERVER_COMMAND, startup_timeout=10)
+        started = time.monotonic()
+        await client.start()
+        elapsed = time.monotonic() - started
+        try:
+            assert client.available_tools == ["echo"]
+            assert client.has_tool("echo") and not client.has_tool("maps_weather")
+            assert client.server_info["name"] == "fake-mcp-server"
+        finally:
+            await client.stop()
+        print(f"Cold start: {elapsed:.2f}s")
+
+        slow = AsyncMCPClient(FAKE_SERVER_COMMAND, env={"FAKE_MCP_STARTUP_DELAY": "5"}, startup_timeout=0.5)
+        started = time.monotonic()
+        try:
+            await slow.start()
+            assert False, "startup deadline was not enforced"
+        except TimeoutError:
+            pass
+        assert time.monotonic() - started < 2
+        assert slow.process is None
+
+        dead = AsyncMCPClient([sys.executable, "-c", "import sys; sys.exit(1)"], startup_timeout=30)
+        started = time.monotonic()
+        try:
+            await dead.start()
+            assert False, "exited server did not fail startup"
+        except (RuntimeError, OSError):
+            pass
+        assert time.monotonic() - started < 5
+
+    asyncio.run(run())
+    print("✅ Startup is protocol-driven and bounded")
+    return True
+
+
+def test_crash_and_respawn():
+    """In-flight calls fail immediately on a crash; later calls wait for the restart"""
+    print("\n" + "=" * 60)
+    print("Test 5: Crash Detection and Respawn")
+    print("=" * 60)
+
+    async def run():
+        client = AsyncMCPClient(FAKE_SERVER_COMMAND, request_timeout=10)
+        await client.start()
+        try:
+            first_pid = client.process.pid
+            in_flight = [asyncio.ensure_future(client.call_tool("echo", {"delay": 5})) for _ in range(5)]
+            await asyncio.sleep(0.2)
+
+            started = time.monotonic()
+            crash = await asyncio.gather(client.call_tool("crash", {}), *in_flight, return_exceptions=True)
+            failed_in = time.monotonic() - started
+            assert all(isinstance(error, MCPServerCrashedError) for error in crash), crash
+            assert crash[0].returncode == 3
+            assert failed_in < 2, f"in-flight calls waited {failed_in:.2f}s"
+
+            # Called during the restart: waits for the new process instead of failing
+            result = await client.call_tool("echo", {"after": "restart"})
+            assert result["pid"] != first_pid
+            stats = client.supervisor_stats()
+            assert stats["restart_count"] == 1 and stats["crash_count"] == 1 and stats["last_exit_code"] == 3
+            assert client.available_tools == ["echo"]
+            print(f"In-flight calls failed in {failed_in:.2f}s, supervisor: {stats}")
+        finally:
+            await client.stop()
+        assert not client.restarting
+
+    asyncio.run(run())
+    print("✅ Crash detected and server respawned")
+    return True
+
+
+def test_pending_table_bounds():
+    """The pending table is bounded, cleaned on timeout/cancel and drops late responses"""
+    print("\n" + "=" * 60)
+    print("Test 6: Pending Request Table")
+    print("=" * 60)
+
+    async def run():
+        client = AsyncMCPClient(FAKE_SERVER_COMMAND, max_pending=4)
+        await client.start()
+        try:
+            # Timeouts remove their slot; the responses arriving later are dropped
+            results = await asyncio.gather(
+                *(client.call_tool("echo", {"delay": 0.4}, timeout=0.1) for _ in range(3)),
+                return_exceptions=True
+            )
+            assert all(isinstance(result, TimeoutError) for result in results)
+            assert client.pending_stats()["in_flight"] == 0
+            assert client.pending_stats()["orphaned"] == 3
+            await asyncio.sleep(0.6)
+            stats = client.pending_stats()
+            assert stats["late_responses_dropped"] == 3 and stats["orphaned"] == 0, stats
+
+            # Cancelled callers free their slot too
+            task = asyncio.ensure_future(client.call_tool("echo", {"delay": 1}))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await asyncio.sleep(0.05)
+            assert client.pending_stats()["in_flight"] == 0
+            assert client.pending_stats()["cancelled"] == 1
+
+            # More callers than slots: they queue instead of failing
+            started = time.monotonic()
+            results = await asyncio.gather(*(client.call_tool("echo", {"index": i, "delay": 0.2}) for i in range(12)))
+            elapsed = time.monotonic() - started
+            assert [_echoed(result)["index"] for result in results] == list(range(12))
+            assert client.pending_stats()["peak_in_flight"] == 4
+            assert 0.55 < elapsed < 2, f"{elapsed:.2f}s"
+            print(f"Gauges: {client.pending_stats()}")
+        finally:
+            await client.stop()
+
+    asyncio.run(run())
+    print("✅ Pending table stays bounded")
+    return True
+
+
+def test_stderr_drain():
+    """A chatty server never blocks on its stderr pipe and only the log tail is kept"""
+    print("\n" + "=" * 60)
+    print("Test 7: Stderr Drain")
+    print("=" * 60)
+
+    buffer = StderrRingBuffer(max_bytes=10)
+    buffer.write(b"line 1\nline 2\n")
+    assert buffer.text() == " 1\nline 2\n" and buffer.tail(1) == ["line 2"]
+    assert buffer.stats() == {"buffered_bytes": 10, "max_bytes": 10, "total_bytes": 14, "dropped_bytes": 4}
+
+    async def run():
+        client = AsyncMCPClient(FAKE_SERVER_COMMAND, request_timeout=10, stderr_buffer_bytes=16 * 1024)
+        await client.start()
+        try:
+            # 1MB of stderr is far beyond the OS pipe buffer (64KB on Linux)
+            started = time.monotonic()
+            for _ in range(4):
+                await client.call_tool("log", {"kb": 256})
+            result = await client.call_tool("echo", {"after": "logs"})
+            elapsed = time.monotonic() - started
+            assert _echoed(result) == {"after": "logs"}
+            assert elapsed < 5, f"calls stalled for {elapsed:.2f}s"
+
+            await asyncio.sleep(0.1)
+            stats = client.stderr_log.stats()
+            assert stats["buffered_bytes"] <= 16 * 1024
+            assert stats["total_bytes"] > 1000 * 1024 and stats["dropped_bytes"] > 0, stats
+
+            diagnostics = client.diagnostics(stderr_lines=3)
+            assert len(diagnostics["stderr_tail"]) == 3
+            assert all(line.startswith("fake server log line") for line in diagnostics["stderr_tail"])
+            assert diagnostics["pid"] == client.process.pid and diagnostics["initialized"]
+            print(f"1MB of logs in {elapsed:.2f}s, buffer: {stats}")
+        finally:
+            await client.stop()
+
+    asyncio.run(run())
+
+    pool = MCPClientPool(FAKE_SERVER_COMMAND, size=2)
+    pool.start()
+    try:
+        processes = pool.diagnostics(stderr_lines=5)["processes"]
+        assert len(processes) == 2
+        assert all("MCP server started" in process["stderr_tail"][0] for process in processes)
+        assert all(process["healthy"] for process in processes)
+    finally:
+        pool.stop()
+
+    print("✅ Stderr drained into a bounded buffer")
+    return True
+
+
+def test_pipelined_writes():
+    """Concurrent large requests share coalesced writes and all arrive intact"""
+    print("\n" + "=" * 60)
+    print("Test 8: Pipelined Writes")
+    print("=" * 60)
+
+    async def burst(client, count, payload_size):
+        payload = "数据" * payload_size
+        results = await asyncio.gather(*(
+            client.call_tool("echo", {"index": i, "payload": payload}) for i in range(count)
+        ))
+        for i, result in enumerate(results):
+            echoed = _echoed(result)
+            assert echoed["index"] == i and echoed["payload"] == payload, f"request {i} was corrupted"
+
+    async def run():
+        client = AsyncMCPClient(FAKE_SERVER_COMMAND, request_timeout=20)
+        await client.start()
+        try:
+            written_before = client.pending_stats()["messages_written"]
+            await burst(client, 300, 20000)
+            stats = client.pending_stats()
+            assert stats["messages_written"] - written_before == 300
+            assert stats["writes"] < stats["messages_written"], f"writes were not coalesced: {stats}"
+            assert stats["batches_sent"] == 0
+            print(f"Line mode: {stats['messages_written']} messages in {stats['writes']} writes")
+        finally:
+            await client.stop()
+
+        batched = AsyncMCPClient(FAKE_SERVER_COMMAND, request_timeout=20, batch_requests=True)
+        await batched.start()
+        try:
+            await burst(batched, 300, 100)
+            stats = batched.pending_stats()
+            assert stats["batches_sent"] > 0, stats
+            assert stats["in_flight"] == 0 and stats["unknown_responses_dropped"] == 0
+            print(f"Batch mode: {stats['messages_written']} messages in {stats['batches_sent']} batches")
+        finally:
+            await batched.stop()
+
+    asyncio.run(run())
+    print("✅ Writes pipelined without corrupting framing")
+    return True
+
+
+def test_pool_start_retry():
+    """A process that fails its first start is retried in the background and rejoins the pool"""
+    print("\n" + "=" * 60)
+    print("Test 9: Pool Startup Retry")
+    print("=" * 60)
+
+    pool = MCPClientPool(FAKE_SERVER_COMMAND, size=2)
+    late = pool.members[1].client
+    late.server_command = [sys.executable, "-c", "import sys; sys.exit(1)"]
+    pool.start()
+    try:
+        assert pool.members[0].client.initialized and not late.initialized
+        assert late.restarting, "failed member was not scheduled for a retry"
+        assert all(pool.call_tool("echo", {})["pid"] == pool.members[0].client.process.pid for _ in range(3))
+
+        # The next attempt succeeds once the server can start
+        late.server_command = FAKE_SERVER_COMMAND
+        deadline = time.monotonic() + 10
+        while not late.initialized and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert late.initialized and pool.members[1].is_healthy(time.monotonic())
+        pids = {pool.call_tool("echo", {})["pid"] for _ in range(4)}
+        print(f"Recovered after {late.restart_count} restart(s), calls served by {len(pids)} processes")
+        assert late.process.pid in pids and len(pids) == 2
+    finally:
+        pool.stop()
+    assert not late.restarting
+
+    print("✅ Failed pool member retried and back in rotation")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Concurrent Async Calls", test_async_concurrent_calls),
+        ("Sync/Async Facade", test_sync_facade),
+        ("Process Pool", test_pool_dispatch_and_health),
+        ("Startup Handshake", test_startup_handshake),
+        ("Crash and Respawn", test_crash_and_respawn),
+        ("Pending Request Table", test_pending_table_bounds),
+        ("Stderr Drain", test_stderr_drain),
+        ("Pipelined Writes", test_pipelined_writes),
+        ("Pool Startup Retry", test_pool_start_retry),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,369 @@
+"""
+Plan Cache Test Script
+
+Purpose:
+1. Verify TieredCache memory/disk tiers, TTL expiry and size-based eviction
+2. Verify equivalent TripRequests share one canonical cache key
+3. Verify plan_trip serves repeat requests from the cache and never caches fallback plans
+4. Verify retrieval stages are memoized on only the fields they depend on
+5. Verify tool error payloads are treated as stage failures and never cached
+6. Verify plans built while a retrieval stage was unavailable are not cached
+
+These tests use stub agents and a temporary cache directory.
+
+Usage:
+    python test_plan_cache.py
+"""
+
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.agents.trip_planner_agent import (
+    MultiAgentTripPlanner, StageUnavailableNote, canonicalize_trip_request, degraded_stages
+)
+from app.config import get_settings
+from app.models.schemas import TripRequest
+from app.services import cache_service
+from app.services.cache_service import TieredCache, make_cache_key
+from app.services.mcp_tools import UVX_NOT_FOUND_ERROR
+
+
+def _make_request(**overrides) -> TripRequest:
+    fields = dict(
+        city="Beijing",
+        start_date="2025-06-01",
+        end_date="2025-06-02",
+        travel_days=2,
+        transportation="公共交通",
+        accommodation="经济型酒店",
+        preferences=["美食", "历史文化"],
+        free_text_input="more museums"
+    )
+    fields.update(overrides)
+    return TripRequest(**fields)
+
+
+def test_tiered_cache():
+    """Memory tier, disk tier, TTL and eviction"""
+    print("=" * 60)
+    print("Test 1: TieredCache")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        disk_path = str(Path(tmp) / "cache.sqlite3")
+        cache = TieredCache("test", ttl=60, memory_size=2, disk_path=disk_path, max_disk_entries=3)
+
+        for i in range(5):
+            cache.set(f"k{i}", f"v{i}")
+        assert len(cache.memory) == 2, "memory tier not bounded"
+        assert len(cache.disk) == 3, "disk tier not bounded"
+        assert cache.get("k0") is None, "oldest entry not evicted"
+        assert cache.get("k2") == "v2", "disk tier miss"
+        print("✅ Both tiers are bounded and disk hits are served")
+
+        # A fresh instance on the same file sees the persisted entries
+        reopened = TieredCache("test", ttl=60, memory_size=2, disk_path=disk_path)
+        assert reopened.get("k4") == "v4"
+        print("✅ Disk tier survives a restart")
+
+        cache.set("short", "value", ttl=0.05)
+        time.sleep(0.1)
+        assert cache.get("short") is None
+        print("✅ Expired entries are not returned")
+
+    return True
+
+
+def test_canonical_key():
+    """Equivalent requests map to the same key"""
+    print("\n" + "=" * 60)
+    print("Test 2: Canonical Request Key")
+    print("=" * 60)
+
+    base = make_cache_key("plan", canonicalize_trip_request(_make_request()))
+    same = make_cache_key("plan", canonicalize_trip_request(_make_request(
+        city=" 北京 ",
+        preferences=["历史文化", "美食", "美食"],
+        free_text_input="  more   museums "
+    )))
+    different = make_cache_key("plan", canonicalize_trip_request(_make_request(travel_days=3)))
+
+    assert base == same, "equivalent requests produced different keys"
+    assert base != different, "different requests share a key"
+    print("✅ Canonicalization merges equivalent requests only")
+    return True
+
+
+class CountingPlanner:
+    """Stub planner agent that counts calls"""
+
+    def __init__(self, response: str):
+        self.response = response
+        self.calls = 0
+
+    def run(self, query: str) -> str:
+        self.calls += 1
+        return self.response
+
+
+class StubAgent:
+    def __init__(self):
+        self.name = "Stub Agent"
+
+    def run(self, query: str) -> str:
+        return "stub"
+
+
+def test_plan_trip_cache():
+    """Repeat requests hit the cache; fallback plans are not cached"""
+    print("\n" + "=" * 60)
+    print("Test 3: plan_trip Cache")
+    print("=" * 60)
+
+    settings = get_settings()
+    original = (settings.plan_cache_enabled, settings.stage_cache_enabled, settings.cache_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.plan_cache_enabled = True
+        settings.stage_cache_enabled = False
+        settings.cache_dir = tmp
+        cache_service._plan_cache = None
+        try:
+            planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+            planner.attraction_agent = planner.weather_agent = planner.hotel_agent = StubAgent()
+
+            planner.planner_agent = CountingPlanner("not json")
+            planner.plan_trip(_make_request())
+            planner.plan_trip(_make_request())
+            assert planner.planner_agent.calls == 2, "fallback plan was cached"
+            print("✅ Fallback plans are not cached")
+
+            planner.planner_agent = CountingPlanner(
+                '{"city": "Beijing", "start_date": "2025-06-01", "end_date": "2025-06-02",'
+                ' "days": [], "overall_suggestions": "cached"}'
+            )
+            first = planner.plan_trip(_make_request())
+            second = planner.plan_trip(_make_request(city="beijing"))
+            assert planner.planner_agent.calls == 1, "repeat request was not served from cache"
+            assert second.overall_suggestions == first.overall_suggestions == "cached"
+            print("✅ Repeat request served from the plan cache")
+        finally:
+            settings.plan_cache_enabled, settings.stage_cache_enabled, settings.cache_dir = original
+            cache_service._plan_cache = None
+
+    return True
+
+
+class CountingAgent:
+    """Stub retrieval agent that counts calls"""
+
+    def __init__(self, output: str):
+        self.output = output
+        self.calls = 0
+        self.name = "Counting Agent"
+
+    def run(self, query: str) -> str:
+        self.calls += 1
+        return self.output
+
+
+def test_stage_cache():
+    """Stage outputs are reused across requests that differ elsewhere"""
+    print("\n" + "=" * 60)
+    print("Test 4: Stage Memoization")
+    print("=" * 60)
+
+    settings = get_settings()
+    original = (settings.stage_cache_enabled, settings.cache_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.stage_cache_enabled = True
+        settings.cache_dir = tmp
+        cache_service._stage_cache = None
+        try:
+            planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+            planner.attraction_agent = CountingAgent("attractions")
+            planner.weather_agent = CountingAgent("Error: weather failed")
+            planner.hotel_agent = CountingAgent("hotels")
+
+            # Different dates, free text and preference order, same city/preferences/accommodation
+            planner._run_stage("attractions", _make_request())
+            planner._run_stage("attractions", _make_request(start_date="2025-07-01", free_text_input="parks"))
+            planner._run_stage("attractions", _make_request(preferences=["历史文化", " 美食"]))
+            planner._run_stage("hotels", _make_request())
+            planner._run_stage("hotels", _make_request(travel_days=3))
+            assert planner.attraction_agent.calls == 1
+            assert planner.hotel_agent.calls == 1
+            print("✅ Attraction and hotel stages reused across different trips")
+
+            planner._run_stage("attractions", _make_request(preferences=["自然风光"]))
+            assert planner.attraction_agent.calls == 2
+            print("✅ A different preference keyword misses the cache")
+
+            planner._run_stage("weather", _make_request())
+            planner._run_stage("weather", _make_request())
+            assert planner.weather_agent.calls == 2
+            print("✅ Failed stage outputs are not cached")
+        finally:
+            settings.stage_cache_enabled, settings.cache_dir = original
+            cache_service._stage_cache = None
+
+    return True
+
+
+class CountingTool:
+    """Stub Amap tool for direct mode that counts calls"""
+
+    def __init__(self, name: str, output: str):
+        self.name = name
+        self.output = output
+        self.calls = 0
+
+    def invoke(self, arguments: dict) -> str:
+        self.calls += 1
+        return self.output
+
+
+def test_stage_error_payloads():
+    """JSON error bodies from the tools fail the stage and are not cached"""
+    print("\n" + "=" * 60)
+    print("Test 5: Stage Error Payloads")
+    print("=" * 60)
+
+    settings = get_settings()
+    original = (settings.stage_cache_enabled, settings.cache_dir, settings.agent_pipeline_mode)
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.stage_cache_enabled = True
+        settings.cache_dir = tmp
+        settings.agent_pipeline_mode = "direct"
+        cache_service._stage_cache = None
+        try:
+            planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+            request = _make_request(preferences=["历史文化"])
+            for payload in [
+                UVX_NOT_FOUND_ERROR,
+                {"error": "Request failed: timeout"},
+                {"status": "0", "info": "INVALID_USER_KEY", "infocode": "10001"},
+            ]:
+                tool = CountingTool("amap_maps_text_search", json.dumps(payload, ensure_ascii=False))
+                planner.amap_tools = [tool]
+                output = planner._run_stage("attractions", request)
+                planner._run_stage("attractions", request)
+                assert tool.calls == 2, f"error payload was cached: {payload}"
+                note = planner._check_stage_output("attractions", request, output)
+                assert note.startswith("Attractions information is unavailable"), note
+            print("✅ uvx, MCP and REST error bodies fail the stage without being cached")
+
+            tool = CountingTool("amap_maps_text_search", json.dumps({"status": "1", "pois": [
+                {"id": "B1", "name": "故宫博物院", "location": "116.397,39.918"}
+            ]}, ensure_ascii=False))
+            planner.amap_tools = [tool]
+            planner._run_stage("attractions", request)
+            output = planner._run_stage("attractions", request)
+            assert tool.calls == 1 and "故宫博物院" in planner._check_stage_output("attractions", request, output)
+            print("✅ Successful payloads are still cached")
+        finally:
+            settings.stage_cache_enabled, settings.cache_dir, settings.agent_pipeline_mode = original
+            cache_service._stage_cache = None
+
+    return True
+
+
+class FixedAgent:
+    """Stub agent (retrieval or planner) with sync and async calls that counts calls"""
+
+    def __init__(self, output: str):
+        self.output = output
+        self.calls = 0
+        self.name = "Fixed Agent"
+
+    def run(self, query: str) -> str:
+        self.calls += 1
+        return self.output
+
+    async def arun(self, query: str) -> str:
+        return self.run(query)
+
+
+def test_degraded_plans_not_cached():
+    """A plan built from an unavailable stage is returned but not cached"""
+    print("\n" + "=" * 60)
+    print("Test 6: Degraded Plans Not Cached")
+    print("=" * 60)
+
+    settings = get_settings()
+    original = (settings.plan_cache_enabled, settings.stage_cache_enabled, settings.cache_dir)
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.plan_cache_enabled = True
+        settings.stage_cache_enabled = False
+        settings.cache_dir = tmp
+        cache_service._plan_cache = None
+        try:
+            planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+            planner.attraction_agent = FixedAgent("attractions")
+            planner.weather_agent = FixedAgent(json.dumps({"status": "0", "info": "DAILY_QUERY_OVER_LIMIT"}))
+            planner.hotel_agent = FixedAgent("Error: hotel search timed out")
+            planner.planner_agent = FixedAgent(
+                '{"city": "Beijing", "start_date": "2025-06-01", "end_date": "2025-06-02",'
+                ' "days": [], "overall_suggestions": "invented hotels"}'
+            )
+
+            results = planner._run_retrieval_stages(_make_request())
+            assert isinstance(results["hotels"], StageUnavailableNote) and results["hotels"].reason.startswith("Error")
+            assert degraded_stages(results) == ["weather", "hotels"]
+
+            for _ in range(2):
+                assert planner.plan_trip(_make_request()).overall_suggestions == "invented hotels"
+            asyncio.run(planner.aplan_trip(_make_request()))
+            assert planner.planner_agent.calls == 3, "degraded plan was cached"
+            print("✅ Plans with unavailable stages are not cached (sync and async)")
+
+            # Once every stage is back, the plan is cached again
+            planner.weather_agent = FixedAgent("weather")
+            planner.hotel_agent = FixedAgent("hotels")
+            planner.plan_trip(_make_request())
+            planner.plan_trip(_make_request())
+            assert planner.planner_agent.calls == 4
+            print("✅ Complete plans are cached")
+        finally:
+            settings.plan_cache_enabled, settings.stage_cache_enabled, settings.cache_dir = original
+            cache_service._plan_cache = None
+
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("TieredCache", test_tiered_cache),
+        ("Canonical Key", test_canonical_key),
+        ("plan_trip Cache", test_plan_trip_cache),
+        ("Stage Memoization", test_stage_cache),
+        ("Stage Error Payloads", test_stage_error_payloads),
+        ("Degraded Plans Not Cached", test_degraded_plans_not_cached),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,135 @@
+"""
+Prompt Compaction Test Script
+
+Purpose:
+1. Verify Amap POI JSON is compacted into a deduplicated top-K table
+2. Verify weather forecasts are compacted into one row per day
+3. Verify the per-section token budget is enforced
+
+Usage:
+    python test_prompt_compaction.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.utils.prompt_compaction import compact_stage_output, estimate_tokens
+
+
+def _make_poi(index: int) -> dict:
+    """A POI in the verbose Amap REST shape"""
+    return {
+        "id": f"B000A{index:05d}",
+        "name": f"景点{index}",
+        "type": "风景名胜;公园广场;公园",
+        "typecode": "110101",
+        "address": f"东城区景山前街{index}号",
+        "location": f"116.{index:06d},39.916527",
+        "tel": "010-12345678",
+        "pname": "北京市",
+        "cityname": "北京市",
+        "adname": "东城区",
+        "business_area": [],
+        "photos": [{"title": [], "url": f"http://store.is.autonavi.com/showpic/{index}"}] * 3,
+        "biz_ext": {"rating": "4.8", "cost": []},
+    }
+
+
+def test_poi_table():
+    """Duplicates are removed, only top-K rows are kept, fields are compact"""
+    print("=" * 60)
+    print("Test 1: POI Compaction")
+    print("=" * 60)
+
+    pois = [_make_poi(i) for i in range(30)]
+    pois.insert(3, dict(pois[1]))  # duplicate id
+    raw = json.dumps({"suggestion": {"keywords": [], "cities": []}, "pois": pois}, ensure_ascii=False)
+
+    compacted = compact_stage_output("attractions", raw, top_k=10, token_budget=2000)
+    lines = compacted.splitlines()
+    print(compacted)
+    print(f"Tokens: ~{estimate_tokens(raw)} -> ~{estimate_tokens(compacted)}")
+
+    assert lines[0].startswith("id | name")
+    assert len(lines) == 12  # header + 10 rows + omitted note
+    assert lines[1] == "B000A00000 | 景点0 | 公园 | 116.000000,39.916527 | 东城区景山前街0号 | 4.8 | "
+    assert sum(1 for line in lines if "景点1 " in line) == 1
+    assert lines[-1] == "(20 more results omitted)"
+    assert estimate_tokens(compacted) < estimate_tokens(raw) / 5
+    print("✅ POI results compacted")
+    return True
+
+
+def test_weather_table():
+    """Forecasts become one row per day"""
+    print("\n" + "=" * 60)
+    print("Test 2: Weather Compaction")
+    print("=" * 60)
+
+    raw = json.dumps({
+        "city": "北京市",
+        "forecasts": [
+            {"date": "2025-06-01", "week": "7", "dayweather": "晴", "nightweather": "多云",
+             "daytemp": "30", "nighttemp": "18", "daywind": "北", "nightwind": "北",
+             "daypower": "1-3", "nightpower": "1-3", "daytemp_float": "30.0", "nighttemp_float": "18.0"}
+        ]
+    }, ensure_ascii=False)
+
+    compacted = compact_stage_output("weather", raw)
+    print(compacted)
+    assert compacted.splitlines()[1] == "2025-06-01 | 晴 | 多云 | 30/18 | 北 1-3"
+    print("✅ Weather results compacted")
+    return True
+
+
+def test_token_budget_and_text_output():
+    """Rows beyond the budget are dropped; non-JSON output is truncated"""
+    print("\n" + "=" * 60)
+    print("Test 3: Token Budget")
+    print("=" * 60)
+
+    raw = json.dumps({"pois": [_make_poi(i) for i in range(30)]}, ensure_ascii=False)
+    compacted = compact_stage_output("hotels", raw, top_k=30, token_budget=150)
+    assert estimate_tokens(compacted) <= 170
+    assert compacted.splitlines()[-1].endswith("more results omitted)")
+
+    prose = "The Forbidden City is a palace complex in Beijing. " * 100
+    truncated = compact_stage_output("attractions", prose, token_budget=100)
+    assert truncated.endswith("...(truncated)")
+    assert estimate_tokens(truncated) <= 110
+    assert compact_stage_output("attractions", "short answer") == "short answer"
+    print("✅ Token budget enforced")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("POI Compaction", test_poi_table),
+        ("Weather Compaction", test_weather_table),
+        ("Token Budget", test_token_budget_and_text_output),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
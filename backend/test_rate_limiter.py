@@ -0,0 +1,287 @@
+"""
+Rate Limiter Test Script
+
+Purpose:
+1. Verify the token bucket paces bursts at the configured rate instead of failing
+2. Verify callers that cannot get a token before their deadline fail and are refunded
+3. Verify daily quotas are consumed, reported and reset on a new day
+4. Verify the rate-limited transport throttles tool calls and reacts to Amap limit errors
+5. Verify throttled map routes wait without blocking the event loop
+
+No network or Amap key is required.
+
+Usage:
+    python test_rate_limiter.py
+"""
+
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.api.routes import map as map_routes
+from app.api.routes import poi as poi_routes
+from app.services import amap_service
+from app.services.amap_service import AmapService
+from app.services.amap_transport import RateLimitedTransport
+from app.services.rate_limiter import (
+    DailyQuota, QuotaExceededError, RateLimiter, RateLimitTimeoutError, TokenBucket, parse_rate_overrides
+)
+
+
+class RecordingTransport:
+    """Answers every tool call immediately and records when it was sent"""
+
+    def __init__(self, payload=None):
+        self.payload = payload or {"status": "1", "pois": []}
+        self.sent_at = []
+
+    def _result(self):
+        self.sent_at.append(time.monotonic())
+        return {"content": [{"type": "text", "text": json.dumps(self.payload)}]}
+
+    def call_tool(self, tool_name, arguments, timeout=None):
+        return self._result()
+
+    async def acall_tool(self, tool_name, arguments, timeout=None):
+        return self._result()
+
+    def diagnostics(self, stderr_lines=50):
+        return {"transport": "recording"}
+
+
+def test_bucket_pacing():
+    """A burst beyond capacity is queued and released at the bucket rate"""
+    print("=" * 60)
+    print("Test 1: Token Bucket Pacing")
+    print("=" * 60)
+
+    limiter = RateLimiter(tool_qps=50)
+
+    async def burst():
+        started = time.monotonic()
+        await asyncio.gather(*(limiter.aacquire("maps_text_search") for _ in range(100)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(burst())
+    print(f"100 calls at 50 QPS (burst 50): {elapsed:.2f}s")
+    assert 0.9 < elapsed < 1.5, f"{elapsed:.2f}s"
+
+    # Threads share the bucket with the same pacing
+    limiter = RateLimiter(tool_qps=40)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(lambda _: limiter.acquire("maps_weather"), range(60)))
+    elapsed = time.monotonic() - started
+    assert 0.4 < elapsed < 1.0, f"{elapsed:.2f}s"
+
+    # Tools have separate buckets; the key bucket is shared
+    limiter = RateLimiter(key_qps=10, tool_qps=5)
+    waits = [limiter._reserve("maps_text_search", 1, None) for _ in range(5)]
+    assert waits == [0.0] * 5
+    assert limiter._reserve("maps_weather", 1, None) == 0.0
+    assert limiter._reserve("maps_text_search", 1, None) > 0
+    assert parse_rate_overrides("maps_weather=5, maps_geo=10,") == {"maps_weather": 5.0, "maps_geo": 10.0}
+
+    print("✅ Bursts paced at the configured rate")
+    return True
+
+
+def test_deadline_and_refund():
+    """Waits longer than max_wait fail fast and give their tokens back"""
+    print("\n" + "=" * 60)
+    print("Test 2: Deadlines")
+    print("=" * 60)
+
+    limiter = RateLimiter(tool_qps=5, max_wait=0.1)
+    for _ in range(5):
+        limiter.acquire("maps_geo")  # the burst capacity; the next call would wait 0.2s
+    started = time.monotonic()
+    try:
+        limiter.acquire("maps_geo")
+        assert False, "deadline was not enforced"
+    except RateLimitTimeoutError:
+        pass
+    assert time.monotonic() - started < 0.05
+    assert limiter.quota("maps_geo").used == 5
+    assert limiter.stats()["tools"]["maps_geo"]["bucket"]["rejected"] == 1
+
+    # Cancelled waiters refund their reservation
+    bucket = TokenBucket(rate=10, capacity=1)
+    limiter = RateLimiter(tool_qps=10)
+    limiter._tool_buckets["maps_geo"] = bucket
+
+    async def cancel_waiter():
+        limiter._reserve("maps_geo", 1, None)
+        task = asyncio.ensure_future(limiter.aacquire("maps_geo", cost=5))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.sleep(0)
+
+    asyncio.run(cancel_waiter())
+    assert bucket.available > -1, bucket.available
+    assert limiter.quota("maps_geo").used == 1
+
+    print("✅ Deadlines enforced, reservations refunded")
+    return True
+
+
+def test_daily_quota():
+    """Quota is consumed per call, rejects when exhausted and resets the next day"""
+    print("\n" + "=" * 60)
+    print("Test 3: Daily Quota")
+    print("=" * 60)
+
+    limiter = RateLimiter(daily_quota=3)
+    for _ in range(3):
+        limiter.acquire("maps_text_search")
+    try:
+        limiter.acquire("maps_text_search")
+        assert False, "quota was not enforced"
+    except QuotaExceededError:
+        pass
+    limiter.acquire("maps_weather")  # other tools have their own quota
+    stats = limiter.stats()["tools"]["maps_text_search"]["quota"]
+    assert stats["used"] == 3 and stats["remaining"] == 0
+
+    quota = DailyQuota(limit=2)
+    quota.consume(2)
+    assert quota.remaining == 0
+    quota._day = "2000-01-01"
+    assert quota.remaining == 2 and quota.consume()
+    assert DailyQuota(limit=0).remaining is None
+
+    print("✅ Daily quota tracked")
+    return True
+
+
+def test_rate_limited_transport():
+    """Tool calls are throttled; Amap limit errors drain the bucket or exhaust the quota"""
+    print("\n" + "=" * 60)
+    print("Test 4: Rate-Limited Transport")
+    print("=" * 60)
+
+    inner = RecordingTransport()
+    transport = RateLimitedTransport(inner, RateLimiter(tool_qps=20, daily_quota=100))
+
+    async def burst():
+        await asyncio.gather(*(transport.acall_tool("maps_text_search", {"keywords": str(i)}) for i in range(40)))
+
+    started = time.monotonic()
+    asyncio.run(burst())
+    elapsed = time.monotonic() - started
+    assert len(inner.sent_at) == 40 and 0.8 < elapsed < 1.5, f"{elapsed:.2f}s"
+    # After the initial burst, calls are spaced at the bucket rate
+    gaps = [later - earlier for earlier, later in zip(inner.sent_at[20:], inner.sent_at[21:])]
+    assert min(gaps) > 0.03, min(gaps)
+
+    # Address routes cost three Amap requests
+    transport.call_tool("maps_direction_walking_by_address", {"origin_address": "a", "destination_address": "b"})
+    assert transport.limiter.quota("maps_direction_walking_by_address").used == 3
+    assert transport.diagnostics()["rate_limit"]["tools"]["maps_text_search"]["quota"]["used"] == 40
+
+    # QPS errors drain the bucket so the next call waits
+    qps_error = RateLimitedTransport(
+        RecordingTransport({"status": "0", "info": "CUQPS_HAS_EXCEEDED_THE_LIMIT"}),
+        RateLimiter(tool_qps=10)
+    )
+    qps_error.call_tool("maps_weather", {"city": "北京"})
+    assert qps_error.limiter._tool_bucket("maps_weather").available < 1
+
+    # Daily limit errors stop further calls for the day
+    daily_error = RateLimitedTransport(
+        RecordingTransport({"status": "0", "info": "USER_DAILY_QUERY_OVER_LIMIT"}),
+        RateLimiter(daily_quota=1000)
+    )
+    daily_error.call_tool("maps_geo", {"address": "故宫"})
+    try:
+        daily_error.call_tool("maps_geo", {"address": "故宫"})
+        assert False, "exhausted quota was not enforced"
+    except QuotaExceededError:
+        pass
+
+    print(f"40 calls at 20 QPS in {elapsed:.2f}s")
+    print("✅ Transport throttled")
+    return True
+
+
+def test_routes_do_not_block_loop():
+    """Route handlers await the async service methods, so other requests keep running while throttled"""
+    print("\n" + "=" * 60)
+    print("Test 5: Non-Blocking Routes")
+    print("=" * 60)
+
+    service = AmapService.__new__(AmapService)
+    service.transport = RateLimitedTransport(RecordingTransport(), RateLimiter(tool_qps=1))
+    amap_service._amap_service = service
+
+    async def scenario():
+        gaps = []
+
+        async def ticker(stop):
+            last = time.monotonic()
+            while not stop.is_set():
+                await asyncio.sleep(0.02)
+                now = time.monotonic()
+                gaps.append(now - last)
+                last = now
+
+        stop = asyncio.Event()
+        tick = asyncio.ensure_future(ticker(stop))
+        started = time.monotonic()
+        await asyncio.gather(
+            *(map_routes.search_poi(keywords=f"景点{i}", city="北京", citylimit=True) for i in range(3)),
+            map_routes.get_weather(city="北京"),
+            poi_routes.get_poi_detail("B000A8UIN8"),
+        )
+        elapsed = time.monotonic() - started
+        stop.set()
+        await tick
+        return elapsed, max(gaps)
+
+    try:
+        elapsed, max_gap = asyncio.run(scenario())
+    finally:
+        amap_service._amap_service = None
+    print(f"3 throttled POI searches at 1 QPS took {elapsed:.2f}s, longest event loop stall {max_gap * 1000:.0f}ms")
+    assert elapsed > 1.5, "calls were not throttled"
+    assert max_gap < 0.2, f"event loop blocked for {max_gap:.2f}s"
+
+    print("✅ Event loop stays responsive")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Token Bucket Pacing", test_bucket_pacing),
+        ("Deadlines", test_deadline_and_refund),
+        ("Daily Quota", test_daily_quota),
+        ("Rate-Limited Transport", test_rate_limited_transport),
+        ("Non-Blocking Routes", test_routes_do_not_block_loop),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
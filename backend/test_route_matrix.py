@@ -0,0 +1,260 @@
+"""
+Route Matrix Test Script
+
+Purpose:
+1. Verify the matrix is symmetric and exact when every pair is routed
+2. Verify haversine pruning skips far pairs but keeps each point's nearest neighbours exact
+3. Verify pairs are cached symmetrically on quantized coordinates
+4. Verify failed pairs fall back to estimates
+5. Verify /api/map/matrix geocodes addresses and validates requests (point limit before geocoding)
+
+The routes come from a fake transport that derives travel times from the coordinates;
+no network or Amap key is required.
+
+Usage:
+    python test_route_matrix.py
+"""
+
+import asyncio
+import json
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import map as map_routes
+from app.config import get_settings
+from app.models.schemas import Location
+from app.services import amap_service, cache_service
+from app.services.amap_service import AmapService
+from app.services.cache_service import TieredCache
+from app.services.itinerary_optimizer import distance_matrix, haversine_km
+from app.services.route_matrix import lower_bound_seconds
+
+# Around the Forbidden City and around the Summer Palace (~15km apart)
+CENTER = [(116.3970, 39.9180), (116.4108, 39.8819), (116.3910, 39.9250), (116.4030, 39.9150), (116.3880, 39.9100), (116.4170, 39.9280)]
+WEST = [(116.2750, 39.9990), (116.2900, 40.0050), (116.2680, 39.9900), (116.2820, 39.9880), (116.3000, 39.9950), (116.2600, 40.0100)]
+ADDRESSES = {"故宫": "116.3970,39.9180", "天坛": "116.4108,39.8819", "颐和园": "116.2750,39.9990"}
+
+
+class FakeRouteTransport:
+    """Walking routes at 1.3× the straight-line distance and 1.2 m/s; records every call"""
+
+    def __init__(self, failing=()):
+        self.calls = []
+        self.failing = set(failing)
+
+    async def acall_tool(self, tool_name, arguments, timeout=None):
+        self.calls.append((tool_name, arguments))
+        if tool_name == "maps_geo":
+            location = ADDRESSES.get(arguments["address"])
+            payload = {"status": "1", "geocodes": [{"location": location}] if location else []}
+        else:
+            if (arguments["origin"], arguments["destination"]) in self.failing:
+                return {"content": [{"type": "text", "text": "No route"}], "isError": True}
+            payload = {"status": "1", "route": {"paths": [route_for(arguments["origin"], arguments["destination"])]}}
+        return {"content": [{"type": "text", "text": json.dumps(payload)}]}
+
+
+def route_for(origin: str, destination: str) -> dict:
+    (lng1, lat1), (lng2, lat2) = (map(float, point.split(",")) for point in (origin, destination))
+    distance = float(haversine_km(lng1, lat1, lng2, lat2)) * 1000 * 1.3
+    return {"distance": str(round(distance)), "duration": str(round(distance / 1.2))}
+
+
+@contextmanager
+def fresh_cache():
+    """Use an empty in-memory tool cache instead of the shared one on disk"""
+    previous = cache_service._tool_cache
+    cache_service._tool_cache = TieredCache("tool", ttl=60, memory_size=256)
+    try:
+        yield
+    finally:
+        cache_service._tool_cache = previous
+
+
+def create_service(transport) -> AmapService:
+    service = AmapService.__new__(AmapService)
+    service.transport = transport
+    return service
+
+
+def locations(points) -> list:
+    return [Location(longitude=lng, latitude=lat) for lng, lat in points]
+
+
+def test_exact_matrix():
+    """neighbors=0 routes every pair once"""
+    print("=" * 60)
+    print("Test 1: Exact Matrix")
+    print("=" * 60)
+
+    transport = FakeRouteTransport()
+    with fresh_cache():
+        matrix = asyncio.run(create_service(transport).route_matrix(locations(CENTER[:5]), neighbors=0))
+    print(matrix["stats"])
+
+    durations = matrix["durations"]
+    assert len(transport.calls) == 10 and matrix["stats"]["routed"] == 10 and matrix["stats"]["estimated"] == 0
+    assert all(durations[i][i] == 0 for i in range(5))
+    assert all(durations[i][j] == durations[j][i] > 0 for i in range(5) for j in range(5) if i != j)
+    assert not any(any(row) for row in matrix["estimated"])
+    origin, destination = transport.calls[0][1]["origin"], transport.calls[0][1]["destination"]
+    assert origin < destination and origin.count(".") == 2 and len(origin.split(",")[0].split(".")[1]) == 4
+
+    print("✅ Every pair routed, matrix symmetric")
+    return True
+
+
+def test_pruning():
+    """Far pairs are estimated; each point's nearest neighbours by travel time stay exact"""
+    print("\n" + "=" * 60)
+    print("Test 2: Haversine Pruning")
+    print("=" * 60)
+
+    transport = FakeRouteTransport()
+    points = CENTER + WEST
+    with fresh_cache():
+        matrix = asyncio.run(create_service(transport).route_matrix(locations(points), neighbors=3))
+    stats = matrix["stats"]
+    print(stats)
+
+    assert stats["pairs"] == 66 and stats["routed"] == len(transport.calls) < 40
+    assert stats["routed"] + stats["estimated"] == 66 and stats["failed"] == 0
+    # No cross-cluster pair needs a real route
+    assert all(matrix["estimated"][i][j] for i in range(6) for j in range(6, 12))
+
+    # The 3 nearest points by true travel time are exact for every point
+    truth = [[int(route_for(f"{a[0]},{a[1]}", f"{b[0]},{b[1]}")["duration"]) for b in points] for a in points]
+    for i in range(len(points)):
+        nearest = sorted((j for j in range(len(points)) if j != i), key=lambda j: truth[i][j])[:3]
+        assert not any(matrix["estimated"][i][j] for j in nearest), f"point {i}"
+
+    # Estimates never undercut the lower bound used for pruning
+    bounds = lower_bound_seconds(distance_matrix(np.array(points)), "walking")
+    assert all(matrix["durations"][i][j] >= bounds[i][j] for i in range(12) for j in range(12))
+
+    print(f"✅ {stats['routed']}/66 pairs routed")
+    return True
+
+
+def test_symmetric_cache():
+    """Reversed order and tiny coordinate differences hit the pair cache"""
+    print("\n" + "=" * 60)
+    print("Test 3: Symmetric Pair Cache")
+    print("=" * 60)
+
+    with fresh_cache():
+        transport = FakeRouteTransport()
+        first = asyncio.run(create_service(transport).route_matrix(locations(CENTER[:4]), neighbors=0))
+        assert first["stats"]["cached"] == 0 and len(transport.calls) == 6
+
+        # Same points, reversed and moved by less than the quantization step
+        shifted = [(lng + 0.000001, lat - 0.000001) for lng, lat in reversed(CENTER[:4])]
+        transport = FakeRouteTransport()
+        second = asyncio.run(create_service(transport).route_matrix(locations(shifted), neighbors=0))
+        print(second["stats"])
+        assert transport.calls == [] and second["stats"]["cached"] == 6
+        assert second["durations"][0][1] == first["durations"][3][2]
+
+    print("✅ Pairs cached symmetrically")
+    return True
+
+
+def test_failed_pairs():
+    """A failed route becomes an estimate instead of failing the matrix"""
+    print("\n" + "=" * 60)
+    print("Test 4: Failed Pairs")
+    print("=" * 60)
+
+    a, b = sorted(f"{lng:.4f},{lat:.4f}" for lng, lat in CENTER[:2])
+    transport = FakeRouteTransport(failing=[(a, b)])
+    with fresh_cache():
+        matrix = asyncio.run(create_service(transport).route_matrix(locations(CENTER[:3]), neighbors=0))
+    assert matrix["stats"]["failed"] == 1 and matrix["stats"]["estimated"] == 1
+    assert matrix["estimated"][0][1] and matrix["durations"][0][1] > 0 and not matrix["estimated"][0][2]
+
+    print("✅ Failed pairs estimated")
+    return True
+
+
+def test_endpoint():
+    """/api/map/matrix geocodes address-only points and validates the request"""
+    print("\n" + "=" * 60)
+    print("Test 5: Matrix Endpoint")
+    print("=" * 60)
+
+    transport = FakeRouteTransport()
+    amap_service._amap_service = create_service(transport)
+    app = FastAPI()
+    app.include_router(map_routes.router, prefix="/api")
+    client = TestClient(app)
+    try:
+        with fresh_cache():
+            response = client.post("/api/map/matrix", json={"points": [
+                {"name": "故宫博物院", "address": "故宫"},
+                {"address": "天坛"},
+                {"name": "颐和园", "location": {"longitude": 116.275, "latitude": 39.999}},
+            ], "city": "北京"})
+            body = response.json()
+            assert response.status_code == 200 and body["success"], body
+            assert body["data"]["names"] == ["故宫博物院", "天坛", "颐和园"]
+            assert body["data"]["points"][1] == {"longitude": 116.4108, "latitude": 39.8819}
+            assert len(body["data"]["durations"]) == 3 and body["data"]["stats"]["pairs"] == 3
+            assert sum(1 for tool, _ in transport.calls if tool == "maps_geo") == 2
+
+            assert client.post("/api/map/matrix", json={"points": [{"address": "不存在"}, {"address": "故宫"}]}).status_code == 400
+            assert client.post("/api/map/matrix", json={"points": [{"name": "x"}, {"address": "故宫"}]}).status_code == 400
+            transit = {"points": [{"address": "故宫"}, {"address": "天坛"}], "route_type": "transit"}
+            assert "city is required" in client.post("/api/map/matrix", json=transit).json()["detail"]
+            assert client.post("/api/map/matrix", json={"points": [{"address": "故宫"}]}).status_code == 422
+
+            # Too many points are rejected before any geocoding
+            calls = len(transport.calls)
+            limit = get_settings().amap_matrix_max_points
+            response = client.post("/api/map/matrix", json={"points": [{"address": "故宫"}] * (limit + 1)})
+            assert response.status_code == 400 and "max" in response.json()["detail"]
+            assert len(transport.calls) == calls
+    finally:
+        amap_service._amap_service = None
+
+    print("✅ Endpoint served")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Exact Matrix", test_exact_matrix),
+        ("Haversine Pruning", test_pruning),
+        ("Symmetric Pair Cache", test_symmetric_cache),
+        ("Failed Pairs", test_failed_pairs),
+        ("Matrix Endpoint", test_endpoint),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,275 @@
+"""
+Sharded Planner Test Script
+
+Purpose:
+1. Verify per-day planner calls run concurrently
+2. Verify days are merged and the budget is computed locally
+3. Verify a failed day falls back without caching a complete plan
+4. Verify an unparsable allocation falls back to single-call planning
+5. Verify the async and streaming paths respect planner_shard_concurrency
+
+These tests use stub agents, so no LLM or MCP server is required.
+
+Usage:
+    python test_sharded_planner.py
+"""
+
+import asyncio
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.agents.trip_planner_agent import MultiAgentTripPlanner
+from app.models.schemas import TripRequest
+from test_concurrent_planning import override_settings
+
+
+class StubAllocationAgent:
+    """Stub allocation agent that assigns one attraction per day"""
+
+    def __init__(self, travel_days: int, valid: bool = True):
+        self.travel_days = travel_days
+        self.valid = valid
+
+    def _output(self) -> str:
+        if not self.valid:
+            return "Sorry, I cannot allocate this trip."
+        days = [
+            {"day_index": i, "theme": f"Theme {i}", "attractions": [f"Attraction {i}"], "hotel": "Hotel A"}
+            for i in range(self.travel_days)
+        ]
+        return "```json\n" + json.dumps({"days": days, "overall_suggestions": "Have fun"}) + "\n```"
+
+    def run(self, query: str) -> str:
+        return self._output()
+
+    async def arun(self, query: str) -> str:
+        return self._output()
+
+
+class StubDayPlannerAgent:
+    """Stub day planner that sleeps and returns one day, optionally failing some days"""
+
+    def __init__(self, delay: float, failing_days=()):
+        self.delay = delay
+        self.failing_days = set(failing_days)
+        self.active = 0
+        self.max_active = 0
+
+    def _output(self, query: str) -> str:
+        day_index = int(re.search(r"day_index (\d+)", query).group(1))
+        if day_index in self.failing_days:
+            return "not json"
+        day = {
+            "date": f"2025-06-0{day_index + 1}",
+            "day_index": day_index,
+            "description": f"Day {day_index + 1}",
+            "transportation": "公共交通",
+            "accommodation": "经济型酒店",
+            "hotel": {"name": "Hotel A", "address": "Somewhere", "estimated_cost": 300},
+            "attractions": [{
+                "name": f"Attraction {day_index}",
+                "address": "Somewhere",
+                "location": {"longitude": 116.4, "latitude": 39.9},
+                "visit_duration": 120,
+                "description": "Nice place",
+                "ticket_price": 50
+            }],
+            "meals": [
+                {"type": "lunch", "name": "Lunch", "estimated_cost": 40},
+                {"type": "dinner", "name": "Dinner", "estimated_cost": 60}
+            ]
+        }
+        return json.dumps({"day": day, "weather": None})
+
+    def run(self, query: str) -> str:
+        time.sleep(self.delay)
+        return self._output(query)
+
+    async def arun(self, query: str) -> str:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return self._output(query)
+
+
+STAGE_RESULTS = {"attractions": "attractions", "weather": "weather", "hotels": "hotels"}
+
+
+def _make_planner(travel_days: int, day_planner, valid_allocation: bool = True) -> MultiAgentTripPlanner:
+    """Create a planner without initializing the LLM"""
+    planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+    planner.allocation_agent = StubAllocationAgent(travel_days, valid_allocation)
+    planner.day_planner_agent = day_planner
+    return planner
+
+
+def _make_request(travel_days: int = 4) -> TripRequest:
+    return TripRequest(
+        city="Beijing",
+        start_date="2025-06-01",
+        end_date=f"2025-06-0{travel_days}",
+        travel_days=travel_days,
+        transportation="公共交通",
+        accommodation="经济型酒店",
+        preferences=["历史文化"]
+    )
+
+
+def test_days_planned_concurrently():
+    """Four 0.5s day calls should finish in roughly 0.5s and merge into one plan"""
+    print("=" * 60)
+    print("Test 1: Concurrent Day Planning")
+    print("=" * 60)
+
+    with override_settings(planner_mode="sharded", planner_shard_concurrency=8):
+        planner = _make_planner(4, StubDayPlannerAgent(0.5))
+        request = _make_request(4)
+        assert planner._use_sharded_planner(request)
+        started = time.monotonic()
+        trip_plan, complete = planner._plan_sharded(request, STAGE_RESULTS)
+        elapsed = time.monotonic() - started
+
+    print(f"Elapsed: {elapsed:.2f}s")
+    assert complete
+    assert elapsed < 1.5, f"day calls did not overlap ({elapsed:.2f}s)"
+    assert [day.day_index for day in trip_plan.days] == [0, 1, 2, 3]
+    assert trip_plan.overall_suggestions == "Have fun"
+    budget = trip_plan.budget
+    # One attraction per day and no hotel coordinates: no transportation legs
+    assert (budget.total_attractions, budget.total_hotels, budget.total_meals, budget.total_transportation) == (200, 1200, 400, 0)
+    assert budget.total == 1800
+    print("✅ Days planned concurrently and budget computed locally")
+    return True
+
+
+def test_async_sharded_with_failed_day():
+    """A failed day is replaced by a fallback day and the plan is marked incomplete"""
+    print("\n" + "=" * 60)
+    print("Test 2: Async Sharded Planning with a Failed Day")
+    print("=" * 60)
+
+    with override_settings(planner_mode="sharded"):
+        planner = _make_planner(4, StubDayPlannerAgent(0.1, failing_days={2}))
+        trip_plan, complete = asyncio.run(planner._aplan_sharded(_make_request(4), STAGE_RESULTS))
+
+    assert not complete
+    assert len(trip_plan.days) == 4
+    assert trip_plan.days[1].attractions[0].name == "Attraction 1"
+    assert trip_plan.days[2].attractions[0].name != "Attraction 2"
+    print("✅ Failed day replaced by fallback day")
+
+    # Streaming: the fallback day is emitted as a day event too, so no day is missing
+    with override_settings(planner_mode="sharded"):
+        planner = _make_planner(4, StubDayPlannerAgent(0.1, failing_days={2}))
+
+        async def stage(stage_name, request):
+            return STAGE_RESULTS[stage_name]
+
+        planner._arun_stage_checked = stage
+
+        async def collect():
+            return [event async for event in planner.astream_trip(_make_request(4))]
+
+        events = asyncio.run(collect())
+    days = [data for name, data in events if name == "day"]
+    assert sorted(day["day_index"] for day in days) == [0, 1, 2, 3]
+    assert events[-1][0] == "plan" and days[-1] == events[-1][1]["days"][2]
+    print("✅ Fallback day streamed before the final plan")
+    return True
+
+
+def test_allocation_failure_and_mode_selection():
+    """Unparsable allocation returns None; auto mode only shards long trips"""
+    print("\n" + "=" * 60)
+    print("Test 3: Allocation Fallback and Planner Mode")
+    print("=" * 60)
+
+    with override_settings(planner_mode="sharded"):
+        planner = _make_planner(4, StubDayPlannerAgent(0), valid_allocation=False)
+        assert planner._plan_sharded(_make_request(4), STAGE_RESULTS) is None
+
+    with override_settings(planner_mode="auto", planner_shard_min_days=4):
+        assert planner._use_sharded_planner(_make_request(4))
+        assert not planner._use_sharded_planner(_make_request(2))
+
+    with override_settings(planner_mode="single"):
+        assert not planner._use_sharded_planner(_make_request(4))
+
+    print("✅ Allocation fallback and mode selection work")
+    return True
+
+
+def test_async_concurrency_cap():
+    """The async and streaming paths never run more day calls than planner_shard_concurrency"""
+    print("\n" + "=" * 60)
+    print("Test 4: Async Concurrency Cap")
+    print("=" * 60)
+
+    with override_settings(planner_mode="sharded", planner_shard_concurrency=2):
+        day_planner = StubDayPlannerAgent(0.2)
+        planner = _make_planner(6, day_planner)
+        started = time.monotonic()
+        trip_plan, complete = asyncio.run(planner._aplan_sharded(_make_request(6), STAGE_RESULTS))
+        elapsed = time.monotonic() - started
+        print(f"6 days with concurrency 2: {elapsed:.2f}s, at most {day_planner.max_active} in flight")
+        assert complete and len(trip_plan.days) == 6
+        assert day_planner.max_active == 2 and elapsed >= 0.55, f"{day_planner.max_active} in flight, {elapsed:.2f}s"
+
+        # Streaming: days are still emitted as each call finishes, under the same cap
+        day_planner = StubDayPlannerAgent(0.1)
+        planner = _make_planner(6, day_planner)
+
+        async def stage(stage_name, request):
+            return STAGE_RESULTS[stage_name]
+
+        planner._arun_stage_checked = stage
+
+        async def collect():
+            return [event async for event in planner.astream_trip(_make_request(6))]
+
+        events = asyncio.run(collect())
+        names = [name for name, _ in events]
+        assert names.count("day") == 6 and names[-1] == "plan"
+        assert day_planner.max_active == 2, day_planner.max_active
+
+    print("✅ Day calls capped in async and streaming paths")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Concurrent Day Planning", test_days_planned_concurrently),
+        ("Failed Day Fallback", test_async_sharded_with_failed_day),
+        ("Allocation Fallback", test_allocation_failure_and_mode_selection),
+        ("Async Concurrency Cap", test_async_concurrency_cap),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,179 @@
+"""
+Trip Plan Streaming Test Script
+
+Purpose:
+1. Verify DayPlanStreamParser extracts days from arbitrary chunk boundaries
+2. Verify astream_trip emits stage events, day events and the final plan
+
+These tests use stub agents, so no LLM or MCP server is required.
+
+Usage:
+    python test_trip_stream.py
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Add project path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from app.agents.trip_planner_agent import MultiAgentTripPlanner
+from app.config import get_settings
+from app.models.schemas import TripRequest
+from app.utils.json_stream import DayPlanStreamParser
+
+
+def _make_plan_json(days: int) -> str:
+    """Planner-style response with a ```json fence and tricky strings"""
+    plan = {
+        "city": "Beijing",
+        "start_date": "2025-06-01",
+        "end_date": "2025-06-03",
+        "days": [
+            {
+                "date": f"2025-06-0{i + 1}",
+                "day_index": i,
+                "description": f"Day {i + 1}: braces {{}} and \"quotes\" [inside] strings",
+                "transportation": "Public transit",
+                "accommodation": "Budget hotel",
+                "attractions": [],
+                "meals": [{"type": "lunch", "name": "Noodles", "estimated_cost": 30}]
+            }
+            for i in range(days)
+        ],
+        "weather_info": [],
+        "overall_suggestions": "Bring an umbrella"
+    }
+    return "Here is your plan:\n```json\n" + json.dumps(plan, ensure_ascii=False, indent=2) + "\n```"
+
+
+def test_parser_chunk_boundaries():
+    """Days are emitted once each, whatever the chunk size"""
+    print("=" * 60)
+    print("Test 1: DayPlanStreamParser Chunk Boundaries")
+    print("=" * 60)
+
+    text = _make_plan_json(3)
+    for chunk_size in (1, 7, 64, len(text)):
+        parser = DayPlanStreamParser()
+        days = []
+        for i in range(0, len(text), chunk_size):
+            days.extend(parser.feed(text[i:i + chunk_size]))
+        assert [day["day_index"] for day in days] == [0, 1, 2], f"chunk size {chunk_size}: {days}"
+        assert days[0]["description"].startswith("Day 1: braces {}")
+        print(f"✅ chunk size {chunk_size}: {len(days)} days")
+
+    return True
+
+
+def test_parser_emits_before_completion():
+    """The first day is available before the JSON object is complete"""
+    print("\n" + "=" * 60)
+    print("Test 2: Early Emission")
+    print("=" * 60)
+
+    text = _make_plan_json(2)
+    cut = text.index('"day_index": 1')
+    parser = DayPlanStreamParser()
+    days = parser.feed(text[:cut])
+    assert len(days) == 1 and days[0]["day_index"] == 0
+    print("✅ Day 1 parsed while day 2 was still streaming")
+    return True
+
+
+class StubAgent:
+    """Stub retrieval agent"""
+
+    def __init__(self, output: str):
+        self.output = output
+        self.name = "Stub Agent"
+
+    async def arun(self, query: str) -> str:
+        await asyncio.sleep(0.01)
+        return self.output
+
+
+class StubPlanner:
+    """Stub planner that streams its response in small chunks"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    async def astream(self, query: str):
+        for i in range(0, len(self.text), 16):
+            await asyncio.sleep(0)
+            yield self.text[i:i + 16]
+
+
+def test_astream_trip_events():
+    """astream_trip emits stages, then days, then the full plan"""
+    print("\n" + "=" * 60)
+    print("Test 3: astream_trip Events")
+    print("=" * 60)
+
+    planner = MultiAgentTripPlanner.__new__(MultiAgentTripPlanner)
+    planner.attraction_agent = StubAgent("attractions")
+    planner.weather_agent = StubAgent("weather")
+    planner.hotel_agent = StubAgent("hotels")
+    planner.planner_agent = StubPlanner(_make_plan_json(3))
+
+    request = TripRequest(
+        city="Beijing",
+        start_date="2025-06-01",
+        end_date="2025-06-03",
+        travel_days=3,
+        transportation="公共交通",
+        accommodation="经济型酒店"
+    )
+
+    async def collect():
+        return [event async for event in planner.astream_trip(request)]
+
+    settings = get_settings()
+    original = (settings.plan_cache_enabled, settings.stage_cache_enabled)
+    settings.plan_cache_enabled = settings.stage_cache_enabled = False
+    try:
+        events = asyncio.run(collect())
+    finally:
+        settings.plan_cache_enabled, settings.stage_cache_enabled = original
+    names = [name for name, _ in events]
+    print(f"Events: {names}")
+
+    assert names[:4].count("stage") == 4
+    assert ("stage", {"stage": "planner", "status": "started"}) in events
+    assert names[4:7] == ["day", "day", "day"]
+    assert names[-1] == "plan"
+    assert events[-1][1]["overall_suggestions"] == "Bring an umbrella"
+    print("✅ Stage, day and plan events emitted in order")
+    return True
+
+
+def main():
+    """Main test function"""
+    results = []
+    for name, test in [
+        ("Parser Chunk Boundaries", test_parser_chunk_boundaries),
+        ("Parser Early Emission", test_parser_emits_before_completion),
+        ("astream_trip Events", test_astream_trip_events),
+    ]:
+        try:
+            results.append((name, test()))
+        except AssertionError as e:
+            print(f"❌ {name} failed: {e}")
+            results.append((name, False))
+
+    print("\n" + "=" * 60)
+    print("Test Results Summary")
+    print("=" * 60)
+    for name, result in results:
+        status = "✅ PASSED" if result else "❌ FAILED"
+        print(f"{name}: {status}")
+
+    return 0 if all(result for _, result in results) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,5 +1,5 @@
 import axios from 'axios'
-import type { TripFormData, TripPlanResponse } from '@/types'
+import type { TripFormData, TripPlan, TripPlanResponse, TripStreamHandlers } from '@/types'
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000'
 
@@ -58,6 +58,63 @@ export async function generateTripPlan(formData: TripFormData): Promise<TripPlan
   }
 }
 
+/**
+ * 流式生成旅行计划 (Server-Sent Events)
+ *
+ * 检索阶段完成、每一天的行程生成时立即回调，最终返回完整计划
+ */
+export async function streamTripPlan(
+  formData: TripFormData,
+  handlers: TripStreamHandlers = {}
+): Promise<TripPlan> {
+  const response = await fetch(`${API_BASE_URL}/api/trip/plan/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify(formData)
+  })
+  if (!response.ok || !response.body) {
+    throw new Error(`Failed to generate trip plan (HTTP ${response.status})`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let plan: TripPlan | null = null
+
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    // SSE事件以空行分隔
+    let separator = buffer.indexOf('\n\n')
+    while (separator !== -1) {
+      const rawEvent = buffer.slice(0, separator)
+      buffer = buffer.slice(separator + 2)
+      separator = buffer.indexOf('\n\n')
+
+      let event = 'message'
+      let data = ''
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data += line.slice(5).trim()
+      }
+      if (!data) continue
+
+      const payload = JSON.parse(data)
+      if (event === 'stage') handlers.onStage?.(payload)
+      else if (event === 'day') handlers.onDay?.(payload)
+      else if (event === 'error') handlers.onError?.(payload.message)
+      else if (event === 'plan') plan = payload
+    }
+  }
+
+  if (!plan) {
+    throw new Error('Trip plan stream ended without a plan')
+  }
+  return plan
+}
+
 /**
  * 健康检查
  */
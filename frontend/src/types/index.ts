@@ -93,3 +93,15 @@ export interface TripPlanResponse {
   data?: TripPlan
 }
 
+
+// 流式规划事件 (/api/trip/plan/stream)
+export interface TripStageEvent {
+  stage: 'attractions' | 'weather' | 'hotels' | 'planner'
+  status: 'completed' | 'started'
+}
+
+export interface TripStreamHandlers {
+  onStage?: (event: TripStageEvent) => void
+  onDay?: (day: DayPlan) => void
+  onError?: (message: string) => void
+}